@@ -1,120 +1,248 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from chat import SalesBotRAG
 import json
 import re
-import requests
-from datetime import datetime
+from lead_capture import LeadOutbox, LeadDispatcher, build_sheets_payload
+from session_store import create_session_store
+from metrics import Metrics
+from single_flight import SingleFlight, idempotency_key, replay_response, remember_response
 
 # Load environment variables
 load_dotenv()
 
+# Set by gunicorn.conf.py: the app is imported once in the gunicorn master and forked into workers,
+# so anything holding a socket, SQLite connection or thread is created per worker in init_worker()
+PRELOAD_APP = os.getenv('PRELOAD_APP', 'false').lower() == 'true'
+
 app = Flask(__name__)
 
 # Configure CORS to allow requests from anywhere (production and testing)
 CORS(app, 
      origins=['*'],  # Allow all origins
-     allow_headers=['Content-Type', 'Authorization', 'X-Session-Id', 'Accept'],
+     allow_headers=['Content-Type', 'Authorization', 'X-Session-Id', 'Accept', 'Idempotency-Key'],
      methods=['GET', 'POST', 'OPTIONS'],
      supports_credentials=True)
 
 # Initialize the chatbot
 chatbot = SalesBotRAG()
 
-# Session storage (in production, use Redis or database)
-sessions = {}
+# Duplicate /chat posts (double submits) in flight at the same time share one turn
+chat_flights = SingleFlight()
+
+session_store = None
+lead_outbox = None
+lead_dispatcher = None
+metrics = None
+
+def init_process_state():
+    """Per-process state: SQLite connections and background threads never survive a fork"""
+    global session_store, lead_outbox, lead_dispatcher, metrics
+    
+    # Session storage; the memory default is per-process, so multi-worker gunicorn.conf.py switches to sqlite (see session_store.py)
+    session_store = create_session_store()
+    
+    # Demo requests are queued on disk and delivered to Google Sheets in batches by a background thread
+    lead_outbox = LeadOutbox()
+    lead_dispatcher = LeadDispatcher(lead_outbox)
+    lead_dispatcher.start()
+    
+    # Prometheus metrics (stage latencies, OpenAI tokens and cost, caches, sessions)
+    metrics = Metrics(chatbot, session_store, lead_outbox)
+    
+    # info.txt edits are reindexed in the background and swapped in atomically
+    chatbot.start_knowledge_watcher()
 
-# Google Sheets integration - Updated with TOFU enhancement support
-GOOGLE_SCRIPT_URL = 'https://script.google.com/macros/s/AKfycbwtkTDW3CjoKgSJrDgj2dWn6oU-ZXYncoGuu6h7zeB5lT14xe_8Q-yjtlwYxHZ61H77/exec'
+def init_worker():
+    """gunicorn post_fork hook when the app is preloaded"""
+    chatbot.reinit_after_fork()
+    init_process_state()
+
+if not PRELOAD_APP:
+    init_process_state()
 
 def submit_to_google_sheets(name, email, phone, session_data=None):
-    """Submit demo request to Google Sheets with enhanced TOFU data"""
+    """Queue a demo request for Google Sheets with enhanced TOFU data; True once it is safely on disk"""
     try:
-        # Enhanced TOFU data capture
-        lead_score = session_data.get('lead_score', 0) if session_data else 0
-        stage = session_data.get('stage', 'unknown') if session_data else 'unknown'
-        signals = ', '.join(session_data.get('qualification_signals', [])) if session_data else ''
-        touch_count = session_data.get('touch_count', 0) if session_data else 0
-        
-        payload = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'name': name,
-            'email': email,
-            'phone': phone,
-            'source': 'Localhost Demo Form',
-            'lead_score': lead_score,
-            'stage': stage,
-            'qualification_signals': signals,
-            'touch_count': touch_count,
-            'conversation_length': len(session_data.get('conversation_history', [])) if session_data else 0
-        }
-        
-        response = requests.post(GOOGLE_SCRIPT_URL, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Google Sheets: {result.get('message', 'Success')}")
-            return True
-        else:
-            print(f"❌ Google Sheets error: {response.status_code}")
-            return False
+        payload = build_sheets_payload(name, email, phone, session_data)
+        lead_dispatcher.submit(payload)
+        return True
             
     except Exception as e:
-        print(f"❌ Google Sheets submission failed: {str(e)}")
+        print(f"❌ Could not queue lead for Google Sheets: {str(e)}")
         return False
 
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def replay_events(result):
+    """A stored /chat answer as the events of a stream"""
+    yield sse_event('token', {'text': result['message']})
+    yield sse_event('done', result)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: OpenAI client warm and knowledge base loaded"""
+    status = chatbot.readiness()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), content_type=metrics.content_type)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         data = request.json
         message = data.get('message', '')
         session_id = data.get('session_id', 'default')
+        key = idempotency_key(session_id, message, request.headers.get('Idempotency-Key'))
         
-        # Get or create session
-        if session_id not in sessions:
-            sessions[session_id] = {
-                'conversation_history': [],
-                'user_info': {},
-                'lead_score': 0,
-                'stage': 'greeting'
-            }
-        
-        session = sessions[session_id]
-        
-        # Add user message to history
-        session['conversation_history'].append({
-            'role': 'user',
-            'content': message
-        })
-        
-        # Get bot response
-        response = chatbot.get_response(message, session)
+        return jsonify(chat_flights.do((session_id, key), lambda: run_chat_turn(session_id, message, key)))
         
-        # Add bot response to history
-        session['conversation_history'].append({
-            'role': 'assistant',
-            'content': response['message']
-        })
-        
-        # Update session
-        sessions[session_id] = session
-        
-        return jsonify({
-            'message': response['message'],
-            'show_demo_form': response.get('show_demo_form', False),
-            'lead_score': session.get('lead_score', 0),
-            'stage': session.get('stage', 'greeting')
-        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def run_chat_turn(session_id, message, key):
+    """One /chat turn; a duplicate of the session's last request gets the stored answer instead"""
+    # Get or create session
+    session = session_store.get(session_id)
+    replay = replay_response(session, key)
+    if replay is not None:
+        return replay
+    
+    # Add user message to history
+    session['conversation_history'].append({
+        'role': 'user',
+        'content': message
+    })
+    
+    # Get bot response
+    response = chatbot.get_response(message, session)
+    
+    # Add bot response to history
+    session['conversation_history'].append({
+        'role': 'assistant',
+        'content': response['message']
+    })
+    
+    result = {
+        'message': response['message'],
+        'show_demo_form': response.get('show_demo_form', False),
+        'lead_score': session.get('lead_score', 0),
+        'stage': session.get('stage', 'greeting')
+    }
+    remember_response(session, key, result)
+    
+    # Update session
+    session_store.save(session_id, session)
+    return result
+
+@app.route('/chat/prefetch', methods=['POST'])
+def chat_prefetch():
+    """Warm retrieval for the message the visitor is still typing (sent debounced by the widget).
+    Nothing is added to the session; the /chat call that follows finds the chunks in the retrieval cache
+    """
+    try:
+        data = request.json or {}
+        return jsonify({'status': chatbot.prefetch(data.get('message', ''))})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat, but streams the reply as Server-Sent Events.
+    'token' events carry text as it is generated; a final 'done' event carries
+    show_demo_form, lead_score and stage. A duplicate post gets the answer as one token plus 'done'
+    """
+    try:
+        data = request.json
+        message = data.get('message', '')
+        session_id = data.get('session_id', 'default')
+        key = idempotency_key(session_id, message, request.headers.get('Idempotency-Key'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        flight_key = ('stream', session_id, key)
+        try:
+            leader, shared = chat_flights.join(flight_key)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        if not leader:
+            # Double submit while the first stream is still running: replay its answer once it is done
+            yield from replay_events(shared)
+            return
+        
+        result = None
+        error = None
+        try:
+            session = session_store.get(session_id)
+            replay = replay_response(session, key)
+            if replay is not None:
+                result = replay
+                yield from replay_events(replay)
+                return
+            
+            # Add user message to history
+            session['conversation_history'].append({
+                'role': 'user',
+                'content': message
+            })
+            
+            for event, payload in chatbot.stream_response(message, session):
+                if event == 'token':
+                    yield sse_event('token', {'text': payload})
+                    continue
+                
+                # Add bot response to history
+                session['conversation_history'].append({
+                    'role': 'assistant',
+                    'content': payload['message']
+                })
+                result = {
+                    'message': payload['message'],
+                    'show_demo_form': payload.get('show_demo_form', False),
+                    'lead_score': session.get('lead_score', 0),
+                    'stage': session.get('stage', 'greeting')
+                }
+                remember_response(session, key, result)
+                session_store.save(session_id, session)
+                
+                yield sse_event('done', result)
+        except Exception as e:
+            error = e
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            # Also runs when the client disconnects mid-stream; duplicates waiting on it then get an error
+            if result is None and error is None:
+                error = RuntimeError('The original request ended before its answer was ready')
+            chat_flights.finish(flight_key, result, error)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
 @app.route('/submit_info', methods=['POST'])
 def submit_info():
     """Handle info submission from inline forms (footer.php compatibility)"""
@@ -175,26 +303,28 @@ def submit_demo():
             })
         
         # Store lead information
-        if session_id in sessions:
-            sessions[session_id]['user_info'].update({
+        session_data = session_store.load(session_id)
+        if session_data is not None:
+            session_data['user_info'].update({
                 'name': name,
                 'email': email,
                 'phone': phone,
                 'demo_requested': True
             })
-            sessions[session_id]['lead_score'] += 30
-            sessions[session_id]['stage'] = 'demo_scheduled'
+            session_data['lead_score'] += 30
+            session_data['stage'] = 'demo_scheduled'
+            session_store.save(session_id, session_data)
         
         # Submit to Google Sheets with enhanced TOFU data
-        session_data = sessions.get(session_id, {})
+        session_data = session_data or {}
         sheets_success = submit_to_google_sheets(name, email, phone, session_data)
         
         # Log the demo request
         print(f"Demo request: {name} ({email}), Phone: {phone}")
         if sheets_success:
-            print("✅ Successfully saved to Google Sheets")
+            print("✅ Queued for Google Sheets")
         else:
-            print("⚠️ Google Sheets submission failed, but demo request recorded locally")
+            print("⚠️ Could not queue for Google Sheets, demo request only logged")
         
         return jsonify({
             'success': True,
@@ -0,0 +1,348 @@
+"""
+ASGI serving mode for the PALMS™ chatbot.
+Same routes as app.py, but embeddings, both LLM layers and Chroma queries are awaited, so one
+process can hold hundreds of concurrent conversations instead of one per worker thread.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+
+import os
+import json
+import asyncio
+import contextlib
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse, FileResponse, Response
+from starlette.routing import Route
+from async_chat import AsyncSalesBotRAG
+from lead_capture import LeadOutbox, LeadDispatcher, build_sheets_payload
+from session_store import create_session_store
+from metrics import Metrics
+from single_flight import AsyncSingleFlight, idempotency_key, replay_response, remember_response
+
+# Load environment variables
+load_dotenv()
+
+# Initialize the chatbot
+chatbot = AsyncSalesBotRAG()
+
+# Session storage, shared with app.py workers when SESSION_STORE is sqlite or redis
+session_store = create_session_store()
+
+# Demo requests are queued on disk and delivered to Google Sheets in batches by a background thread,
+# started in lifespan()
+lead_outbox = LeadOutbox()
+lead_dispatcher = LeadDispatcher(lead_outbox)
+
+# Duplicate /chat posts (double submits) in flight at the same time share one turn
+chat_flights = AsyncSingleFlight()
+
+# Prometheus metrics (stage latencies, OpenAI tokens and cost, caches, sessions)
+metrics = Metrics(chatbot, session_store, lead_outbox)
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def replay_events(result):
+    """A stored /chat answer as the events of a stream"""
+    yield sse_event('token', {'text': result['message']})
+    yield sse_event('done', result)
+
+
+async def submit_to_google_sheets(name, email, phone, session_data=None):
+    """Queue a demo request for Google Sheets with enhanced TOFU data; True once it is safely on disk"""
+    try:
+        payload = build_sheets_payload(name, email, phone, session_data)
+        await asyncio.to_thread(lead_dispatcher.submit, payload)
+        return True
+
+    except Exception as e:
+        print(f"❌ Could not queue lead for Google Sheets: {str(e)}")
+        return False
+
+
+async def index(request):
+    return FileResponse(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html'))
+
+
+async def healthz(request):
+    """Liveness: the process is up and serving requests"""
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    """Readiness: OpenAI client warm and knowledge base loaded"""
+    status = chatbot.readiness()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint"""
+    return Response(await asyncio.to_thread(metrics.render), media_type=metrics.content_type)
+
+
+async def chat(request):
+    try:
+        data = await request.json()
+        message = data.get('message', '')
+        session_id = data.get('session_id', 'default')
+        key = idempotency_key(session_id, message, request.headers.get('Idempotency-Key'))
+
+        return JSONResponse(await chat_flights.do((session_id, key), lambda: run_chat_turn(session_id, message, key)))
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def run_chat_turn(session_id, message, key):
+    """One /chat turn; a duplicate of the session's last request gets the stored answer instead"""
+    session = await asyncio.to_thread(session_store.get, session_id)
+    replay = replay_response(session, key)
+    if replay is not None:
+        return replay
+
+    # Add user message to history
+    session['conversation_history'].append({
+        'role': 'user',
+        'content': message
+    })
+
+    # Get bot response
+    response = await chatbot.aget_response(message, session)
+
+    # Add bot response to history
+    session['conversation_history'].append({
+        'role': 'assistant',
+        'content': response['message']
+    })
+
+    result = {
+        'message': response['message'],
+        'show_demo_form': response.get('show_demo_form', False),
+        'lead_score': session.get('lead_score', 0),
+        'stage': session.get('stage', 'greeting')
+    }
+    remember_response(session, key, result)
+    await asyncio.to_thread(session_store.save, session_id, session)
+    return result
+
+
+async def chat_prefetch(request):
+    """Warm retrieval for the message the visitor is still typing; see app.py"""
+    try:
+        data = await request.json()
+        return JSONResponse({'status': await chatbot.aprefetch(data.get('message', ''))})
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def chat_stream(request):
+    """Same as /chat, streamed as Server-Sent Events ('token' events, then one 'done' event).
+    A duplicate post gets the answer as one token plus 'done'
+    """
+    try:
+        data = await request.json()
+        message = data.get('message', '')
+        session_id = data.get('session_id', 'default')
+        key = idempotency_key(session_id, message, request.headers.get('Idempotency-Key'))
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def generate():
+        flight_key = ('stream', session_id, key)
+        try:
+            leader, shared = await chat_flights.join(flight_key)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        if not leader:
+            # Double submit while the first stream is still running: replay its answer once it is done
+            for event in replay_events(shared):
+                yield event
+            return
+
+        result = None
+        error = None
+        try:
+            session = await asyncio.to_thread(session_store.get, session_id)
+            replay = replay_response(session, key)
+            if replay is not None:
+                result = replay
+                for event in replay_events(replay):
+                    yield event
+                return
+
+            # Add user message to history
+            session['conversation_history'].append({
+                'role': 'user',
+                'content': message
+            })
+
+            async for event, payload in chatbot.astream_response(message, session):
+                if event == 'token':
+                    yield sse_event('token', {'text': payload})
+                    continue
+
+                # Add bot response to history
+                session['conversation_history'].append({
+                    'role': 'assistant',
+                    'content': payload['message']
+                })
+                result = {
+                    'message': payload['message'],
+                    'show_demo_form': payload.get('show_demo_form', False),
+                    'lead_score': session.get('lead_score', 0),
+                    'stage': session.get('stage', 'greeting')
+                }
+                remember_response(session, key, result)
+                await asyncio.to_thread(session_store.save, session_id, session)
+
+                yield sse_event('done', result)
+        except Exception as e:
+            error = e
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            # Also runs when the client disconnects mid-stream; duplicates waiting on it then get an error
+            if result is None and error is None:
+                error = RuntimeError('The original request ended before its answer was ready')
+            chat_flights.finish(flight_key, result, error)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+async def submit_info(request):
+    """Handle info submission from inline forms (footer.php compatibility)"""
+    try:
+        data = await request.json()
+        name = data.get('name', '')
+        email = data.get('email', '')
+
+        # Validate business email
+        if not chatbot.validate_business_email(email):
+            return JSONResponse({
+                'success': False,
+                'message': "Please provide a business email address. Personal email domains like Gmail, Yahoo, and Hotmail are not accepted.",
+                'show_form_again': True
+            })
+
+        # Basic validation
+        if not name or not email:
+            return JSONResponse({
+                'success': False,
+                'message': "Please provide both name and email address.",
+                'show_form_again': True
+            })
+
+        print(f"Info submitted: {name} ({email})")
+
+        return JSONResponse({
+            'success': True,
+            'message': f"Thank you {name}! Your information has been recorded. How can I assist you further?"
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'message': f"An error occurred: {str(e)}",
+            'show_form_again': False
+        }, status_code=500)
+
+
+async def submit_demo(request):
+    try:
+        data = await request.json()
+        session_id = data.get('session_id', 'default')
+        name = data.get('name', '')
+        email = data.get('email', '')
+        phone = data.get('phone', '')
+
+        # Validate business email
+        if not chatbot.validate_business_email(email):
+            return JSONResponse({
+                'success': False,
+                'message': "Please provide a business email address. Personal email domains like Gmail, Yahoo, and Hotmail are not accepted for demo requests."
+            })
+
+        # Store lead information
+        session_data = await asyncio.to_thread(session_store.load, session_id)
+        if session_data is not None:
+            session_data['user_info'].update({
+                'name': name,
+                'email': email,
+                'phone': phone,
+                'demo_requested': True
+            })
+            session_data['lead_score'] += 30
+            session_data['stage'] = 'demo_scheduled'
+            await asyncio.to_thread(session_store.save, session_id, session_data)
+
+        # Submit to Google Sheets with enhanced TOFU data
+        sheets_success = await submit_to_google_sheets(name, email, phone, session_data or {})
+
+        print(f"Demo request: {name} ({email}), Phone: {phone}")
+
+        return JSONResponse({
+            'success': True,
+            'message': f"Thank you {name}! Your demo request has been submitted. Our sales team will contact you at {email} within 24 hours to schedule your personalized PALMS™ demonstration.",
+            'sheets_saved': sheets_success
+        })
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    lead_dispatcher.start()
+    # info.txt edits are reindexed on a background thread and swapped in atomically
+    watcher = chatbot.start_knowledge_watcher()
+    warm_up = asyncio.create_task(chatbot.awarm_up_connections())
+    try:
+        yield
+    finally:
+        warm_up.cancel()
+        if watcher:
+            await asyncio.to_thread(watcher.stop)
+        await asyncio.to_thread(lead_dispatcher.stop)
+        if chatbot.async_client:
+            await chatbot.async_client.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/metrics', metrics_endpoint),
+        Route('/chat', chat, methods=['POST']),
+        Route('/chat/prefetch', chat_prefetch, methods=['POST']),
+        Route('/chat/stream', chat_stream, methods=['POST']),
+        Route('/submit_info', submit_info, methods=['POST']),
+        Route('/submit_demo', submit_demo, methods=['POST']),
+    ],
+    middleware=[
+        # Configure CORS to allow requests from anywhere (production and testing)
+        Middleware(
+            CORSMiddleware,
+            allow_origins=['*'],
+            allow_headers=['Content-Type', 'Authorization', 'X-Session-Id', 'Accept', 'Idempotency-Key'],
+            allow_methods=['GET', 'POST', 'OPTIONS'],
+            allow_credentials=True
+        )
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,311 @@
+"""
+Async variant of SalesBotRAG for the ASGI serving mode (asgi.py).
+Embeddings and both LLM layers go through AsyncOpenAI; Chroma, SQLite and the wait for warm-up
+are sync-only, so they run in a worker thread instead of blocking the event loop
+"""
+
+import os
+import asyncio
+from chat import SalesBotRAG
+from ingestion import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+from embedding_cache import normalize_query
+from pipeline_router import ROUTE_CANNED, ROUTE_SINGLE_CALL
+from metrics import timed, record_usage
+from prompt_layout import cache_options
+from single_flight import AsyncSingleFlight
+
+
+class AsyncSalesBotRAG(SalesBotRAG):
+    """SalesBotRAG whose network I/O is awaited"""
+
+    def __init__(self, *args, **kwargs):
+        self.async_client = None
+        self.async_flights = AsyncSingleFlight()
+        super().__init__(*args, **kwargs)
+
+    def init_clients(self):
+        super().init_clients()
+        if self.client:
+            try:
+                from openai import AsyncOpenAI
+                self.async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                print("✅ AsyncOpenAI client initialized successfully")
+            except Exception as e:
+                print(f"❌ AsyncOpenAI initialization failed: {e}")
+
+    async def awarm_up_connections(self):
+        """Open the AsyncOpenAI connection pool on the serving event loop once warm-up is done"""
+        await asyncio.to_thread(self.warmup_done.wait)
+        if not self.async_client:
+            return
+        try:
+            await self.async_client.models.list()
+            print("✅ AsyncOpenAI connection warmed up")
+        except Exception as e:
+            print(f"⚠️ AsyncOpenAI warm-up request failed: {e}")
+
+    @timed('embedding')
+    async def acreate_embedding(self, text):
+        """Embed text with AsyncOpenAI, going through the persistent embedding cache"""
+        if self.embedding_cache:
+            cached = await asyncio.to_thread(self.embedding_cache.get, text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+            if cached is not None:
+                return cached
+
+        params = {'dimensions': EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
+        response = await self.async_client.embeddings.create(
+            input=text,
+            model=EMBEDDING_MODEL,
+            **params
+        )
+        record_usage(EMBEDDING_MODEL, getattr(response, 'usage', None))
+        embedding = response.data[0].embedding
+        if self.embedding_cache:
+            await asyncio.to_thread(self.embedding_cache.put, text, embedding, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+        return embedding
+
+    async def aget_query_embedding(self, query):
+        """Async get_query_embedding"""
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+        if not self.async_client:
+            return self.fallback_embedding(query)
+
+        try:
+            embedding = await self.async_flights.do(('embedding', key), lambda: self.acreate_embedding(query))
+        except Exception as e:
+            # Don't cache fallbacks; the next identical query should retry OpenAI
+            print(f"Error generating embedding: {e}")
+            return self.fallback_embedding(query)
+
+        self.query_embedding_cache.put(key, embedding)
+        return embedding
+
+    @timed('retrieval')
+    async def aretrieve_relevant_chunks(self, query, n_results=10):
+        """Async retrieve_relevant_chunks"""
+        try:
+            knowledge = self.knowledge
+            key = self.retrieval_cache_key(knowledge, query, n_results)
+            cached = self.retrieval_cache.get(key)
+            if cached is not None:
+                print(f"Retrieval cache hit for query: {query[:50]}...")
+                return cached
+
+            return await self.async_flights.do(key, lambda: self.asearch_knowledge(knowledge, key, query, n_results))
+
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            return [], [], False
+
+    async def asearch_knowledge(self, knowledge, key, query, n_results):
+        """Async search_knowledge, cached under key"""
+        if await asyncio.to_thread(knowledge.collection.count) == 0:
+            print("Knowledge base is empty")
+            return [], [], False
+
+        where = self.get_retrieval_filter(query)
+        lexical_hits, confident = self.lexical_search(query, n_results, where, knowledge)
+        if confident:
+            print(f"Lexical-only retrieval for query: {query[:50]}...")
+            return self.cache_retrieval(
+                key, ([document for _, document, _ in lexical_hits], [None] * len(lexical_hits), True))
+
+        query_embedding = await self.aget_query_embedding(query)
+        results = await asyncio.to_thread(
+            knowledge.collection.query,
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where
+        )
+        return self.cache_retrieval(key, self.fuse_results(knowledge.visible(results), lexical_hits, n_results))
+
+    async def aprefetch(self, draft):
+        """Async prefetch"""
+        draft = str(draft or '').strip()
+        if not self.should_prefetch(draft):
+            return 'skipped'
+        if self.retrieval_cache.peek(self.retrieval_cache_key(self.knowledge, draft, 10)) is not None:
+            return 'cached'
+        # Shielded: the visitor sending the message may end this request, but not the lookup /chat will join
+        await asyncio.shield(self.aretrieve_relevant_chunks(draft))
+        return 'warmed'
+
+    @timed('information_layer')
+    async def aget_information_layer_response(self, message, relevant_context, max_tokens=2000, kb_version=None):
+        """Async Layer 1"""
+        if not self.async_client:
+            return self.get_demo_information(message, relevant_context)
+
+        if kb_version is None:
+            kb_version = self.kb_version
+        query_embedding, cached = self.get_cached_extraction(message, kb_version, max_tokens)
+        if cached is not None:
+            return cached
+
+        async def extract():
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.build_information_messages(message, relevant_context),
+                max_tokens=max_tokens,
+                temperature=0.2,
+                **cache_options('information')
+            )
+            record_usage("gpt-4o-mini", getattr(response, 'usage', None))
+
+            extracted_info = response.choices[0].message.content.strip()
+            if query_embedding is not None:
+                self.extraction_cache.put(query_embedding, kb_version, extracted_info, max_tokens)
+            return extracted_info
+
+        try:
+            return await self.async_flights.do(
+                self.information_flight_key(message, relevant_context, max_tokens, kb_version), extract)
+
+        except Exception as e:
+            print(f"Error in information layer: {e}")
+            return relevant_context[:500]
+
+    @timed('sales_layer')
+    async def aget_sales_layer_response(self, message, extracted_info, session, max_tokens=1500):
+        """Async Layer 2"""
+        lead_score = session.get('lead_score', 0)
+        stage = session.get('stage', 'greeting')
+
+        if not self.async_client:
+            return self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.build_sales_messages(message, extracted_info, session),
+                max_tokens=max_tokens,
+                temperature=0.7,
+                **cache_options('sales')
+            )
+            record_usage("gpt-4o-mini", getattr(response, 'usage', None))
+            return response.choices[0].message.content.strip()
+
+        except Exception as e:
+            print(f"Error in sales layer: {e}")
+            return self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+
+    @timed('sales_layer')
+    async def astream_sales_layer_response(self, message, extracted_info, session, max_tokens=1500):
+        """Async Layer 2 with stream=True: yields text deltas"""
+        lead_score = session.get('lead_score', 0)
+        stage = session.get('stage', 'greeting')
+
+        if not self.async_client:
+            yield self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+            return
+
+        started = False
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.build_sales_messages(message, extracted_info, session),
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True,
+                **cache_options('sales'),
+                stream_options={"include_usage": True}
+            )
+
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    record_usage("gpt-4o-mini", chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not started:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    started = True
+                yield delta
+
+        except Exception as e:
+            print(f"Error in streaming sales layer: {e}")
+            if not started:
+                yield self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+
+    async def aplan_turn(self, message, session, engagement_strategy):
+        """Async plan_turn"""
+        tofu_response = self.get_tofu_override(message, session, engagement_strategy)
+        decision = self.router.route(message, session, tofu_response)
+        extracted_info = ""
+
+        if decision.needs_retrieval:
+            kb_version = self.kb_version
+            documents, distances, lexical_only = await self.aretrieve_relevant_chunks(message)
+            decision = self.router.route_with_context(message, decision, distances, lexical_only)
+
+            if decision.path == ROUTE_SINGLE_CALL:
+                extracted_info, _ = self.context_packer.pack(
+                    documents, distances, decision.context_max_tokens, self.router.direct_chunks, '\n\n')
+            else:
+                relevant_context, _ = self.context_packer.pack(documents, distances, decision.context_max_tokens)
+                extracted_info = await self.aget_information_layer_response(
+                    message, relevant_context, max_tokens=decision.info_max_tokens, kb_version=kb_version)
+
+        self.router.record(decision)
+        return decision, extracted_info
+
+    async def aget_response(self, message, session):
+        """Async get_response"""
+        # prepare_turn blocks on a threading.Event until warm-up finishes (up to WARMUP_WAIT_TIMEOUT seconds)
+        # on a cold process, so keep it off the event loop
+        early_response, engagement_strategy = await asyncio.to_thread(self.prepare_turn, message, session)
+        if early_response:
+            return early_response
+
+        try:
+            decision, extracted_info = await self.aplan_turn(message, session, engagement_strategy)
+
+            if decision.path == ROUTE_CANNED:
+                bot_message = decision.canned_message
+            else:
+                bot_message = await self.aget_sales_layer_response(
+                    message, extracted_info, session, max_tokens=decision.sales_max_tokens)
+
+            return self.finalize_response(message, session, bot_message, engagement_strategy)
+
+        except Exception as e:
+            print(f"Error in get_response: {e}")
+            return self.get_error_response()
+
+    async def astream_response(self, message, session):
+        """Async stream_response: yields ('token', text) events, then ('done', response)"""
+        early_response, engagement_strategy = await asyncio.to_thread(self.prepare_turn, message, session)
+        if early_response:
+            yield 'token', early_response['message']
+            yield 'done', early_response
+            return
+
+        parts = []
+        try:
+            decision, extracted_info = await self.aplan_turn(message, session, engagement_strategy)
+            if decision.path == ROUTE_CANNED:
+                parts.append(decision.canned_message)
+                yield 'token', decision.canned_message
+            else:
+                async for token in self.astream_sales_layer_response(
+                        message, extracted_info, session, max_tokens=decision.sales_max_tokens):
+                    parts.append(token)
+                    yield 'token', token
+
+            yield 'done', self.finalize_response(message, session, ''.join(parts).strip(), engagement_strategy)
+
+        except Exception as e:
+            print(f"Error in stream_response: {e}")
+            if parts:
+                yield 'done', self.finalize_response(message, session, ''.join(parts).strip(), engagement_strategy)
+            else:
+                response = self.get_error_response()
+                yield 'token', response['message']
+                yield 'done', response
@@ -0,0 +1,209 @@
+"""
+Local OpenAI-compatible stub for load tests: /v1/chat/completions (blocking and SSE streaming),
+/v1/embeddings and /v1/models, with configurable latency and token rates, so the app can be
+benchmarked without API quota. Point the app at it with OPENAI_BASE_URL (read by the openai SDK).
+
+Replies cost time like the real API: time-to-first-token, then completion tokens at a fixed rate.
+Usage is reported with prompt, completion and cached tokens; a prompt counts as cached for the
+longest prefix (1024 tokens, then 128-token steps) already seen, like OpenAI prompt caching.
+Embeddings are deterministic word-hash vectors, so retrieval still behaves sensibly.
+
+Run standalone:
+    python benchmarks/fake_openai.py --port 8101 --ttft 0.3 --tokens-per-second 80
+    OPENAI_BASE_URL=http://127.0.0.1:8101/v1 OPENAI_API_KEY=sk-bench-... python app.py
+"""
+
+import re
+import sys
+import json
+import time
+import base64
+import struct
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+REPLY_WORDS = ("PALMS™ helps warehouses cut picking errors and speed up fulfilment with real-time inventory, "
+               "mobile scanning and ERP integration. Would you like to see how it fits your operation?").split()
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def word_hash_vector(text, dimensions):
+    """Unit-length bag-of-words vector; shared words give similar vectors"""
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+class PromptCache:
+    """Prefix hashes of the prompts seen so far, at the granularity OpenAI caches them"""
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, prompt):
+        tokens = estimate_tokens(prompt)
+        if tokens < CACHE_MIN_TOKENS:
+            return 0
+        boundaries = range(CACHE_MIN_TOKENS, tokens + 1, CACHE_STEP_TOKENS)
+        hashes = [hashlib.sha1(prompt[:boundary * CHARS_PER_TOKEN].encode('utf-8')).hexdigest()
+                  for boundary in boundaries]
+        with self._lock:
+            cached = 0
+            for boundary, prefix_hash in zip(boundaries, hashes):
+                if prefix_hash not in self._prefixes:
+                    break
+                cached = boundary
+            self._prefixes.update(hashes)
+        return cached
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self.send_json({'object': 'list', 'data': [
+                {'id': model, 'object': 'model', 'created': 0, 'owned_by': 'bench'}
+                for model in ('gpt-4o-mini', 'text-embedding-3-small')
+            ]})
+        else:
+            self.send_json({'error': {'message': f'Unknown path {self.path}'}}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.stats['requests'] += 1
+        if self.path.endswith('/chat/completions'):
+            self.chat_completions(body)
+        elif self.path.endswith('/embeddings'):
+            self.embeddings(body)
+        else:
+            self.send_json({'error': {'message': f'Unknown path {self.path}'}}, 404)
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def embeddings(self, body):
+        inputs = body.get('input', [])
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        dimensions = body.get('dimensions') or self.server.options.embedding_dimensions
+        time.sleep(self.server.options.embedding_latency)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = word_hash_vector(str(text), dimensions)
+            if body.get('encoding_format') == 'base64':
+                vector = base64.b64encode(struct.pack(f'<{dimensions}f', *vector)).decode('ascii')
+            data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        self.send_json({'object': 'list', 'data': data, 'model': body.get('model'),
+                        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+    def chat_completions(self, body):
+        options = self.server.options
+        prompt = ''.join(str(message.get('content', '')) for message in body.get('messages', []))
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = self.server.prompt_cache.cached_tokens(prompt)
+        completion_tokens = max(1, min(body.get('max_tokens') or options.completion_tokens, options.completion_tokens))
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(completion_tokens)]
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        }
+        base = {'id': f"chatcmpl-bench-{time.time_ns()}", 'created': int(time.time()), 'model': body.get('model')}
+        token_delay = 1.0 / options.tokens_per_second if options.tokens_per_second > 0 else 0.0
+
+        time.sleep(options.ttft)
+        if not body.get('stream'):
+            time.sleep(token_delay * completion_tokens)
+            self.send_json(dict(base, object='chat.completion', usage=usage, choices=[{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': ' '.join(words)}
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices, **extra):
+            chunk = dict(base, object='chat.completion.chunk', choices=choices, **extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        for index, word in enumerate(words):
+            event([{'index': 0, 'delta': {'content': (' ' if index else '') + word}, 'finish_reason': None}])
+            time.sleep(token_delay)
+        event([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        if (body.get('stream_options') or {}).get('include_usage'):
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def create_server(port=8101, host='127.0.0.1', ttft=0.3, tokens_per_second=80.0, completion_tokens=120,
+                  embedding_latency=0.05, embedding_dimensions=1536):
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.options = argparse.Namespace(ttft=ttft, tokens_per_second=tokens_per_second,
+                                        completion_tokens=completion_tokens,
+                                        embedding_latency=embedding_latency,
+                                        embedding_dimensions=embedding_dimensions)
+    server.prompt_cache = PromptCache()
+    server.stats = {'requests': 0}
+    return server
+
+
+def start_in_background(**kwargs):
+    server = create_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8101)
+    parser.add_argument('--ttft', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--completion-tokens', type=int, default=120, help='reply length cap')
+    parser.add_argument('--embedding-latency', type=float, default=0.05)
+    parser.add_argument('--embedding-dimensions', type=int, default=1536)
+    args = parser.parse_args(argv)
+
+    server = create_server(args.port, args.host, args.ttft, args.tokens_per_second, args.completion_tokens,
+                           args.embedding_latency, args.embedding_dimensions)
+    print(f"🤖 Fake OpenAI listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Local stand-in for the Google Apps Script endpoint (google-apps-script.js doPost) for load tests.
+Accepts a JSON array of leads or a single lead and answers {"success": true, "count": n} after a
+configurable delay, optionally failing a share of requests to exercise the outbox retries.
+Point the app at it with GOOGLE_SCRIPT_URL.
+
+Run standalone:
+    python benchmarks/fake_sheets.py --port 8102 --latency 1.5
+    GOOGLE_SCRIPT_URL=http://127.0.0.1:8102/exec python app.py
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeAppsScript/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_json({'message': 'Fake PALMS Apps Script is running', 'rows': len(self.server.rows)})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length) or b'{}')
+        leads = data if isinstance(data, list) else [data]
+        time.sleep(self.server.latency)
+
+        with self.server.lock:
+            self.server.requests += 1
+            if random.random() < self.server.failure_rate:
+                failed = True
+            else:
+                failed = False
+                self.server.rows.extend(leads)
+        if failed:
+            self.send_json({'success': False, 'message': 'Error: simulated failure'})
+        else:
+            self.send_json({'success': True, 'count': len(leads),
+                            'message': f"{len(leads)} row(s) successfully added to Google Sheet"})
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def create_server(port=8102, host='127.0.0.1', latency=1.0, failure_rate=0.0):
+    server = ThreadingHTTPServer((host, port), FakeSheetsHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.lock = threading.Lock()
+    server.rows = []
+    server.requests = 0
+    return server
+
+
+def start_in_background(**kwargs):
+    server = create_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-sheets', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8102)
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds per doPost (Apps Script is slow)')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = create_server(args.port, args.host, args.latency, args.failure_rate)
+    print(f"📊 Fake Apps Script listening on http://{args.host}:{args.port}/exec")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Micro-benchmark: per-turn keyword analysis, one `any(phrase in message_lower ...)` loop per rule table
+(how chat.py used to do it) versus a single compiled scan (keyword_matcher.MATCHER).
+
+Run from the repository root:
+    python benchmarks/keyword_matcher_bench.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import MATCHER, RULES
+
+MESSAGES = [
+    "Hi",
+    "What does PALMS cost for a 3PL warehouse with 40 employees?",
+    "We are evaluating WMS options and need a demo asap, our company is in retail",
+    "Tell me more about mobile scanning and ERP integration with SAP please. How does it compare to "
+    "other systems, and what is the implementation timeline for a mid-sized distribution business "
+    "with three facilities and roughly 120 staff?",
+]
+
+
+def legacy_scan(message):
+    """One substring loop per rule table"""
+    message_lower = message.lower()
+    return {name: any(phrase in message_lower for phrase in phrases) for name, phrases in RULES.items()}
+
+
+def compiled_scan(message):
+    hits = MATCHER.scan(message)
+    return {name: hits.any(name) for name in RULES}
+
+
+def main(number=20000):
+    print(f"{len(RULES)} rule tables, {len(MATCHER.phrase_rules)} distinct phrases\n")
+    print(f"{'chars':>6} {'legacy (us)':>12} {'compiled (us)':>14} {'speedup':>8}")
+    for message in MESSAGES:
+        legacy = timeit.timeit(lambda: legacy_scan(message), number=number) / number * 1e6
+        compiled = timeit.timeit(lambda: compiled_scan(message), number=number) / number * 1e6
+        print(f"{len(message):>6} {legacy:>12.1f} {compiled:>14.1f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
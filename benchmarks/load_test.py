@@ -0,0 +1,281 @@
+"""
+HTTP load test for the chatbot server against local fakes of OpenAI and Google Apps Script.
+
+For every worker class and worker count it starts the server (gunicorn sync / gthread for app.py,
+'preload' for app.py under gunicorn.conf.py, uvicorn for asgi.py) in a scratch directory, points it at benchmarks/fake_openai.py and
+benchmarks/fake_sheets.py, replays multi-turn visitor conversations from --concurrency clients for
+--duration seconds and reports requests/s and p50/p95/p99 latency per endpoint.
+Nothing leaves the machine and no API quota is used.
+
+Run from the repository root:
+    python benchmarks/load_test.py --worker-classes sync,gthread,preload,uvicorn --workers 1,2,4 --concurrency 16
+    python benchmarks/load_test.py --target http://127.0.0.1:5000   # an already running server
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai
+import fake_sheets
+
+# Each conversation is played turn by turn with one session id; some end with a demo request
+CONVERSATIONS = [
+    ["Hi", "What is PALMS?", "Does it support RFID?", "How much does it cost?", "ok thanks"],
+    ["We run a 3PL with 4 warehouses and about 200 staff",
+     "How does PALMS handle multi-client billing?",
+     "Can it integrate with SAP?",
+     "What is the implementation timeline?",
+     "I'd like to book a demo"],
+    ["Tell me about mobile scanning", "Which handheld devices work with it?", "tell me more", "yes"],
+    ["Give me a detailed list of all features", "How is it different from other WMS vendors?",
+     "What results have retail customers seen?"],
+    ["hello", "Our picking error rate is too high, can PALMS help?", "What about cycle counting?",
+     "We are evaluating options this quarter", "Can someone call me?"],
+]
+DEMO_CONVERSATIONS = {1, 4}
+
+WORKER_COMMANDS = {
+    'sync': ['gunicorn', '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--worker-class', 'sync',
+             '--timeout', '120', 'app:app'],
+    'gthread': ['gunicorn', '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--worker-class', 'gthread',
+                '--threads', '8', '--timeout', '120', 'app:app'],
+    # The production configuration: gthread, preloaded master, per-worker clients
+    'preload': ['gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'), '--bind', '127.0.0.1:{port}',
+                '--workers', '{workers}', '--access-logfile', '/dev/null', 'app:app'],
+    'uvicorn': ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}',
+                '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    """--concurrency visitors replaying CONVERSATIONS until the deadline"""
+
+    def __init__(self, base_url, concurrency, duration, think_time=0.0):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.think_time = think_time
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        deadline = time.time() + self.duration
+        threads = [threading.Thread(target=self.visitor, args=(index, deadline), daemon=True)
+                   for index in range(self.concurrency)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.time() - started)
+
+    def visitor(self, index, deadline):
+        http = requests.Session()
+        rng = random.Random(index)
+        conversation_number = 0
+        while time.time() < deadline:
+            choice = rng.randrange(len(CONVERSATIONS))
+            session_id = f"bench-{index}-{conversation_number}-{time.time_ns()}"
+            conversation_number += 1
+            for message in CONVERSATIONS[choice]:
+                if time.time() >= deadline:
+                    return
+                self.request(http, '/chat', {'message': message, 'session_id': session_id})
+                if self.think_time:
+                    time.sleep(rng.uniform(0, self.think_time))
+            if choice in DEMO_CONVERSATIONS and time.time() < deadline:
+                self.request(http, '/submit_demo', {
+                    'name': f"Bench Visitor {index}", 'email': f"visitor{index}@onpalms.com",
+                    'phone': '+1 555 0100', 'session_id': session_id
+                })
+
+    def request(self, http, path, payload):
+        started = time.perf_counter()
+        try:
+            response = http.post(self.base_url + path, json=payload, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if ok:
+                self.samples.setdefault(path, []).append(elapsed)
+            else:
+                self.errors[path] = self.errors.get(path, 0) + 1
+
+    def report(self, elapsed):
+        rows = []
+        for path in sorted(set(self.samples) | set(self.errors)):
+            latencies = sorted(self.samples.get(path, []))
+            rows.append({
+                'endpoint': path,
+                'requests': len(latencies),
+                'errors': self.errors.get(path, 0),
+                'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            })
+        return rows
+
+
+class ServerUnderTest:
+    """app.py / asgi.py in a scratch directory, wired to the fakes"""
+
+    def __init__(self, worker_class, workers, workdir, env):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        command = [part.format(port=self.port, workers=workers) for part in WORKER_COMMANDS[worker_class]]
+        self.log = open(os.path.join(workdir, f"server-{worker_class}-{workers}.log"), 'w')
+        self.process = subprocess.Popen(command, cwd=workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_until_ready(self, timeout=180):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}, see {self.log.name}")
+            try:
+                if requests.get(self.url + '/readyz', timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"Server not ready after {timeout}s, see {self.log.name}")
+
+    def memory_mb(self):
+        """Proportional set size of the server and its workers (Linux), so copy-on-write pages are counted once"""
+        total_kb = 0
+        pending = [self.process.pid]
+        try:
+            while pending:
+                pid = pending.pop()
+                with open(f"/proc/{pid}/smaps_rollup") as file:
+                    total_kb += sum(int(line.split()[1]) for line in file if line.startswith('Pss:'))
+                with open(f"/proc/{pid}/task/{pid}/children") as file:
+                    pending.extend(int(child) for child in file.read().split())
+        except (OSError, ValueError):
+            return None
+        return round(total_kb / 1024, 1)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def prepare_workdir(env):
+    """Scratch directory with info.txt and a knowledge base embedded by the fake (never the real chroma_db)"""
+    workdir = tempfile.mkdtemp(prefix='palms-bench-')
+    shutil.copy(os.path.join(REPO_ROOT, 'info.txt'), workdir)
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'refresh_database.py')], cwd=workdir, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    return workdir
+
+
+def print_table(results):
+    header = f"{'class':<8} {'workers':>7} {'endpoint':<13} {'reqs':>6} {'errs':>5} {'req/s':>7} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ready s':>8} {'PSS MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        for row in result['rows']:
+            print(f"{result['worker_class']:<8} {result['workers']:>7} {row['endpoint']:<13} {row['requests']:>6} "
+                  f"{row['errors']:>5} {row['rps']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+                  f"{str(result.get('ready_seconds', '-')):>8} {str(result.get('memory_mb', '-')):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--worker-classes', default='sync,gthread,uvicorn')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load per configuration')
+    parser.add_argument('--think-time', type=float, default=0.0, help='max random pause between turns')
+    parser.add_argument('--target', help='benchmark this running server instead of starting one')
+    parser.add_argument('--ttft', type=float, default=0.3)
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--completion-tokens', type=int, default=120)
+    parser.add_argument('--embedding-latency', type=float, default=0.05)
+    parser.add_argument('--sheets-latency', type=float, default=1.0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.target:
+        rows = LoadGenerator(args.target, args.concurrency, args.duration, args.think_time).run()
+        results.append({'worker_class': 'target', 'workers': '-', 'rows': rows})
+    else:
+        openai_server = fake_openai.start_in_background(
+            port=free_port(), ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+            completion_tokens=args.completion_tokens, embedding_latency=args.embedding_latency)
+        sheets_server = fake_sheets.start_in_background(port=free_port(), latency=args.sheets_latency)
+        env = dict(os.environ,
+                   PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''),
+                   OPENAI_API_KEY='sk-bench-00000000000000000000000000000000',
+                   OPENAI_BASE_URL=f"http://127.0.0.1:{openai_server.server_address[1]}/v1",
+                   GOOGLE_SCRIPT_URL=f"http://127.0.0.1:{sheets_server.server_address[1]}/exec",
+                   SESSION_STORE='sqlite')
+        workdir = prepare_workdir(env)
+        print(f"🧪 Scratch directory: {workdir}")
+
+        for worker_class in args.worker_classes.split(','):
+            for workers in [int(count) for count in args.workers.split(',')]:
+                print(f"▶️  {worker_class} x {workers}: {args.concurrency} clients for {args.duration:.0f}s")
+                server = ServerUnderTest(worker_class, workers, workdir, env)
+                try:
+                    started = time.time()
+                    server.wait_until_ready()
+                    ready_seconds = round(time.time() - started, 1)
+                    rows = LoadGenerator(server.url, args.concurrency, args.duration, args.think_time).run()
+                    memory_mb = server.memory_mb()
+                except Exception as e:
+                    print(f"❌ {worker_class} x {workers} failed: {e}")
+                    rows, ready_seconds, memory_mb = [], None, None
+                finally:
+                    server.stop()
+                print(f"   ready in {ready_seconds}s, {memory_mb} MB PSS after load")
+                results.append({'worker_class': worker_class, 'workers': workers, 'rows': rows,
+                                'ready_seconds': ready_seconds, 'memory_mb': memory_mb})
+        print(f"📨 Fake OpenAI served {openai_server.stats['requests']} requests; "
+              f"fake Sheets received {len(sheets_server.rows)} leads in {sheets_server.requests} batches")
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'settings': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
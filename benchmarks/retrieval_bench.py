@@ -0,0 +1,283 @@
+"""
+Offline retrieval benchmark: labelled visitor questions against info.txt, across chunk sizes, overlaps,
+k (n_results) and retrieval backends.
+
+For every combination it reports recall@k (a chunk of an expected section is in the top k), MRR@k,
+context tokens (all k chunks, and after ContextPacker) and per-query lookup latency. The query embedding
+is computed once up front and not timed, since in production it is a network call (see /metrics).
+Backends:
+    numpy   VectorIndex (RETRIEVAL_BACKEND=numpy)
+    chroma  Chroma in memory (RETRIEVAL_BACKEND=chroma), skipped if chromadb is missing
+    bm25    lexical_index.BM25Index alone
+    hybrid  numpy + BM25 fused with RRF, short rare-term queries BM25-only, as chat.py does
+
+Embeddings come from the same deterministic word-hash stand-in as benchmarks/fake_openai.py, so it runs
+offline and the numbers are reproducible. That stand-in is lexical, not semantic: compare configurations
+with it, and confirm a chosen one with --embeddings openai (text-embedding-3-small through the embedding
+cache, needs OPENAI_API_KEY) before changing the defaults.
+
+Run from the repository root:
+    python benchmarks/retrieval_bench.py
+    python benchmarks/retrieval_bench.py --chunk-sizes 60,2000 --overlaps 0 --k 3,5 --backends numpy,hybrid --json out.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingestion import build_chunk_records
+from vector_index import VectorIndex
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from context_packer import ContextPacker
+from conversation_window import count_tokens
+from fake_openai import word_hash_vector
+
+# Defaults in chat.py / ingestion.py today, marked in the report
+CURRENT = {'chunk_size': 2000, 'overlap': 200, 'k': 10, 'backend': 'hybrid'}
+
+# (visitor question, sections of info.txt that answer it); section names as ingestion.split_sections reports them
+QUESTIONS = [
+    ("What products does PALMS offer?", ["Core Products", "Product Overview"]),
+    ("What is PALMS?", ["Product Overview", "Core Products"]),
+    ("How accurate is inventory tracking in the WMS?", ["PALMS™ WMS (Warehouse Management System)"]),
+    ("Does the warehouse management system support FIFO and FEFO stock rotation?",
+     ["PALMS™ WMS (Warehouse Management System)", "Inventory Management"]),
+    ("How much faster does picking get with PALMS?", ["PALMS™ WMS (Warehouse Management System)"]),
+    ("Can we bill each of our logistics clients separately?", ["PALMS™ 3PL"]),
+    ("Does the 3PL product support multi-currency invoices and rate cards?", ["PALMS™ 3PL"]),
+    ("Can our clients get their own portal to see stock?", ["PALMS™ 3PL", "PALMS™ Supplier & Customer Portal"]),
+    ("Which barcode formats can the mobile app scan?", ["PALMS™ Mobile"]),
+    ("Can operators keep scanning when the wifi drops?", ["PALMS™ Mobile"]),
+    ("Does the app capture digital signatures on delivery?", ["PALMS™ Mobile"]),
+    ("How do you schedule dock doors for cross docking?", ["PALMS™ Cross Dock"]),
+    ("Can suppliers track their orders and shipments online?", ["PALMS™ Supplier & Customer Portal"]),
+    ("Can PALMS control conveyors, sorters and AGVs?", ["PALMS™ Warehouse Control System", "Integration Options"]),
+    ("Do you have a pick-to-light system?", ["PALMS™ Light Systems", "PALMS™ Warehouse Control System"]),
+    ("Does it integrate with our ERP?", ["Integration Options"]),
+    ("Is single sign-on with Active Directory supported?", ["Security Features"]),
+    ("Do you support cycle counting and ABC analysis?", ["Inventory Management"]),
+    ("Does it handle wave picking?", ["Warehouse Operations"]),
+    ("How many standard reports and KPI dashboards come with it?", ["Analytics and Reporting"]),
+    ("Can it forecast demand?", ["Analytics and Reporting", "PALMS™ Analytics"]),
+    ("Can it be installed on-premise or only in the cloud?", ["Implementation Options", "Hardware and Infrastructure"]),
+    ("Is support available 24/7?", ["Service Level", "Support and Maintenance"]),
+    ("We are a manufacturer, can it track work in progress?", ["Manufacturing"]),
+    ("We sell online, does it help with omnichannel returns?", ["Retail and E-commerce"]),
+    ("We run a cold store, can it monitor temperature zones?", ["Cold Storage and Agriculture"]),
+    ("Can it track shelf life for perishable goods?", ["Cold Storage and Agriculture", "FMCG and Consumer Goods"]),
+    ("We supply automotive parts for JIT assembly lines", ["Automotive"]),
+    ("Do you handle RMA and warranty for electronics?", ["Electronics and High-Tech"]),
+    ("How is PALMS licensed?", ["License Types", "Pricing and Licensing"]),
+    ("Do you offer data migration from our old system?", ["Additional Services"]),
+    ("Can we run it without handheld terminals?", ["System Operations"]),
+    ("Which hardware like RFID readers and label printers is supported?", ["Hardware and Infrastructure"]),
+    ("Where is the cloud version hosted and what uptime is guaranteed?", ["Hardware and Infrastructure"]),
+    ("Can we restrict vendor access by IP address?", ["Access and Security"]),
+    ("How does it cope with peak season volumes?", ["Performance and Scalability"]),
+    ("What is the sales email address?", ["Support Channels"]),
+    ("What is your phone number in the UAE?", ["Phone Numbers"]),
+    ("Is the company ISO certified?", ["Company Details"]),
+]
+
+
+def hash_embedder(dimensions):
+    def embed(texts):
+        return [word_hash_vector(text, dimensions) for text in texts]
+    return embed
+
+
+def openai_embedder():
+    from openai import OpenAI
+    from ingestion import EmbeddingIngestor
+    from embedding_cache import EmbeddingCache
+    ingestor = EmbeddingIngestor(OpenAI(api_key=os.getenv('OPENAI_API_KEY')), cache=EmbeddingCache())
+    return ingestor.embed
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Retriever:
+    """One backend over one chunking; search(question, embedding, n) -> [(id, document)] best first"""
+
+    def __init__(self, backend, records, embeddings, workdir):
+        self.backend = backend
+        self.collection = None
+        self.lexical = None
+        ids = [record['id'] for record in records]
+        documents = [record['document'] for record in records]
+        metadatas = [record['metadata'] for record in records]
+
+        if backend in ('numpy', 'hybrid'):
+            self.collection = VectorIndex(tempfile.mkdtemp(dir=workdir))
+            self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        elif backend == 'chroma':
+            import chromadb
+            client = chromadb.EphemeralClient()
+            name = f"bench_{len(os.listdir(workdir))}_{time.time_ns()}"
+            self.collection = client.create_collection(name)
+            self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        if backend in ('bm25', 'hybrid'):
+            self.lexical = BM25Index(ids, documents, metadatas)
+
+    def search(self, question, embedding, n_results):
+        lexical_ranking = []
+        if self.lexical is not None:
+            hits = self.lexical.search(question, n_results)
+            lexical_ranking = [(chunk_id, document) for chunk_id, document, _ in hits]
+            if self.backend == 'bm25' or self.lexical.is_confident(question, hits):
+                return lexical_ranking
+
+        results = self.collection.query(query_embeddings=[embedding], n_results=n_results)
+        ranking = list(zip(results['ids'][0], results['documents'][0]))
+        if not lexical_ranking:
+            return ranking
+        fused = reciprocal_rank_fusion([ranking, lexical_ranking], n_results)
+        id_of = {document: chunk_id for chunk_id, document in ranking + lexical_ranking}
+        return [(id_of[document], document) for document in fused]
+
+
+def evaluate(retriever, questions, embeddings, section_of, k_values, repeat):
+    """Rows of recall@k / MRR@k / tokens / latency for one retriever"""
+    depth = max(k_values)
+    rankings = []
+    latencies = []
+    for (question, _), embedding in zip(questions, embeddings):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            ranking = retriever.search(question, embedding, depth)
+            latencies.append(time.perf_counter() - started)
+        rankings.append(ranking)
+    latencies.sort()
+
+    packer = ContextPacker()
+    rows = []
+    for k in k_values:
+        hits = reciprocal_ranks = tokens = packed = 0
+        for (question, expected), ranking in zip(questions, rankings):
+            top = ranking[:k]
+            rank = next((position for position, (chunk_id, _) in enumerate(top, start=1)
+                         if section_of[chunk_id] in expected), None)
+            if rank:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+            documents = [document for _, document in top]
+            tokens += count_tokens(' '.join(documents))
+            with contextlib.redirect_stdout(io.StringIO()):
+                packed += packer.pack(documents)[1]['tokens_packed']
+        count = len(questions)
+        rows.append({
+            'k': k,
+            'recall': round(hits / count, 3),
+            'mrr': round(reciprocal_ranks / count, 3),
+            'context_tokens': round(tokens / count),
+            'packed_tokens': round(packed / count),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        })
+    return rows
+
+
+def run(content, chunk_sizes, overlaps, k_values, backends, embed, repeat=5):
+    workdir = tempfile.mkdtemp(prefix='palms-retrieval-bench-')
+    question_embeddings = embed([question for question, _ in QUESTIONS])
+    results = []
+    try:
+        for chunk_size in chunk_sizes:
+            for overlap in overlaps:
+                if overlap >= chunk_size:
+                    continue
+                records = build_chunk_records(content, chunk_size, overlap)
+                section_of = {record['id']: record['metadata']['section'] for record in records}
+                embeddings = embed([record['document'] for record in records])
+                for backend in backends:
+                    try:
+                        started = time.perf_counter()
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            retriever = Retriever(backend, records, embeddings, workdir)
+                        build_ms = round((time.perf_counter() - started) * 1000, 1)
+                    except ImportError as e:
+                        print(f"⚠️ Skipping {backend}: {e}")
+                        continue
+                    for row in evaluate(retriever, QUESTIONS, question_embeddings, section_of, k_values, repeat):
+                        results.append(dict(row, chunk_size=chunk_size, overlap=overlap, backend=backend,
+                                            chunks=len(records), build_ms=build_ms))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def is_current(row):
+    return all(row[field] == value for field, value in CURRENT.items())
+
+
+def print_table(results):
+    header = f"{'chunk':>6} {'overlap':>7} {'backend':<7} {'chunks':>6} {'k':>3} {'recall':>7} {'MRR':>6} " \
+             f"{'tokens':>7} {'packed':>7} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print('-' * len(header))
+    for row in results:
+        marker = '  <- current' if is_current(row) else ''
+        print(f"{row['chunk_size']:>6} {row['overlap']:>7} {row['backend']:<7} {row['chunks']:>6} {row['k']:>3} "
+              f"{row['recall']:>7.3f} {row['mrr']:>6.3f} {row['context_tokens']:>7} {row['packed_tokens']:>7} "
+              f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}{marker}")
+
+
+def summarize(results):
+    """The cheapest combination (packed tokens) that recalls at least as well as the current settings"""
+    current = next((row for row in results if is_current(row)), None)
+    if current is None:
+        return
+    candidates = [row for row in results if row['recall'] >= current['recall']]
+    best = min(candidates, key=lambda row: (row['packed_tokens'], -row['mrr']))
+    print(f"\nCurrent settings: recall@{current['k']} {current['recall']:.3f}, MRR {current['mrr']:.3f}, "
+          f"{current['packed_tokens']} packed tokens")
+    print(f"Cheapest at least as good: chunk {best['chunk_size']}, overlap {best['overlap']}, {best['backend']}, "
+          f"k={best['k']}: recall {best['recall']:.3f}, MRR {best['mrr']:.3f}, {best['packed_tokens']} packed tokens")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--info', default=os.path.join(REPO_ROOT, 'info.txt'))
+    parser.add_argument('--chunk-sizes', default='40,80,150,2000', help='words per chunk')
+    parser.add_argument('--overlaps', default='0,20,200', help='words shared by consecutive chunks')
+    parser.add_argument('--k', default='3,5,10', help='n_results values')
+    parser.add_argument('--backends', default='numpy,chroma,bm25,hybrid')
+    parser.add_argument('--embeddings', choices=['hash', 'openai'], default='hash')
+    parser.add_argument('--dimensions', type=int, default=256, help='size of the word-hash vectors')
+    parser.add_argument('--repeat', type=int, default=5, help='timed lookups per question')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    with open(args.info, 'r', encoding='utf-8') as file:
+        content = file.read()
+    embed = openai_embedder() if args.embeddings == 'openai' else hash_embedder(args.dimensions)
+    print(f"📚 {len(QUESTIONS)} labelled questions, {args.embeddings} embeddings\n")
+
+    results = run(content,
+                  [int(value) for value in args.chunk_sizes.split(',')],
+                  [int(value) for value in args.overlaps.split(',')],
+                  [int(value) for value in args.k.split(',')],
+                  args.backends.split(','), embed, args.repeat)
+    print_table(results)
+    summarize(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'settings': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
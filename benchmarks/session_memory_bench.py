@@ -0,0 +1,115 @@
+"""
+Memory per session: the old free-form session dict versus session_state.Session.
+
+Plays the same scripted conversation into many sessions of each kind, through the dict-style calls
+chat.py makes (history appends, interests and qualification signals, counters, the rolling history
+window, the stored /chat answer), then reports:
+    live    bytes per session held in the worker while it is being used (tracemalloc)
+    stored  bytes per session in the session stores (the JSON each backend keeps; the memory
+            backend holds exactly these strings)
+
+Run from the repository root:
+    python benchmarks/session_memory_bench.py
+    python benchmarks/session_memory_bench.py --sessions 5000 --turns 10,30,80
+"""
+
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_state import Session
+from session_store import dump_session
+from conversation_window import ConversationWindow, HISTORY_SUMMARY_MAX_TOKENS, count_tokens, fallback_summary
+
+USER_MESSAGES = [
+    "Hi", "What is PALMS?", "We run a 3PL with 4 warehouses and we are evaluating options",
+    "How much does it cost?", "Does it support RFID and mobile scanning?", "What is the implementation timeline?",
+    "How does it compare with other WMS vendors?", "We need a solution asap, budget approved", "tell me more",
+]
+REPLY = ("PALMS™ gives {n} warehouses real-time inventory with 99.9% accuracy, mobile barcode and RFID scanning, "
+         "3PL billing per client and ERP integration. Implementation typically takes 6-12 weeks depending on "
+         "scope. Would you like to see how it would fit your operation? (turn {n})")
+
+
+def legacy_session():
+    """session_store.new_session() before session_state.Session"""
+    return {'conversation_history': [], 'user_info': {}, 'lead_score': 0, 'stage': 'greeting'}
+
+
+def play(session, turns, window):
+    """The session updates of one conversation, as chat.py and app.py make them"""
+    for turn in range(turns):
+        message = f"{USER_MESSAGES[turn % len(USER_MESSAGES)]} ({turn})"
+        session['conversation_history'].append({'role': 'user', 'content': message})
+        session['message_count'] = session.get('message_count', 0) + 1
+        for interest in ('pricing', 'features', 'timeline')[:turn % 4]:
+            session['interests'] = session.get('interests', [])
+            if interest not in session['interests']:
+                session['interests'].append(interest)
+        if turn % 3 == 2:
+            # enhanced_lead_qualification appends on every matching turn
+            session['qualification_signals'] = session.get('qualification_signals', [])
+            session['qualification_signals'].append('intent_signals_high')
+        session['lead_score'] = session.get('lead_score', 0) + 5
+        session['stage'] = 'warm_lead' if session['lead_score'] >= 40 else 'interested'
+        if turn == 4:
+            session['demo_declined'] = True
+        window.update(session)
+        reply = REPLY.format(n=turn)
+        session['conversation_history'].append({'role': 'assistant', 'content': reply})
+        session['last_chat'] = {'key': f"msg:{turn:032d}", 'at': 1.0 * turn,
+                                'response': {'message': reply, 'show_demo_form': False,
+                                             'lead_score': session['lead_score'], 'stage': session['stage']}}
+    return session
+
+
+def check_fallback_summary():
+    """An LLM summary without ': ' that is already over budget must still fold (it used to raise IndexError)"""
+    summary = 'visitor runs a 3PL with four warehouses and wants RFID scanning and pricing ' * 20
+    folded = [{'role': 'user', 'content': f"question {n} about ERP integration"} for n in range(6)]
+    result = fallback_summary(summary, folded)
+    assert count_tokens(result) <= HISTORY_SUMMARY_MAX_TOKENS, result
+    assert result.endswith('question 5 about ERP integration'), result
+
+
+def measure(factory, count, turns, window):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [play(factory(), turns, window) for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    live = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    stored = sum(len(serialize(session).encode('utf-8')) for session in sessions)
+    return live / count, stored / count
+
+
+def serialize(session):
+    if isinstance(session, dict):
+        return json.dumps(session, separators=(',', ':'), ensure_ascii=False)
+    return dump_session(session)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--turns', default='5,20,60', help='visitor messages per conversation')
+    args = parser.parse_args(argv)
+    check_fallback_summary()
+
+    # Summaries come from the extractive fallback, so no LLM is needed
+    window = ConversationWindow()
+    print(f"{'turns':>5} {'dict live':>10} {'Session live':>13} {'saved':>6} "
+          f"{'dict stored':>12} {'Session stored':>15} {'saved':>6}")
+    for turns in [int(value) for value in args.turns.split(',')]:
+        legacy_live, legacy_stored = measure(legacy_session, args.sessions, turns, window)
+        live, stored = measure(Session, args.sessions, turns, window)
+        print(f"{turns:>5} {legacy_live:>10.0f} {live:>13.0f} {1 - live / legacy_live:>6.0%} "
+              f"{legacy_stored:>12.0f} {stored:>15.0f} {1 - stored / legacy_stored:>6.0%}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,227 @@
 import os
 from dotenv import load_dotenv
 import re
-import json
-import chromadb
+import time
+import hashlib
+import threading
 from email_validator import validate_email, EmailNotValidError
+from ingestion import (EmbeddingIngestor, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS,
+                       split_sections, build_chunk_records, sync_collection, knowledge_base_version)
+from embedding_cache import (EmbeddingCache, TTLCache, normalize_query, QUERY_EMBEDDING_CACHE_SIZE,
+                             QUERY_EMBEDDING_CACHE_TTL, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+from semantic_cache import SemanticCache
+from pipeline_router import PipelineRouter, ROUTE_CANNED, ROUTE_SINGLE_CALL
+from conversation_window import ConversationWindow, HISTORY_SUMMARY_MAX_TOKENS, fallback_summary, render_message
+from keyword_matcher import QUALIFICATION_SIGNALS, scan_message
+from vector_index import VectorIndex, RETRIEVAL_BACKEND, VECTOR_INDEX_PATH
+from context_packer import ContextPacker
+from metrics import timed, record_usage
+from prompt_layout import layered_messages, cache_options
+from single_flight import SingleFlight
+from lexical_index import BM25Index, HYBRID_RETRIEVAL, LEXICAL_ONLY_ROUTING, reciprocal_rank_fusion
+from knowledge_watcher import KnowledgeSnapshot, KnowledgeWatcher, KNOWLEDGE_WATCH
 
 load_dotenv()
 
+# Build the OpenAI client and Chroma index on a background thread, so the server accepts traffic
+# (and answers /healthz) straight away; chat requests wait for warm-up up to WARMUP_WAIT_TIMEOUT seconds
+WARMUP_IN_BACKGROUND = os.getenv('WARMUP_IN_BACKGROUND', 'true').lower() == 'true'
+WARMUP_WAIT_TIMEOUT = float(os.getenv('WARMUP_WAIT_TIMEOUT', '30'))
+
+# /chat/prefetch: retrieve for the visitor's draft while they are still typing
+CHAT_PREFETCH = os.getenv('CHAT_PREFETCH', 'true').lower() == 'true'
+PREFETCH_MIN_CHARS = int(os.getenv('PREFETCH_MIN_CHARS', '8'))
+PREFETCH_MAX_CHARS = int(os.getenv('PREFETCH_MAX_CHARS', '500'))
+
 class SalesBotRAG:
-    def __init__(self):
+    def __init__(self, warm_up_in_background=WARMUP_IN_BACKGROUND):
+        self.client = None
+        self.chroma_client = None
+        self.ingestor = None
+        self.warmup_done = threading.Event()
+        self.warmup_error = None
+        self.warmup_seconds = None
+        
+        # Persistent embedding cache, so unchanged text is never re-embedded across reloads or restarts
+        try:
+            self.embedding_cache = EmbeddingCache()
+        except Exception as e:
+            print(f"⚠️ Embedding cache unavailable, continuing without it: {e}")
+            self.embedding_cache = None
+        
+        # Hot in-process cache for repeated visitor questions (quick replies, pricing, ...)
+        self.query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+        
+        # Retrieval results for drafts prefetched while the visitor types, so /chat skips the lookup
+        self.retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        
+        # Information-layer extractions shared across sessions, keyed on query similarity
+        # and invalidated whenever the knowledge base version changes
+        self.extraction_cache = SemanticCache()
+        
+        # Vector collection, BM25 index and version published together; requests read this reference
+        # once per turn and background reloads replace it whole (see knowledge_watcher.py)
+        self.knowledge = KnowledgeSnapshot()
+        self.reload_lock = threading.Lock()
+        self.knowledge_watcher = None
+        
+        # Fits retrieved chunks into a token budget for the information layer
+        self.context_packer = ContextPacker()
+        
+        # Identical embedding / information-layer calls in flight at the same time share one OpenAI call
+        self.flights = SingleFlight()
+        
+        # Picks the cheapest pipeline path (canned / single LLM call / full two-layer) per turn
+        self.router = PipelineRouter()
+        
+        # Token-bounded history for the sales prompt; older turns are folded into a rolling summary
+        self.conversation_window = ConversationWindow(summarize=self.summarize_conversation)
+        
+        self.init_prompts()
+        
+        if warm_up_in_background:
+            threading.Thread(target=self.warm_up, name='chatbot-warm-up', daemon=True).start()
+        else:
+            self.warm_up()
+
+    def warm_up(self):
+        """OpenAI client (with its connection pre-opened), Chroma collection and knowledge base"""
+        started = time.time()
+        try:
+            self.init_clients()
+            
+            # Batched embedding pipeline shared with refresh_database.py
+            self.ingestor = EmbeddingIngestor(self.client, cache=self.embedding_cache) if self.client else None
+            
+            if RETRIEVAL_BACKEND == 'numpy':
+                # Memory-mapped snapshot written by refresh_database.py (built here if missing)
+                collection = VectorIndex(VECTOR_INDEX_PATH)
+            else:
+                # Initialize ChromaDB for RAG (without sentence transformers); imported here because it is slow to import
+                import chromadb
+                self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
+                collection = self.get_or_create_collection()
+            
+            # Load and process the knowledge base
+            if not self.load_knowledge_base(collection):
+                # Serve an empty knowledge base rather than none; the watcher retries on the next edit
+                self.knowledge = KnowledgeSnapshot(collection=collection)
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"❌ Warm-up failed: {e}")
+        finally:
+            self.warmup_seconds = round(time.time() - started, 2)
+            self.warmup_done.set()
+            if not self.warmup_error:
+                print(f"✅ Chatbot ready in {self.warmup_seconds}s")
+
+    def reinit_after_fork(self):
+        """Fresh per-process clients in a gunicorn worker forked from a preloaded master (gunicorn.conf.py).
+        Prompts, rule tables, caches, the BM25 index and the mmap'd vector snapshot stay shared copy-on-write;
+        sockets and SQLite connections must not cross a fork, so OpenAI, the embedding cache and Chroma are reopened
+        """
+        self.init_clients()
+        try:
+            self.embedding_cache = EmbeddingCache()
+        except Exception as e:
+            print(f"⚠️ Embedding cache unavailable, continuing without it: {e}")
+            self.embedding_cache = None
+        self.ingestor = EmbeddingIngestor(self.client, cache=self.embedding_cache) if self.client else None
+        
+        if self.chroma_client is not None:
+            self.reopen_chroma_client()
+            self.knowledge = self.knowledge.with_collection(self.get_or_create_collection())
+        print(f"✅ Worker {os.getpid()} re-initialised its clients")
+
+    def reopen_chroma_client(self):
+        """A new PersistentClient that reads ./chroma_db as it is on disk now"""
+        import chromadb
+        try:
+            # PersistentClient is cached per path (and keeps its vector segments in memory); drop the cached one
+            chromadb.api.client.SharedSystemClient.clear_system_cache()
+        except Exception as e:
+            print(f"⚠️ Could not clear the Chroma client cache: {e}")
+        self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
+
+    @property
+    def collection(self):
+        return self.knowledge.collection
+
+    @property
+    def lexical_index(self):
+        return self.knowledge.lexical_index
+
+    @property
+    def kb_version(self):
+        return self.knowledge.version
+
+    def start_knowledge_watcher(self):
+        """Reindex in the background when info.txt changes; one watcher per process (threads don't survive fork),
+        of which only one reindexes and the rest load what it published
+        """
+        if not KNOWLEDGE_WATCH:
+            return None
+        if self.knowledge_watcher is None:
+            self.knowledge_watcher = KnowledgeWatcher(self.reload_knowledge_base,
+                                                      on_published=self.sync_knowledge_base,
+                                                      current_version=lambda: self.kb_version)
+        return self.knowledge_watcher.start()
+
+    def reload_knowledge_base(self):
+        """Rebuild the index from info.txt off to the side and publish it; requests keep the old snapshot until then.
+        False if it failed (the watcher retries)
+        """
+        if not self.wait_until_ready():
+            return False
+        with self.reload_lock:
+            if RETRIEVAL_BACKEND == 'numpy':
+                # A second handle with its own copy of the arrays; the live one is untouched until the swap
+                collection = VectorIndex(VECTOR_INDEX_PATH)
+            else:
+                # Chroma is synced in place; readers of the old snapshot filter out the new chunks
+                collection = self.knowledge.collection
+            return self.load_knowledge_base(collection, force_reload=True)
+
+    def sync_knowledge_base(self, version):
+        """Publish the index another worker reindexed; nothing is embedded or written here.
+        True once this process serves that version
+        """
+        if not self.wait_until_ready():
+            return False
+        with self.reload_lock:
+            if RETRIEVAL_BACKEND == 'numpy':
+                collection = VectorIndex(VECTOR_INDEX_PATH)
+            else:
+                # This process's client still holds the old vectors in memory
+                self.reopen_chroma_client()
+                collection = self.chroma_client.get_collection("palms_knowledge")
+            if collection.count() == 0 or not self.load_knowledge_base(collection):
+                return False
+            return self.kb_version == version
+
+    def wait_until_ready(self, timeout=WARMUP_WAIT_TIMEOUT):
+        if not self.warmup_done.wait(timeout):
+            print(f"⚠️ Still warming up after {timeout}s, answering without the knowledge base")
+        return self.is_ready()
+
+    def is_ready(self):
+        return self.warmup_done.is_set() and self.warmup_error is None and self.collection is not None
+
+    def readiness(self):
+        """Status for the /readyz endpoint"""
+        status = {
+            'ready': self.is_ready(),
+            'warming_up': not self.warmup_done.is_set(),
+            'openai': 'connected' if self.client else ('pending' if not self.warmup_done.is_set() else 'demo_mode'),
+            'retrieval_backend': RETRIEVAL_BACKEND,
+            'knowledge_base_version': self.kb_version,
+            'warmup_seconds': self.warmup_seconds
+        }
+        if self.warmup_error:
+            status['error'] = self.warmup_error
+        return status
+
+    def init_clients(self):
         # Initialize OpenAI
         api_key = os.getenv('OPENAI_API_KEY')
         print(f"DEBUG: API key found: {api_key[:20] if api_key else 'None'}...")
@@ -31,7 +244,7 @@ class SalesBotRAG:
                 
                 # Test the client with a simple call
                 try:
-                    # Verify the client works
+                    # Verify the client works; this also leaves a warm TLS connection in the pool
                     _ = self.client.models.list()
                     print("✅ OpenAI API connection verified")
                 except Exception as test_error:
@@ -43,14 +256,8 @@ class SalesBotRAG:
                 print(f"Error type: {type(e).__name__}")
                 print("Running in enhanced demo mode...")
                 self.client = None
-        
-        # Initialize ChromaDB for RAG (without sentence transformers)
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.get_or_create_collection()
-        
-        # Load and process the knowledge base
-        self.load_knowledge_base()
-        
+
+    def init_prompts(self):
         # Business email domains to exclude
         self.personal_domains = {
             'gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'aol.com',
@@ -181,6 +388,70 @@ class SalesBotRAG:
 
         Remember: Every interaction should move the prospect closer to scheduling a demo or making a purchase decision while feeling natural and helpful. ALWAYS follow the guardrails above.
         """
+        
+        # Static system messages; per-turn data goes after them so OpenAI can cache the prefix (prompt_layout.py)
+        self.information_instructions = f"""
+        {self.retrieval_prompt}
+        
+        The user message holds the KNOWLEDGE BASE CONTEXT and the USER QUERY.
+        
+        SPECIAL INSTRUCTIONS:
+        1. If user asks about "products" or "what products" - extract ONLY product names and one-line descriptions
+        2. If user asks about a SPECIFIC product or asks for "details" or "features" - include ALL details
+        3. For product/feature lists when details are requested, maintain the full hierarchy and all bullet points
+        4. Do not provide detailed features unless specifically asked
+        5. Preserve all technical specifications and metrics when details are requested
+        6. Keep responses concise unless explicitly asked for comprehensive information
+        
+        Extract and return the appropriate level of information based on the user's query.
+        Focus on matching the user's intent - brief overview vs. detailed information.
+        """
+        
+        self.sales_instructions = f"""
+        {self.sales_prompt}
+        
+        The user message holds the CONVERSATION CONTEXT, the EXTRACTED PALMS™ INFORMATION and the CURRENT USER MESSAGE.
+        
+        RESPONSE GUIDELINES - SMART LENGTH CONTROL:
+        
+        **CRITICAL: Read the user's question carefully to determine desired detail level**
+        
+        1. General questions ("tell me about features", "what can palms do"):
+           - Give 2-3 sentence overview highlighting TOP 3-4 capabilities only
+           - Example: "PALMS™ offers comprehensive WMS capabilities including real-time inventory tracking, automated order processing, and AI-driven space optimization. We also provide mobile solutions, 3PL management, and advanced analytics. Which area interests you most?"
+        
+        2. Product list questions ("what products", "list products"):
+           - Show ONLY product names with ONE-LINE descriptions using bullet points
+           - Maximum 8-9 products with brief tags
+        
+        3. Specific product questions ("tell me about WMS", "what is 3PL"):
+           - Provide 4-5 lines max with key benefits
+           - Focus on value, not feature lists
+        
+        4. Detailed feature requests ("show all WMS features", "comprehensive features", "full feature list"):
+           - ONLY THEN provide complete feature lists with categories
+           - Use bullet points organized by category
+        
+        5. Always ask a follow-up question to understand what they really need
+        
+        6. Respect the demo decline status given in the conversation context
+        
+        FORMATTING REQUIREMENTS:
+        - Use bullet points (•) for lists, never numbered lists
+        - DO NOT use ### headers or markdown headers - just use **bold text** for emphasis
+        - Keep responses SHORT unless explicitly asked for comprehensive details
+        - Maximum response length: 6-8 lines for general questions
+        - Be conversational and direct
+        
+        INTENT IDENTIFICATION (use when appropriate):
+        If user seems uncertain or new, offer: "Are you just exploring or looking for something specific today?"
+        ① Just exploring → Overview + key benefits + ask about challenges
+        ② Looking for pricing → Understand requirements + discuss pricing
+        ③Need help deciding → Qualifying questions + recommendations  
+        ④Want to book demo → Capture details + schedule
+        
+        Generate a compelling, context-aware sales response.
+        """
 
     def get_or_create_collection(self):
         """Get or create ChromaDB collection for PALMS knowledge"""
@@ -226,37 +497,72 @@ class SalesBotRAG:
                     print(f"❌ Failed to create collection even after reset: {reset_error}")
                     raise reset_error
 
-    def get_embedding(self, text):
+    @timed('embedding')
+    def get_embedding(self, text, raise_errors=False):
         """Generate embeddings using OpenAI API instead of sentence transformers"""
         try:
             if not self.client:
                 # Fallback to simple hash-based pseudo-embedding for demo mode
-                return [hash(text) % 100 / 100.0] * 384  # 384 dimensions for compatibility
+                return self.fallback_embedding(text)
+            
+            if self.embedding_cache:
+                cached = self.embedding_cache.get(text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+                if cached is not None:
+                    return cached
             
             # Use OpenAI's text-embedding-3-small model (more memory efficient)
+            params = {'dimensions': EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
             response = self.client.embeddings.create(
                 input=text,
-                model="text-embedding-3-small"
+                model=EMBEDDING_MODEL,
+                **params
             )
-            return response.data[0].embedding
+            record_usage(EMBEDDING_MODEL, getattr(response, 'usage', None))
+            embedding = response.data[0].embedding
+            if self.embedding_cache:
+                self.embedding_cache.put(text, embedding, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+            return embedding
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error generating embedding: {e}")
             # Fallback embedding
-            return [hash(text) % 100 / 100.0] * 384
+            return self.fallback_embedding(text)
+
+    def fallback_embedding(self, text):
+        """Hash-based pseudo-embedding used in demo mode or when OpenAI fails"""
+        return [hash(text) % 100 / 100.0] * 384  # 384 dimensions for compatibility
+
+    def get_query_embedding(self, query):
+        """Embedding for a visitor query, served from the in-process LRU cache when possible"""
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is not None:
+            stats = self.query_embedding_cache.stats()
+            print(f"Query embedding cache hit ({stats['hits']} hits / {stats['misses']} misses)")
+            return embedding
+        
+        try:
+            embedding = self.flights.do(('embedding', key), lambda: self.get_embedding(query, raise_errors=True))
+        except Exception as e:
+            # Don't cache fallbacks; the next identical query should retry OpenAI
+            print(f"Error generating embedding: {e}")
+            return self.fallback_embedding(query)
+        
+        self.query_embedding_cache.put(key, embedding)
+        return embedding
 
-    def load_knowledge_base(self, force_reload=False):
-        """Load and process the info.txt file into ChromaDB"""
+    def load_knowledge_base(self, collection, force_reload=False):
+        """Load and process the info.txt file into the collection and publish it.
+        True once the published snapshot matches info.txt, False if loading failed
+        """
         try:
             # Check if collection is already populated
-            if self.collection.count() > 0 and not force_reload:
-                print(f"Knowledge base already loaded with {self.collection.count()} chunks")
-                return
-                
-            # If force_reload, clear existing collection
-            if force_reload:
-                print("Force reloading knowledge base...")
-                self.collection.delete(where={"type": "product_info"})
-                print("Existing knowledge base cleared")
+            if collection.count() > 0 and not force_reload:
+                print(f"Knowledge base already loaded with {collection.count()} chunks")
+                stored = collection.get(where={"type": "product_info"}, include=['documents', 'metadatas'])
+                self.publish_knowledge(collection, stored['ids'], stored['documents'], stored['metadatas'])
+                return True
             
             # Try to load the info.txt file
             info_file_path = 'info.txt'
@@ -277,43 +583,63 @@ class SalesBotRAG:
                     print(f"Error reading {info_file_path}: {e}")
                     content = self.get_basic_palms_info()
             
-            # Split content into chunks for better retrieval
-            chunks = self.split_content_into_chunks(content)
-            print(f"Created {len(chunks)} knowledge chunks")
+            # Split content into chunks with stable, content-derived ids
+            records = build_chunk_records(content)
+            print(f"Created {len(records)} knowledge chunks")
             
-            if not chunks:
+            if not records:
                 print("No content to process")
-                return
-            
-            # Generate embeddings and store in ChromaDB
-            embeddings = []
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for i, chunk in enumerate(chunks):
-                if len(chunk.strip()) > 50:  # Only process meaningful chunks
-                    embedding = self.get_embedding(chunk)
-                    embeddings.append(embedding)
-                    documents.append(chunk)
-                    metadatas.append({"chunk_id": i, "type": "product_info"})
-                    ids.append(f"chunk_{i}")
+                return False
             
-            # Only add if we have embeddings
-            if embeddings:
-                self.collection.add(
-                    embeddings=embeddings,
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                print(f"Successfully added {len(embeddings)} chunks to knowledge base")
-            else:
-                print("No valid content chunks found to add to knowledge base")
+            ids = [record['id'] for record in records]
+            if force_reload and knowledge_base_version(ids) == self.kb_version:
+                print("info.txt chunks unchanged, nothing to reindex")
+                return True
+            if force_reload:
+                print("Reindexing knowledge base in the background (only changed chunks are re-embedded)...")
+            
+            # Diff against what is stored and only embed/write the chunks that changed
+            added, deleted, unchanged = sync_collection(collection, records, self.embed_documents)
+            print(f"Knowledge base synced: {added} added, {deleted} removed, {unchanged} unchanged")
+            self.publish_knowledge(collection, ids,
+                                   [record['document'] for record in records],
+                                   [record['metadata'] for record in records])
+            if self.ingestor:
+                self.ingestor.clear_progress()
+            return True
             
         except Exception as e:
             print(f"Error loading knowledge base: {e}")
+            return False
             
+    def publish_knowledge(self, collection, ids, documents, metadatas):
+        """Swap in a complete snapshot; a new version drops cached extractions and retrievals built from the old one"""
+        version = knowledge_base_version(ids)
+        previous = self.knowledge
+        # One reference assignment: every request sees either the old snapshot or the new one, never a mix
+        self.knowledge = KnowledgeSnapshot(version, collection, self.build_lexical_index(ids, documents, metadatas), ids)
+        if version != previous.version:
+            self.extraction_cache.invalidate(version)
+            self.retrieval_cache.clear()
+            print(f"Knowledge base version: {version}")
+
+    def build_lexical_index(self, ids, documents, metadatas):
+        """BM25 index over the chunks, None if it can't be built"""
+        try:
+            lexical_index = BM25Index(ids, documents, metadatas)
+            print(f"Lexical index built: {len(ids)} chunks, {len(lexical_index.postings)} terms")
+            return lexical_index
+        except Exception as e:
+            print(f"⚠️ Lexical index unavailable, using vector retrieval only: {e}")
+            return None
+
+    def embed_documents(self, documents):
+        """Embed knowledge base chunks, batched and concurrent when OpenAI is available"""
+        if self.ingestor:
+            # Finished batches survive a failure and are resumed on the next reload
+            return self.ingestor.embed(documents)
+        return [self.get_embedding(document) for document in documents]
+
     def get_basic_palms_info(self):
         """Fallback basic PALMS info if info.txt is not found"""
         return """
@@ -362,59 +688,125 @@ class SalesBotRAG:
 
     def split_content_into_chunks(self, content, chunk_size=2000, overlap=200):
         """Split content into overlapping chunks for better retrieval"""
-        # Split by major sections first
-        sections = content.split('\n##')
-        chunks = []
-        
-        for section in sections:
-            if not section.strip():
-                continue
-                
-            # For large sections, split into smaller chunks
-            words = section.split()
-            if len(words) > chunk_size:
-                for i in range(0, len(words), chunk_size - overlap):
-                    chunk = ' '.join(words[i:i + chunk_size])
-                    if chunk.strip():
-                        chunks.append('##' + chunk if i == 0 else chunk)
-            else:
-                # Keep small sections intact
-                chunks.append('##' + section if not section.startswith('##') else section)
-        
-        return chunks
+        return [chunk for _, chunk in split_sections(content, chunk_size, overlap)]
 
-    def retrieve_relevant_context(self, query, n_results=10):
-        """Retrieve relevant context from the knowledge base"""
+    @timed('retrieval')
+    def retrieve_relevant_chunks(self, query, n_results=10):
+        """Retrieve the best chunks (best first), their vector distances and whether the lexical-only path was taken.
+        Vector and BM25 rankings are fused with RRF; chunks only BM25 found have distance None
+        """
         try:
-            if self.collection.count() == 0:
-                print("Knowledge base is empty")
-                return ""
-                
-            # Extract main topic from query for better context retrieval
-            query_lower = query.lower()
-            if 'product' in query_lower or 'products' in query_lower:
-                query_sections = ['## Core Products', '## Product Overview']
-            elif 'feature' in query_lower or 'features' in query_lower:
-                query_sections = ['Features:', 'Capabilities:', 'Technical Capabilities']
-            else:
-                query_sections = None
-                
-            query_embedding = self.get_embedding(query)
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                where={"type": "product_info"} if not query_sections else None
-            )
-            
-            if results and 'documents' in results and results['documents']:
-                relevant_text = ' '.join(results['documents'][0])
-                print(f"Retrieved {len(relevant_text)} characters of context for query: {query[:50]}...")
-                return relevant_text
-            return ""
+            # One snapshot for the whole lookup, even if a reload publishes a new one meanwhile
+            knowledge = self.knowledge
+            key = self.retrieval_cache_key(knowledge, query, n_results)
+            cached = self.retrieval_cache.get(key)
+            if cached is not None:
+                print(f"Retrieval cache hit for query: {query[:50]}...")
+                return cached
+            
+            # A /chat arriving while the prefetch of the same draft is still running waits for it
+            return self.flights.do(key, lambda: self.cache_retrieval(
+                key, self.search_knowledge(knowledge, query, n_results)))
             
         except Exception as e:
             print(f"Error retrieving context: {e}")
-            return ""
+            return [], [], False
+
+    def retrieval_cache_key(self, knowledge, query, n_results):
+        """Retrieval depends only on the query (the metadata filter is derived from it) and the snapshot"""
+        return ('retrieval', knowledge.version, normalize_query(query), n_results)
+
+    def cache_retrieval(self, key, result):
+        """Keep a lookup for the /chat that follows; empty results (errors, empty knowledge base) are retried"""
+        if result[0]:
+            self.retrieval_cache.put(key, result)
+        return result
+
+    def search_knowledge(self, knowledge, query, n_results):
+        """Uncached lookup against one snapshot"""
+        if knowledge.collection.count() == 0:
+            print("Knowledge base is empty")
+            return [], [], False
+        
+        where = self.get_retrieval_filter(query)
+        lexical_hits, confident = self.lexical_search(query, n_results, where, knowledge)
+        if confident:
+            # Rare exact terms ("RFID", "3PL"): BM25 is enough, skip the embedding call
+            print(f"Lexical-only retrieval for query: {query[:50]}...")
+            return [document for _, document, _ in lexical_hits], [None] * len(lexical_hits), True
+            
+        query_embedding = self.get_query_embedding(query)
+        results = knowledge.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where
+        )
+        return self.fuse_results(knowledge.visible(results), lexical_hits, n_results)
+
+    def should_prefetch(self, draft):
+        """Whether a draft is worth retrieving for ahead of /chat (nothing here blocks or calls OpenAI)"""
+        if not CHAT_PREFETCH or not self.warmup_done.is_set():
+            return False
+        if not PREFETCH_MIN_CHARS <= len(draft) <= PREFETCH_MAX_CHARS:
+            return False
+        if not self.apply_safety_filter(draft)[0]:
+            return False
+        # Greetings, thanks and short follow-ups are answered without retrieval
+        return self.router.route(draft, {}).needs_retrieval
+
+    def prefetch(self, draft):
+        """Warm the query-embedding and retrieval caches for a message the visitor is still typing.
+        Returns 'warmed', 'cached' or 'skipped'
+        """
+        draft = str(draft or '').strip()
+        if not self.should_prefetch(draft):
+            return 'skipped'
+        if self.retrieval_cache.peek(self.retrieval_cache_key(self.knowledge, draft, 10)) is not None:
+            return 'cached'
+        self.retrieve_relevant_chunks(draft)
+        return 'warmed'
+
+    def lexical_search(self, query, n_results, where=None, knowledge=None):
+        """(BM25 hits, confident) for a query; ([], False) without a lexical index"""
+        lexical_index = (knowledge or self.knowledge).lexical_index
+        if not lexical_index or not (HYBRID_RETRIEVAL or LEXICAL_ONLY_ROUTING):
+            return [], False
+        try:
+            hits = lexical_index.search(query, n_results, where)
+            return hits, LEXICAL_ONLY_ROUTING and lexical_index.is_confident(query, hits)
+        except Exception as e:
+            print(f"Lexical search failed: {e}")
+            return [], False
+
+    def fuse_results(self, results, lexical_hits, n_results):
+        """RRF of the vector result and the BM25 hits as (documents, distances, False)"""
+        documents, distances = self.unpack_query_results(results)
+        if not HYBRID_RETRIEVAL or not lexical_hits or not documents:
+            return documents, distances, False
+        vector_ranking = list(zip(results['ids'][0], documents))
+        lexical_ranking = [(chunk_id, document) for chunk_id, document, _ in lexical_hits]
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], n_results)
+        distance_of = dict(zip(documents, distances))
+        return fused, [distance_of.get(document) for document in fused], False
+
+    def get_retrieval_filter(self, query):
+        """Chroma where-filter for a query"""
+        # Extract main topic from query for better context retrieval
+        query_lower = query.lower()
+        if 'product' in query_lower or 'products' in query_lower:
+            query_sections = ['## Core Products', '## Product Overview']
+        elif 'feature' in query_lower or 'features' in query_lower:
+            query_sections = ['Features:', 'Capabilities:', 'Technical Capabilities']
+        else:
+            query_sections = None
+        return {"type": "product_info"} if not query_sections else None
+
+    def unpack_query_results(self, results):
+        """(documents, distances) for the single query in a Chroma result"""
+        if results and 'documents' in results and results['documents']:
+            distances = results['distances'][0] if results.get('distances') else []
+            return results['documents'][0], distances
+        return [], []
 
     def validate_business_email(self, email):
         """Validate if email is a business email (not personal)"""
@@ -433,24 +825,21 @@ class SalesBotRAG:
 
     def analyze_message_intent(self, message, session):
         """Analyze user message for intent and update lead scoring"""
-        message_lower = message.lower()
+        hits = scan_message(message)
         
         # Advanced intent scoring with context awareness
         previous_score = session.get('lead_score', 0)
         
         # Pricing interest (high buying intent)
-        if any(word in message_lower for word in ['price', 'cost', 'pricing', 'how much', 'budget', 'expensive', 'affordable']):
+        if hits.any('pricing_interest'):
             session['lead_score'] += 10
             session['interests'] = session.get('interests', [])
             if 'pricing' not in session['interests']:
                 session['interests'].append('pricing')
             
         # Demo/trial interest (very high buying intent) - but respect decline status
-        demo_positive_words = ['demo', 'demonstration', 'show me', 'try', 'test', 'trial', 'see it']
-        demo_negative_words = ['no demo', 'not interested', 'do not want', "don't want", 'no thanks', 'not now', 'decline']
-        
-        has_demo_positive = any(word in message_lower for word in demo_positive_words)
-        has_demo_negative = any(word in message_lower for word in demo_negative_words)
+        has_demo_positive = hits.any('demo_positive')
+        has_demo_negative = hits.any('demo_negative')
         
         if has_demo_positive and not has_demo_negative:
             session['lead_score'] += 30
@@ -461,40 +850,38 @@ class SalesBotRAG:
             session['demo_declined'] = True
             
         # Technical/feature interest (moderate buying intent)
-        if any(word in message_lower for word in ['warehouse', 'inventory', 'wms', 'problems', 'challenges', 'features', 'capabilities']):
+        if hits.any('feature_interest'):
             session['lead_score'] += 15
             session['interests'] = session.get('interests', [])
             if 'features' not in session['interests']:
                 session['interests'].append('features')
             
         # Timeline/urgency (high buying intent)
-        if any(word in message_lower for word in ['timeline', 'when', 'implementation', 'go live', 'urgent', 'asap', 'soon']):
+        if hits.any('timeline_interest'):
             session['lead_score'] += 25
             session['interests'] = session.get('interests', [])
             if 'timeline' not in session['interests']:
                 session['interests'].append('timeline')
         
         # Company/business details (qualification signal)
-        if any(word in message_lower for word in ['company', 'business', 'we are', 'our warehouse', 'my company', 'organization']):
+        if hits.any('company_details'):
             session['lead_score'] += 20
             session['qualification_level'] = session.get('qualification_level', 0) + 1
             
         # Comparison shopping (buying intent)
-        if any(word in message_lower for word in ['compare', 'versus', 'vs', 'alternative', 'better than', 'difference']):
+        if hits.any('comparison_interest'):
             session['lead_score'] += 15
             session['interests'] = session.get('interests', [])
             if 'comparison' not in session['interests']:
                 session['interests'].append('comparison')
         
         # Industry-specific mentions (qualification signal)
-        industries = ['manufacturing', 'retail', 'ecommerce', '3pl', 'logistics', 'distribution', 'automotive', 'pharmaceutical']
-        if any(industry in message_lower for industry in industries):
+        if hits.any('industries'):
             session['lead_score'] += 10
-            session['industry'] = next((industry for industry in industries if industry in message_lower), None)
+            session['industry'] = hits.first('industries')
         
         # Size indicators (qualification signal)
-        size_indicators = ['warehouse', 'warehouses', 'facility', 'facilities', 'sqft', 'square feet', 'employees', 'staff']
-        if any(indicator in message_lower for indicator in size_indicators):
+        if hits.any('size_indicators'):
             session['qualification_level'] = session.get('qualification_level', 0) + 1
         
         # Determine lead temperature with more nuanced scoring
@@ -516,16 +903,16 @@ class SalesBotRAG:
         # Detect if user needs intent clarification (early in conversation, low engagement)
         if (session['message_count'] <= 3 and 
             current_score <= 15 and 
-            not any(word in message_lower for word in ['hello', 'hi', 'hey', 'what is palms', 'about palms'])):
+            not hits.any('opening_message')):
             session['needs_intent_clarification'] = True
 
     def get_enhanced_demo_response(self, message, relevant_context, lead_score, stage, session):
         """Generate intelligent demo responses when OpenAI API is not available"""
-        message_lower = message.lower()
+        hits = scan_message(message)
         conversation_history = session.get('conversation_history', [])
         
         # Check if user is asking for complete list
-        if any(phrase in message_lower for phrase in ['all products', 'complete list', 'full list', 'show everything', 'list all']):
+        if hits.any('demo_complete_list'):
             complete_info = self.get_complete_product_list(relevant_context)
             return f"""Here's our complete product and feature list:
 
@@ -550,7 +937,7 @@ Would you like me to focus on any specific aspect?"""
             return ' '.join(relevant_parts[:2])  # Return first 2 relevant sentences
         
         # Products and solutions inquiries
-        if any(word in message_lower for word in ['products', 'solutions', 'all products', 'what do you offer', 'modules', 'editions']):
+        if hits.any('demo_products'):
             # Get complete product information
             sections = relevant_context.split('\n##')
             products_section = ""
@@ -565,34 +952,34 @@ Would you like me to focus on any specific aspect?"""
 Would you like detailed information about any specific product or feature?"""
         
         # Greeting responses with context awareness
-        elif any(word in message_lower for word in ['hello', 'hi', 'hey', 'good morning', 'good afternoon']):
+        elif hits.any('demo_greeting'):
             if len(conversation_history) == 0:
                 return "Hello! I'm here to help with PALMS™ warehouse management solutions.\nAre you exploring options or need something specific?"
             else:
                 return "Hello again! How can I help you with PALMS™ today?"
             
         # Product information with context
-        elif any(word in message_lower for word in ['what is palms', 'about palms', 'palms wms', 'what does palms do']):
+        elif hits.any('demo_about'):
             return "PALMS™ is a warehouse management system with 99.9% inventory accuracy and automated order processing.\nWhat's your warehouse size? I can show you specific benefits for your operation."
             
         # Pricing inquiries with context
-        elif any(word in message_lower for word in ['price', 'cost', 'pricing', 'how much', 'budget']):
+        elif hits.any('demo_pricing'):
             return "PALMS™ pricing depends on warehouse size and features needed - typically ROI in 6-12 months.\nWhat's your warehouse size and daily order volume for accurate pricing?"
             
         # Handle demo decline responses
-        elif any(phrase in message_lower for phrase in ['no demo', 'not interested', 'do not want', "don't want", 'no thanks', 'not now', 'decline', 'pass']):
+        elif hits.any('demo_decline'):
             session['demo_declined'] = True
             return "No problem at all! I'm happy to answer any questions about PALMS™ features and benefits.\nWhat specific warehouse challenges are you facing?"
             
         # Demo requests - check if declined before
-        elif any(word in message_lower for word in ['demo', 'demonstration', 'show me', 'see it']):
+        elif hits.any('demo_request'):
             if session.get('demo_declined'):
                 return "I can answer any questions about PALMS™ features and benefits.\nWhat specific warehouse challenges are you trying to solve?"
             else:
                 return "Great! I can schedule a personalized PALMS™ demo with real-time tracking and ROI calculator.\nWhat industry are you in so I can tailor it for your needs?"
             
         # Features and benefits with context
-        elif any(word in message_lower for word in ['features', 'capabilities', 'what does', 'benefits', 'functionality']):
+        elif hits.any('demo_features'):
             features_info = extract_context_info(relevant_context, ['features', 'capabilities', 'tracking', 'automation', 'integration'])
             return f"""PALMS™ offers comprehensive warehouse management capabilities:
 
@@ -609,18 +996,18 @@ Would you like detailed information about any specific product or feature?"""
 Which of these areas is causing the biggest headache in your current operation?"""
             
         # Integration questions with specific details
-        elif any(word in message_lower for word in ['integration', 'erp', 'systems', 'connect', 'api']):
+        elif hits.any('demo_integration'):
             integration_info = extract_context_info(relevant_context, ['integration', 'erp', 'sap', 'oracle', 'api', 'edi'])
             return f"Excellent question! PALMS™ plays very well with others. We integrate seamlessly with all major ERP systems including SAP, Oracle, Microsoft Dynamics, and over 50 other platforms. {integration_info} Whether you need EDI connections, REST APIs, or real-time data synchronization, our integration team has you covered. We actually achieve 99% successful go-lives within just 4-8 weeks, which is pretty impressive in this industry. What ERP or software systems are you currently using?"
             
         # Mobile and technology with context
-        elif any(word in message_lower for word in ['mobile', 'handheld', 'scanning', 'app', 'technology']):
+        elif hits.any('demo_mobile'):
             mobile_info = extract_context_info(relevant_context, ['mobile', 'scanning', 'handheld', 'barcode', 'rfid'])
             return f"Yes! PALMS™ Mobile is a game-changer. {mobile_info} It enables barcode/RFID scanning, real-time updates, mobile picking with optimized paths, worker tracking, and task management. Works on any Android/iOS device with offline capability. Many clients report 30% productivity improvements. Are you currently using handheld devices or looking to implement them?"
             
         # Industry-specific responses
-        elif any(word in message_lower for word in ['manufacturing', 'retail', 'ecommerce', '3pl', 'cold storage', 'automotive']):
-            industry = next((word for word in ['manufacturing', 'retail', 'ecommerce', '3pl', 'cold storage', 'automotive'] if word in message_lower), 'your industry')
+        elif hits.any('demo_industries'):
+            industry = hits.first('demo_industries', 'your industry')
             industry_info = extract_context_info(relevant_context, [industry, 'industry'])
             return f"""Perfect! PALMS™ has extensive experience in {industry}. We offer specialized features:
 
@@ -634,12 +1021,12 @@ Which of these areas is causing the biggest headache in your current operation?"
 Our {industry} clients typically see 35-50% efficiency improvements. What are your biggest operational challenges right now?"""
             
         # Problems and challenges with solutions
-        elif any(word in message_lower for word in ['problem', 'challenge', 'issue', 'difficulty', 'inefficient']):
+        elif hits.any('demo_problems'):
             problems_info = extract_context_info(relevant_context, ['accuracy', 'errors', 'efficiency', 'problems'])
             return f"I understand - warehouse challenges directly impact your bottom line. {problems_info} PALMS™ addresses common issues: inventory inaccuracy → 99.9% accuracy, slow picking → 40% faster, space waste → 60% optimization, manual errors → 45% reduction, poor visibility → real-time tracking. What specific challenges are costing you the most right now?"
             
         # Client/case studies inquiries
-        elif any(word in message_lower for word in ['clients', 'customers', 'case studies', 'success stories', 'who uses']):
+        elif hits.any('demo_clients'):
             return f"""PALMS™ serves diverse industries with impressive results:
 
 • **Manufacturing** - 40% faster picking, 60% space optimization
@@ -658,7 +1045,7 @@ Key client achievements:
 What industry are you in? I can share specific success stories relevant to your business."""
         
         # Comparison questions
-        elif any(word in message_lower for word in ['compared to', 'versus', 'vs', 'better than', 'difference']):
+        elif hits.any('demo_comparison'):
             return f"""Great question! Here's how PALMS™ stands out:
 
 • **99.9% Inventory Accuracy** - Industry average is only 63%
@@ -675,7 +1062,7 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
         # Intent clarification for uncertain users
         elif (session.get('message_count', 0) <= 2 and 
               lead_score <= 15 and 
-              not any(word in message_lower for word in ['hello', 'hi', 'what is palms'])):
+              not hits.any('demo_opening')):
             return "I'd love to help you find the right warehouse solution! Are you: ① Just exploring WMS options ② Looking for specific pricing ③ Need help deciding between solutions ④ Ready to book a demo? This helps me provide the most relevant information for your situation."
         
         # Context-aware default responses based on conversation stage
@@ -695,135 +1082,150 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
                 import random
                 return random.choice(responses)
 
-    def get_information_layer_response(self, message, relevant_context):
-        """Layer 1: Information Retrieval - Extract relevant facts from knowledge base"""
+    def get_demo_information(self, message, relevant_context):
+        """Information layer stand-in when the OpenAI client is unavailable"""
+        # Enhanced demo mode to handle full lists
+        if scan_message(message).any('list_request'):
+            return relevant_context  # Return full context for list requests
+        return relevant_context[:1000]  # Larger default slice for demo mode
+
+    def get_cached_extraction(self, message, kb_version, max_tokens):
+        """Look the message up in the semantic cache. Returns (query_embedding, cached_extraction).
+        Only extractions made with the same token budget match: a short general answer must not stand in for a detailed one
+        """
+        # Near-duplicate questions from any visitor reuse an earlier extraction. Only real
+        # embeddings are cached by get_query_embedding, so fallback vectors never match here.
+        query_embedding = self.query_embedding_cache.peek(normalize_query(message))
+        if query_embedding is not None:
+            cached = self.extraction_cache.get(query_embedding, kb_version, max_tokens)
+            if cached is not None:
+                print(f"Information layer served from semantic cache (kb {kb_version}, {max_tokens} tokens)")
+                return query_embedding, cached
+        return query_embedding, None
+
+    def information_flight_key(self, message, relevant_context, max_tokens, kb_version):
+        """Single-flight key: same question, same context, same knowledge base"""
+        context_hash = hashlib.sha256(relevant_context.encode('utf-8')).hexdigest()[:16]
+        return ('information', kb_version, normalize_query(message), context_hash, max_tokens)
+
+    def knowledge_base_note(self):
+        """Slowly changing system message: which knowledge base the facts come from"""
+        return f"Knowledge base version: {self.kb_version}" if self.kb_version else None
+
+    def build_information_messages(self, message, relevant_context):
+        """Messages for the information layer: static instructions, kb version, then context and query"""
+        turn = f"""KNOWLEDGE BASE CONTEXT:
+{relevant_context}
+
+USER QUERY: {message}"""
+        return layered_messages(self.information_instructions, self.knowledge_base_note(), turn)
+
+    @timed('information_layer')
+    def get_information_layer_response(self, message, relevant_context, max_tokens=2000, kb_version=None):
+        """Layer 1: Information Retrieval - Extract relevant facts from knowledge base.
+        kb_version is the knowledge base version relevant_context was retrieved from (default: the current one)
+        """
         if not self.client:
-            # Enhanced demo mode to handle full lists
-            query_lower = message.lower()
-            if any(word in query_lower for word in ['all products', 'all features', 'complete list', 'full list', 'every product', 'every feature']):
-                return relevant_context  # Return full context for list requests
-            return relevant_context[:1000]  # Larger default slice for demo mode
-            
-        try:
-            # Enhanced prompt for complete list handling
-            prompt = f"""
-            {self.retrieval_prompt}
-            
-            KNOWLEDGE BASE CONTEXT:
-            {relevant_context}
-            
-            USER QUERY: {message}
-            
-            SPECIAL INSTRUCTIONS:
-            1. If user asks about "products" or "what products" - extract ONLY product names and one-line descriptions
-            2. If user asks about a SPECIFIC product or asks for "details" or "features" - include ALL details
-            3. For product/feature lists when details are requested, maintain the full hierarchy and all bullet points
-            4. Do not provide detailed features unless specifically asked
-            5. Preserve all technical specifications and metrics when details are requested
-            6. Keep responses concise unless explicitly asked for comprehensive information
-            
-            Extract and return the appropriate level of information based on the user's query.
-            Focus on matching the user's intent - brief overview vs. detailed information.
-            """
+            return self.get_demo_information(message, relevant_context)
+        
+        # Cache under the version the context came from, read before any OpenAI call; a reload meanwhile
+        # must not label an extraction from the old knowledge base as current
+        if kb_version is None:
+            kb_version = self.kb_version
+        query_embedding, cached = self.get_cached_extraction(message, kb_version, max_tokens)
+        if cached is not None:
+            return cached
             
+        def extract():
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",  # Using GPT-4o for better accuracy
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=2000,  # Increased to allow complete product/feature extraction
-                temperature=0.2  # Lower temperature for factual accuracy
+                messages=self.build_information_messages(message, relevant_context),
+                max_tokens=max_tokens,  # Up to 2000 to allow complete product/feature extraction
+                temperature=0.2,  # Lower temperature for factual accuracy
+                **cache_options('information')
             )
+            record_usage("gpt-4o-mini", getattr(response, 'usage', None))
             
-            return response.choices[0].message.content.strip()
+            extracted_info = response.choices[0].message.content.strip()
+            if query_embedding is not None:
+                self.extraction_cache.put(query_embedding, kb_version, extracted_info, max_tokens)
+            return extracted_info
+        
+        try:
+            return self.flights.do(self.information_flight_key(message, relevant_context, max_tokens, kb_version),
+                                   extract)
             
         except Exception as e:
             print(f"Error in information layer: {e}")
             return relevant_context[:500]
 
-    def get_sales_layer_response(self, message, extracted_info, session):
-        """Layer 2: Sales Conversation - Context-aware sales interaction"""
-        conversation_history = session.get('conversation_history', [])[-8:]  # Last 4 exchanges
+    def build_sales_messages(self, message, extracted_info, session):
+        """Messages for the sales layer (shared by the blocking and streaming paths).
+        History comes first in the turn message: it only grows within a chat, so it extends the cached prefix
+        """
         lead_score = session.get('lead_score', 0)
         stage = session.get('stage', 'greeting')
         
-        # Build conversation context
-        context_summary = ""
-        if len(conversation_history) >= 2:
-            context_summary = "Previous conversation topics: "
-            for i in range(0, len(conversation_history)-1, 2):
-                if i+1 < len(conversation_history):
-                    context_summary += f"User asked about: {conversation_history[i]['content'][:50]}... "
+        # Build conversation context (bounded by HISTORY_TOKEN_BUDGET however long the chat runs)
+        history_summary, recent_history = self.conversation_window.render(session)
+        
+        turn = f"""CONVERSATION CONTEXT:
+- Earlier conversation (summary): {history_summary or 'None'}
+- Recent conversation:
+{recent_history or 'First interaction'}
+
+EXTRACTED PALMS™ INFORMATION:
+{extracted_info}
+
+LEAD STATE:
+- Lead Score: {lead_score}/100
+- Lead Stage: {stage}
+- Demo declined: {session.get('demo_declined', False)}
+
+CURRENT USER MESSAGE: {message}"""
+        return layered_messages(self.sales_instructions, self.knowledge_base_note(), turn)
+
+    def summarize_conversation(self, summary, messages):
+        """Fold messages into the rolling conversation summary"""
+        if not self.client:
+            return fallback_summary(summary, messages)
+        
+        transcript = ''.join(render_message(message) for message in messages)
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain a running summary of a sales chat about PALMS™ warehouse management. "
+                    "Merge the new messages into the summary. Keep the visitor's needs, company details, "
+                    "objections, products discussed and any demo/pricing requests. "
+                    f"At most {HISTORY_SUMMARY_MAX_TOKENS // 2} words, no preamble."
+                )},
+                {"role": "user", "content": f"Current summary: {summary or 'None'}\n\nNew messages:\n{transcript}"}
+            ],
+            max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+            temperature=0.2
+        )
+        record_usage("gpt-4o-mini", getattr(response, 'usage', None))
+        return response.choices[0].message.content.strip()
+
+    @timed('sales_layer')
+    def get_sales_layer_response(self, message, extracted_info, session, max_tokens=1500):
+        """Layer 2: Sales Conversation - Context-aware sales interaction"""
+        lead_score = session.get('lead_score', 0)
+        stage = session.get('stage', 'greeting')
         
         if not self.client:
             return self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
             
         try:
-            prompt = f"""
-            {self.sales_prompt}
-            
-            EXTRACTED PALMS™ INFORMATION:
-            {extracted_info}
-            
-            CONVERSATION CONTEXT:
-            - Lead Score: {lead_score}/100
-            - Lead Stage: {stage}
-            - {context_summary}
-            - Full conversation: {json.dumps(conversation_history[-6:]) if conversation_history else 'First interaction'}
-            
-            CURRENT USER MESSAGE: {message}
-            
-            RESPONSE GUIDELINES - SMART LENGTH CONTROL:
-            
-            **CRITICAL: Read the user's question carefully to determine desired detail level**
-            
-            1. General questions ("tell me about features", "what can palms do"):
-               - Give 2-3 sentence overview highlighting TOP 3-4 capabilities only
-               - Example: "PALMS™ offers comprehensive WMS capabilities including real-time inventory tracking, automated order processing, and AI-driven space optimization. We also provide mobile solutions, 3PL management, and advanced analytics. Which area interests you most?"
-            
-            2. Product list questions ("what products", "list products"):
-               - Show ONLY product names with ONE-LINE descriptions using bullet points
-               - Maximum 8-9 products with brief tags
-            
-            3. Specific product questions ("tell me about WMS", "what is 3PL"):
-               - Provide 4-5 lines max with key benefits
-               - Focus on value, not feature lists
-            
-            4. Detailed feature requests ("show all WMS features", "comprehensive features", "full feature list"):
-               - ONLY THEN provide complete feature lists with categories
-               - Use bullet points organized by category
-            
-            5. Always ask a follow-up question to understand what they really need
-            
-            6. Respect demo decline status: {session.get('demo_declined', False)}
-            
-            FORMATTING REQUIREMENTS:
-            - Use bullet points (•) for lists, never numbered lists
-            - DO NOT use ### headers or markdown headers - just use **bold text** for emphasis
-            - Keep responses SHORT unless explicitly asked for comprehensive details
-            - Maximum response length: 6-8 lines for general questions
-            - Be conversational and direct
-            
-            INTENT IDENTIFICATION (use when appropriate):
-            If user seems uncertain or new, offer: "Are you just exploring or looking for something specific today?"
-            ① Just exploring → Overview + key benefits + ask about challenges
-            ② Looking for pricing → Understand requirements + discuss pricing
-            ③Need help deciding → Qualifying questions + recommendations  
-            ④Want to book demo → Capture details + schedule
-            
-            Generate a compelling, context-aware sales response:
-            """
-            
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",  # Using GPT-4o for better context understanding
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=1500,  # Increased to allow complete product/feature lists
-                temperature=0.7
+                messages=self.build_sales_messages(message, extracted_info, session),
+                max_tokens=max_tokens,  # Up to 1500 to allow complete product/feature lists
+                temperature=0.7,
+                **cache_options('sales')
             )
+            record_usage("gpt-4o-mini", getattr(response, 'usage', None))
             
             return response.choices[0].message.content.strip()
             
@@ -831,49 +1233,85 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
             print(f"Error in sales layer: {e}")
             return self.get_demo_response(message, extracted_info, lead_score, stage)
 
+    @timed('sales_layer')
+    def stream_sales_layer_response(self, message, extracted_info, session, max_tokens=1500):
+        """Layer 2 with stream=True: yields text deltas as the model generates them"""
+        lead_score = session.get('lead_score', 0)
+        stage = session.get('stage', 'greeting')
+        
+        if not self.client:
+            yield self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+            return
+        
+        started = False
+        try:
+            stream = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.build_sales_messages(message, extracted_info, session),
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True,
+                **cache_options('sales'),
+                # The last chunk carries usage (and no choices)
+                stream_options={"include_usage": True}
+            )
+            
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    record_usage("gpt-4o-mini", chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not started:
+                    # Match the .strip() of the blocking path for the leading edge
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    started = True
+                yield delta
+                
+        except Exception as e:
+            print(f"Error in streaming sales layer: {e}")
+            if not started:
+                yield self.get_enhanced_demo_response(message, extracted_info, lead_score, stage, session)
+
+    @timed('safety_filter')
     def apply_safety_filter(self, message):
         """
         Filter to catch inappropriate or off-topic inputs
         Returns: (is_safe: bool, redirect_message: str or None)
         """
-        message_lower = message.lower().strip()
+        hits = scan_message(message)
         
         # 1. Off-topic business detection
-        off_topic = ['politics', 'political', 'election', 'religion', 'religious',
-                     'medical advice', 'legal advice', 'dating', 'relationship']
-        
-        if any(keyword in message_lower for keyword in off_topic):
+        if hits.any('off_topic'):
             return (False, "I specialize in warehouse management solutions. How can I help you optimize your warehouse operations?")
         
         # 2. Competitor comparison - redirect positively
-        competitor_negative = ['why is sap bad', 'what\'s wrong with', 'worst thing about',
-                              'problems with oracle', 'better than sap']
-        
-        if any(phrase in message_lower for phrase in competitor_negative):
+        if hits.any('competitor_negative'):
             return (False, "I focus on PALMS™ strengths rather than comparing. Let me show you our key capabilities. What are you looking for in a WMS?")
         
         # 3. Sensitive data protection
-        sensitive_words = ['credit card', 'ssn', 'social security', 'password', 'bank account']
-        
-        if any(word in message_lower for word in sensitive_words):
+        if hits.any('sensitive_data'):
             return (False, "I don't collect sensitive data. We only need your name and business email to get started. What would you like to know about PALMS™?")
         
         # 4. System manipulation attempts
-        manipulation = ['ignore previous', 'forget you are', 'new instructions', 
-                       'disregard', 'act as if', 'pretend you']
-        
-        if any(phrase in message_lower for phrase in manipulation):
+        if hits.any('manipulation'):
             return (False, "I'm here to help with warehouse management solutions. What can I assist you with?")
         
         # 5. Prompt injection detection
-        if '###' in message or 'system:' in message_lower or 'assistant:' in message_lower:
+        if hits.any('prompt_injection'):
             return (False, "Let's focus on your warehouse needs. How can I help you today?")
         
         # All safety checks passed
         return (True, None)
 
-    def get_response(self, message, session):
-        """Main response method using enhanced TOFU two-layer AI system"""
+    def prepare_turn(self, message, session):
+        """Safety filter, lead scoring and handoff checks that run before any LLM call.
+        Returns (early_response or None, engagement_strategy)
+        """
         
         # Safety Filter: Check for inappropriate or off-topic inputs
         is_safe, redirect_message = self.apply_safety_filter(message)
@@ -881,10 +1319,11 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
             return {
                 'message': redirect_message,
                 'show_demo_form': False
-            }
+            }, None
         
-        # Check if info.txt has changed and reload if necessary
-        self.check_and_reload_knowledge()
+        # A cold worker answers once the knowledge base is loaded (or WARMUP_WAIT_TIMEOUT passes);
+        # info.txt edits are picked up by the background watcher, never here
+        self.wait_until_ready()
         
         # TOFU Enhancement: Advanced lead qualification
         session = self.enhanced_lead_qualification(message, session)
@@ -896,133 +1335,168 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
         engagement_strategy = self.get_tofu_engagement_strategy(session)
         
         # Check if user is asking for human handoff
-        if any(phrase in message.lower() for phrase in ['human', 'person', 'agent', 'representative', 'speak to someone']):
+        if scan_message(message).any('human_handoff'):
             return {
                 'message': "I'd be happy to connect you with our sales team! Please fill out the demo form below and our experts will reach out within 24 hours to provide personalized assistance.",
                 'show_demo_form': True
+            }, engagement_strategy
+        
+        return None, engagement_strategy
+
+    def get_tofu_override(self, message, session, engagement_strategy):
+        """Canned TOFU next-step reply that replaces the LLM answer, or None"""
+        # TOFU Enhancement: Only add conversation flow for next-step questions, not content questions
+        # Don't override when user is asking about features, company info, pricing details, etc.
+        is_content_question = scan_message(message).any('content_question')
+        
+        if not is_content_question:
+            tofu_response = self.get_tofu_conversation_flow(message, session, engagement_strategy)
+            if tofu_response and engagement_strategy in ['direct_sales', 'nurture_warm']:
+                # Only enhance with TOFU for next-step conversations
+                return tofu_response
+        return None
+
+    def finalize_response(self, message, session, bot_message, engagement_strategy):
+        """Demo-form detection and the response payload, once the bot message is known"""
+        # Only show demo form if user explicitly requests a demo or call
+        hits = scan_message(message)
+        
+        # Check for explicit demo requests (more specific matching)
+        show_demo_form = hits.any('demo_form_request')
+        
+        # Also check for "yes" responses only if the bot recently asked about demo
+        if not show_demo_form and hits.any('affirmative'):
+            # Check if the conversation context suggests this is a demo response
+            recent_context = ' '.join([msg['content'] for msg in session.get('conversation_history', [])[-3:]])
+            if 'demo' in recent_context.lower() or 'demonstration' in recent_context.lower():
+                show_demo_form = True
+        
+        # Track negative demo responses to avoid future prompts
+        has_negative_intent = hits.any('negative_demo')
+        if has_negative_intent:
+            session['demo_declined'] = True
+            show_demo_form = False
+        
+        return {
+            'message': bot_message,
+            'show_demo_form': show_demo_form,
+            'tofu_data': {
+                'engagement_strategy': engagement_strategy,
+                'lead_score': session.get('lead_score', 0),
+                'qualification_signals': session.get('qualification_signals', []),
+                'touch_count': session.get('touch_count', 0)
             }
+        }
+
+    def get_error_response(self):
+        return {
+            'message': "I'm experiencing a technical issue right now. Please try asking your question again, or feel free to contact our sales team directly at sales@onpalms.com for immediate assistance.",
+            'show_demo_form': False
+        }
+
+    def plan_turn(self, message, session, engagement_strategy):
+        """Route the turn and run everything before the sales layer.
+        Returns (decision, extracted_info); canned decisions carry their reply in decision.canned_message
+        """
+        tofu_response = self.get_tofu_override(message, session, engagement_strategy)
+        decision = self.router.route(message, session, tofu_response)
+        extracted_info = ""
         
-        try:
+        if decision.needs_retrieval:
             # Layer 1: Retrieve relevant context from knowledge base
-            relevant_context = self.retrieve_relevant_context(message)
-            
-            # Layer 1: Extract specific information using AI
-            extracted_info = self.get_information_layer_response(message, relevant_context)
-            
-            # Layer 2: Generate context-aware sales response
-            bot_message = self.get_sales_layer_response(message, extracted_info, session)
-            
-            # TOFU Enhancement: Only add conversation flow for next-step questions, not content questions
-            # Don't override when user is asking about features, company info, pricing details, etc.
-            is_content_question = any(keyword in message.lower() for keyword in [
-                'what', 'how', 'why', 'tell me', 'explain', 'about', 'feature', 'price', 
-                'cost', 'company', 'product', 'integration', 'works', 'does', 'can it',
-                'mobile', 'industry', 'clients', 'case', 'benefit', 'problem', 'challenge'
-            ])
-            
-            if not is_content_question:
-                tofu_response = self.get_tofu_conversation_flow(message, session, engagement_strategy)
-                if tofu_response and engagement_strategy in ['direct_sales', 'nurture_warm']:
-                    # Only enhance with TOFU for next-step conversations
-                    bot_message = tofu_response
+            kb_version = self.kb_version
+            documents, distances, lexical_only = self.retrieve_relevant_chunks(message)
+            decision = self.router.route_with_context(message, decision, distances, lexical_only)
+            
+            if decision.path == ROUTE_SINGLE_CALL:
+                # The top chunks answer the question; skip the information layer
+                extracted_info, _ = self.context_packer.pack(
+                    documents, distances, decision.context_max_tokens, self.router.direct_chunks, '\n\n')
+            else:
+                # Layer 1: Extract specific information using AI
+                relevant_context, _ = self.context_packer.pack(documents, distances, decision.context_max_tokens)
+                print(f"Retrieved {len(relevant_context)} characters of context for query: {message[:50]}...")
+                extracted_info = self.get_information_layer_response(
+                    message, relevant_context, max_tokens=decision.info_max_tokens, kb_version=kb_version)
+        
+        self.router.record(decision)
+        return decision, extracted_info
+
+    def get_response(self, message, session):
+        """Main response method using enhanced TOFU two-layer AI system"""
+        early_response, engagement_strategy = self.prepare_turn(message, session)
+        if early_response:
+            return early_response
+        
+        try:
+            decision, extracted_info = self.plan_turn(message, session, engagement_strategy)
             
-            # Only show demo form if user explicitly requests a demo or call
-            demo_request_phrases = [
-                'demo', 'schedule demo', 'book demo', 'show me demo', 'see demo', 'want demo', 
-                'i want a demo', 'i would like a demo', 'can i get a demo', 'request demo', 
-                'try demo', 'demo please', 'demonstration', 'book a demo', 'schedule a demo',
-                'sign up for demo', 'get a demo', 'demo session', 'product demo', 'live demo',
-                # Call-related phrases that should also trigger demo form
-                'book a call', 'schedule a call', 'book call', 'schedule call', 'want a call',
-                'request a call', 'call me', 'phone call', 'sales call', 'consultation call',
-                'speak with someone', 'talk to sales', 'contact sales', 'sales consultation',
-                'schedule consultation', 'book consultation', 'arrange a call', 'set up a call'
-            ]
-            message_lower = message.lower()
+            if decision.path == ROUTE_CANNED:
+                bot_message = decision.canned_message
+            else:
+                # Layer 2: Generate context-aware sales response
+                bot_message = self.get_sales_layer_response(
+                    message, extracted_info, session, max_tokens=decision.sales_max_tokens)
             
-            # Check for explicit demo requests (more specific matching)
-            show_demo_form = False
-            for phrase in demo_request_phrases:
-                if phrase in message_lower:
-                    show_demo_form = True
-                    break
+            return self.finalize_response(message, session, bot_message, engagement_strategy)
             
-            # Also check for "yes" responses only if the bot recently asked about demo
-            if not show_demo_form and 'yes' in message_lower:
-                # Check if the conversation context suggests this is a demo response
-                recent_context = ' '.join([msg['content'] for msg in session.get('conversation_history', [])[-3:]])
-                if 'demo' in recent_context.lower() or 'demonstration' in recent_context.lower():
-                    show_demo_form = True
+        except Exception as e:
+            print(f"Error in get_response: {e}")
+            return self.get_error_response()
+
+    def stream_response(self, message, session):
+        """Streaming variant of get_response.
+        Yields ('token', text) events while the sales layer generates, then one ('done', response)
+        event with the same payload get_response would have returned
+        """
+        early_response, engagement_strategy = self.prepare_turn(message, session)
+        if early_response:
+            yield 'token', early_response['message']
+            yield 'done', early_response
+            return
+        
+        parts = []
+        try:
+            decision, extracted_info = self.plan_turn(message, session, engagement_strategy)
+            if decision.path == ROUTE_CANNED:
+                tokens = [decision.canned_message]
+            else:
+                tokens = self.stream_sales_layer_response(
+                    message, extracted_info, session, max_tokens=decision.sales_max_tokens)
             
-            # Track negative demo responses to avoid future prompts
-            negative_demo_words = ['no demo', 'not interested', 'do not want', "don't want", 'no thanks', 
-                                 'not now', 'maybe later', 'not ready', 'just browsing', 'just looking',
-                                 'decline', 'pass', 'skip demo', 'no need', 'not necessary']
-            has_negative_intent = any(phrase in message_lower for phrase in negative_demo_words)
-            if has_negative_intent:
-                session['demo_declined'] = True
-                show_demo_form = False
+            for token in tokens:
+                parts.append(token)
+                yield 'token', token
             
-            return {
-                'message': bot_message,
-                'show_demo_form': show_demo_form,
-                'tofu_data': {
-                    'engagement_strategy': engagement_strategy,
-                    'lead_score': session.get('lead_score', 0),
-                    'qualification_signals': session.get('qualification_signals', []),
-                    'touch_count': session.get('touch_count', 0)
-                }
-            }
+            yield 'done', self.finalize_response(message, session, ''.join(parts).strip(), engagement_strategy)
             
         except Exception as e:
-            print(f"Error in get_response: {e}")
-            return {
-                'message': "I'm experiencing a technical issue right now. Please try asking your question again, or feel free to contact our sales team directly at sales@onpalms.com for immediate assistance.",
-                'show_demo_form': False
-            }
-    
+            print(f"Error in stream_response: {e}")
+            if parts:
+                # Keep whatever the visitor has already seen
+                yield 'done', self.finalize_response(message, session, ''.join(parts).strip(), engagement_strategy)
+            else:
+                response = self.get_error_response()
+                yield 'token', response['message']
+                yield 'done', response
+
     # TOFU Enhancement Methods
     def enhanced_lead_qualification(self, message, session):
         """Enhanced TOFU-based lead qualification"""
-        message_lower = message.lower()
-        
-        # TOFU Qualification Criteria
-        qualification_signals = {
-            'intent_signals': {
-                'high': ['need solution', 'looking for', 'evaluating', 'budget approved', 'decision maker', 'procurement'],
-                'medium': ['interested in', 'want to know', 'considering', 'exploring options'],
-                'low': ['just curious', 'browsing', 'maybe later', 'just looking']
-            },
-            'authority_signals': {
-                'high': ['ceo', 'cto', 'warehouse manager', 'operations director', 'procurement manager'],
-                'medium': ['supervisor', 'team lead', 'analyst', 'coordinator'],
-                'low': ['intern', 'student', 'researcher']
-            },
-            'timeline_signals': {
-                'urgent': ['asap', 'immediately', 'this quarter', 'next month'],
-                'near_term': ['in 3 months', 'this year', 'soon'],
-                'long_term': ['next year', 'future', 'someday']
-            },
-            'budget_signals': {
-                'confirmed': ['budget approved', 'funds allocated', 'ready to purchase'],
-                'exploring': ['budget planning', 'cost analysis', 'roi calculation'],
-                'unclear': ['just researching', 'preliminary']
-            }
-        }
-        
-        # Calculate enhanced qualification score
-        for category, signals in qualification_signals.items():
-            for level, keywords in signals.items():
-                for keyword in keywords:
-                    if keyword in message_lower:
-                        if level == 'high' or level == 'urgent' or level == 'confirmed':
-                            session['lead_score'] = session.get('lead_score', 0) + 25
-                            session['qualification_signals'] = session.get('qualification_signals', [])
-                            session['qualification_signals'].append(f"{category}_{level}")
-                        elif level == 'medium' or level == 'near_term' or level == 'exploring':
-                            session['lead_score'] = session.get('lead_score', 0) + 15
-                        else:
-                            session['lead_score'] = session.get('lead_score', 0) + 5
+        hits = scan_message(message)
+        
+        # Calculate enhanced qualification score (criteria in keyword_matcher.QUALIFICATION_SIGNALS)
+        for category, signals in QUALIFICATION_SIGNALS.items():
+            for level in signals:
+                for keyword in hits.matched(f'{category}:{level}'):
+                    if level == 'high' or level == 'urgent' or level == 'confirmed':
+                        session['lead_score'] = session.get('lead_score', 0) + 25
+                        session['qualification_signals'] = session.get('qualification_signals', [])
+                        session['qualification_signals'].append(f"{category}_{level}")
+                    elif level == 'medium' or level == 'near_term' or level == 'exploring':
+                        session['lead_score'] = session.get('lead_score', 0) + 15
+                    else:
+                        session['lead_score'] = session.get('lead_score', 0) + 5
         
         return session
 
@@ -1045,13 +1519,8 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
         
         # Only provide TOFU responses for general inquiries or next-step questions
         # Not for specific content questions
-        message_lower = message.lower()
-        
         # Check if this is a next-step type question
-        is_next_step_question = any(phrase in message_lower for phrase in [
-            'what now', 'next step', 'what should', 'how do i proceed', 
-            'what do you recommend', 'ready to move', 'lets go', "let's proceed"
-        ])
+        is_next_step_question = scan_message(message).any('next_step_question')
         
         if not is_next_step_question:
             return None  # Let the main AI response handle content questions
@@ -1178,29 +1647,3 @@ Are you currently evaluating other WMS solutions? I can do a detailed comparison
         response += "\n\nWould you like me to explain any specific aspect in more detail?"
         
         return response
-
-    def check_and_reload_knowledge(self):
-        """Check if info.txt has changed and reload if necessary"""
-        try:
-            info_file_path = 'info.txt'
-            if not os.path.exists(info_file_path):
-                print(f"Warning: {info_file_path} not found")
-                return False
-                
-            # Get current file modification time
-            current_mtime = os.path.getmtime(info_file_path)
-            
-            # Compare with stored mtime
-            last_mtime = getattr(self, '_last_info_mtime', None)
-            
-            if last_mtime is None or current_mtime > last_mtime:
-                print("info.txt has changed, reloading knowledge base...")
-                self._last_info_mtime = current_mtime
-                self.load_knowledge_base(force_reload=True)
-                return True
-            
-            return False
-            
-        except Exception as e:
-            print(f"Error checking knowledge base changes: {e}")
-            return False
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Token-budgeted context packing for the information layer.
+Retrieved chunks are filtered by vector distance, re-ranked with maximal marginal relevance (MMR) so
+overlapping chunks (the 200-word section overlaps, repeated integration lists, ...) don't crowd out
+different material, near-duplicates are dropped, and the rest is packed greedily until the token budget
+is spent. Similarity between chunks is term-set overlap, so BM25-only hits need no embedding
+"""
+
+import os
+import threading
+from conversation_window import count_tokens
+from lexical_index import tokenize
+
+# Tokens of knowledge base text per information-layer prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '2500'))
+# Chunks further than this (squared L2, 2 - 2*cosine) are dropped; BM25-only hits have no distance and are kept
+CONTEXT_MAX_DISTANCE = float(os.getenv('CONTEXT_MAX_DISTANCE', '1.5'))
+# MMR trade-off: 1.0 = relevance only, 0.0 = diversity only
+CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))
+# A chunk sharing at least this share of its terms (Jaccard) with one already packed is a duplicate
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv('CONTEXT_DUPLICATE_SIMILARITY', '0.8'))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    """Distance filter + MMR + greedy token packing, with running totals of the tokens it saved"""
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, max_distance=CONTEXT_MAX_DISTANCE,
+                 mmr_lambda=CONTEXT_MMR_LAMBDA, duplicate_similarity=CONTEXT_DUPLICATE_SIMILARITY):
+        self.token_budget = token_budget
+        self.max_distance = max_distance
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_similarity = duplicate_similarity
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._tokens_retrieved = 0
+        self._tokens_packed = 0
+
+    def pack(self, documents, distances=None, token_budget=None, max_chunks=None, separator=' '):
+        """Join the chosen chunks in MMR order; returns (text, report)"""
+        budget = token_budget or self.token_budget
+        distances = list(distances or [])
+        distances += [None] * (len(documents) - len(distances))
+
+        candidates = []
+        for rank, (document, distance) in enumerate(zip(documents, distances)):
+            if distance is not None and distance > self.max_distance:
+                continue
+            candidates.append({
+                'document': document,
+                # Position in the (fused) ranking, best = 1.0
+                'relevance': 1.0 - rank / max(1, len(documents)),
+                'terms': set(tokenize(document)),
+                'tokens': count_tokens(document)
+            })
+        dropped = len(documents) - len(candidates)
+
+        chosen = []
+        used = 0
+        duplicates = 0
+        while candidates and (max_chunks is None or len(chosen) < max_chunks):
+            best = max(candidates, key=lambda candidate: self.mmr_score(candidate, chosen))
+            candidates.remove(best)
+            if best['redundancy'] >= self.duplicate_similarity:
+                duplicates += 1
+                continue
+            if used + best['tokens'] > budget:
+                if not chosen:
+                    # Nothing fits yet: keep the head of the best chunk rather than send no context
+                    best['document'] = best['document'][:budget * 4]
+                    best['tokens'] = count_tokens(best['document'])
+                else:
+                    continue
+            chosen.append(best)
+            used += best['tokens']
+
+        tokens_retrieved = sum(count_tokens(document) for document in documents)
+        report = {
+            'chunks_retrieved': len(documents),
+            'chunks_dropped_by_distance': dropped,
+            'chunks_dropped_as_duplicates': duplicates,
+            'chunks_packed': len(chosen),
+            'tokens_retrieved': tokens_retrieved,
+            'tokens_packed': used,
+            'tokens_saved': max(0, tokens_retrieved - used)
+        }
+        with self._lock:
+            self._requests += 1
+            self._tokens_retrieved += tokens_retrieved
+            self._tokens_packed += used
+        print(f"Context packed: {len(chosen)}/{len(documents)} chunks, {used} tokens "
+              f"(saved {report['tokens_saved']}, budget {budget})")
+        return separator.join(candidate['document'] for candidate in chosen), report
+
+    def mmr_score(self, candidate, chosen):
+        candidate['redundancy'] = max((jaccard(candidate['terms'], other['terms']) for other in chosen), default=0.0)
+        return self.mmr_lambda * candidate['relevance'] - (1 - self.mmr_lambda) * candidate['redundancy']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'tokens_retrieved': self._tokens_retrieved,
+                'tokens_packed': self._tokens_packed,
+                'tokens_saved': self._tokens_retrieved - self._tokens_packed
+            }
@@ -0,0 +1,201 @@
+"""
+Token-aware conversation history for the sales layer prompt.
+The most recent messages are kept verbatim up to HISTORY_TOKEN_BUDGET tokens; when the window
+overflows, the oldest messages are folded into a rolling summary stored on the session, so the
+prompt stays the same size however long the chat runs.
+
+Everything lives under session['history_window'] (plain JSON, so it survives the session store):
+    summary     rolling summary of every folded message
+    summarized  how many conversation_history messages the summary covers
+    text        rendered window (messages after `summarized`), extended incrementally
+    spans       [chars, tokens] per rendered message, used to cut `text` when folding
+    base        last summary from the summarizer; `summary` is base plus an extractive note of `pending`
+    pending     folded messages the summarizer hasn't merged into `base` yet
+    job         id of the background summarization covering `pending`
+
+Folding never waits on the summarizer: the folded messages go into `summary` via fallback_summary
+straight away and an LLM summary is computed on a background thread, picked up by the next update().
+A job started by another worker (or lost on restart) is simply started again here.
+
+Indices are absolute. A bounded history (session_state.HistoryBuffer) evicts its oldest messages and
+reports the first one it still holds as `first_index`: messages evicted after they were rendered are
+summarized from their rendered line, and ones evicted before the window saw them get an empty span.
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_cache import TTLCache
+
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '600'))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv('HISTORY_SUMMARY_MAX_TOKENS', '200'))
+# Long replies (e.g. full feature lists) are clipped so one message can't take over the window
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv('HISTORY_MESSAGE_MAX_TOKENS', '250'))
+HISTORY_SUMMARY_WORKERS = int(os.getenv('HISTORY_SUMMARY_WORKERS', '2'))
+# Finished summaries wait this long for the session's next turn before being dropped
+HISTORY_SUMMARY_RESULT_TTL = int(os.getenv('HISTORY_SUMMARY_RESULT_TTL', '3600'))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('o200k_base')
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Token count for gpt-4o-mini (tiktoken if installed, else the ~4 characters per token rule)"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def render_message(message, max_tokens=HISTORY_MESSAGE_MAX_TOKENS):
+    role = 'User' if message.get('role') == 'user' else 'Assistant'
+    content = ' '.join(str(message.get('content', '')).split())
+    line = f"{role}: {content}\n"
+    if count_tokens(line) > max_tokens:
+        line = f"{role}: {content[:max_tokens * 4 - 20].rstrip()}...\n"
+    return line
+
+
+def truncate_tokens(text, max_tokens):
+    """text cut to at most max_tokens tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max(max_tokens - 1, 0)]).rstrip() + '...'
+    return text[:max(max_tokens * 4 - 3, 0)].rstrip() + '...'
+
+
+def fallback_summary(summary, messages, max_tokens=HISTORY_SUMMARY_MAX_TOKENS):
+    """Extractive summary for when no LLM is available: the visitor's questions appended to summary.
+    The oldest new questions are dropped first; if even the newest doesn't fit, summary itself is cut
+    """
+    topics = [' '.join(m['content'].split())[:80] for m in messages if m.get('role') == 'user']
+    if not topics:
+        return truncate_tokens(summary, max_tokens)
+    head = summary + '; ' if summary else 'Visitor asked about: '
+    while len(topics) > 1 and count_tokens(head + '; '.join(topics)) > max_tokens:
+        topics.pop(0)
+    tail = '; '.join(topics)
+    if summary and count_tokens(head + tail) > max_tokens:
+        head = truncate_tokens(summary, max(max_tokens - count_tokens('; ' + tail), 0)) + '; '
+    return truncate_tokens(head + tail, max_tokens)
+
+
+def parse_rendered(line):
+    """A rendered window line back as a message"""
+    role, _, content = line.partition(': ')
+    return {'role': 'user' if role == 'User' else 'assistant', 'content': content.strip()}
+
+
+class ConversationWindow:
+    """Keeps session['history_window'] up to date. summarize(summary, messages) -> new summary"""
+
+    def __init__(self, summarize=None, token_budget=HISTORY_TOKEN_BUDGET):
+        self.summarize = summarize or fallback_summary
+        self.token_budget = token_budget
+        # Threads are only started on the first submit, so creating this before a fork is safe
+        self.executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix='history-summary')
+        self.jobs = TTLCache(10000, HISTORY_SUMMARY_RESULT_TTL)
+
+    def update(self, session):
+        """Render new messages into the window, folding the oldest into the summary on overflow"""
+        history = session.get('conversation_history', [])
+        state = session.get('history_window')
+        if not state or state['summarized'] + len(state['spans']) > len(history):
+            # New session, or the history was replaced underneath us
+            state = {'summary': '', 'summarized': 0, 'text': '', 'spans': []}
+            session['history_window'] = state
+        self.collect_summary(state)
+
+        first = getattr(history, 'first_index', 0)
+        rendered = state['summarized'] + len(state['spans'])
+        if rendered < first:
+            # Evicted before this window ever saw them: empty spans keep the indices absolute
+            print(f"⚠️ {first - rendered} messages left the history before they could be summarized")
+            state['spans'].extend([0, 0] for _ in range(first - rendered))
+            rendered = first
+
+        for message in history[rendered:]:
+            line = render_message(message)
+            state['text'] += line
+            state['spans'].append([len(line), count_tokens(line)])
+
+        total = sum(tokens for _, tokens in state['spans'])
+        if total <= self.token_budget:
+            return state
+
+        # Fold down to half the budget, so the summarizer runs every few turns rather than every turn
+        fold = 0
+        while fold < len(state['spans']) - 1 and total > self.token_budget // 2:
+            total -= state['spans'][fold][1]
+            fold += 1
+
+        folded = self.folded_messages(history, state, fold)
+        state['summary'] = fallback_summary(state['summary'], folded)
+        if self.summarize is not fallback_summary:
+            state.setdefault('base', '')
+            state.setdefault('pending', []).extend(
+                {'role': m.get('role'), 'content': str(m.get('content', ''))} for m in folded)
+            self.schedule_summary(state)
+
+        cut = sum(chars for chars, _ in state['spans'][:fold])
+        state['text'] = state['text'][cut:]
+        state['spans'] = state['spans'][fold:]
+        state['summarized'] += fold
+        print(f"🗜️ Folded {fold} messages into the conversation summary ({total} tokens left in window)")
+        return state
+
+    def schedule_summary(self, state):
+        """Summarize `pending` on the background executor unless that job is already running in this process"""
+        if not state.get('pending') or (state.get('job') and self.jobs.peek(state['job']) is not None):
+            return
+        job = uuid.uuid4().hex
+        pending = list(state['pending'])
+        try:
+            self.jobs.put(job, (len(pending), self.executor.submit(self.summarize, state['base'], pending)))
+            state['job'] = job
+        except Exception as e:
+            print(f"Error scheduling conversation summary: {e}")
+
+    def collect_summary(self, state):
+        """Apply a finished background summary: it replaces the extractive note for the messages it covers"""
+        entry = state.get('job') and self.jobs.peek(state['job'])
+        if not entry:
+            # Started by another worker, or never started: run it here
+            self.schedule_summary(state)
+            return
+        if not entry[1].done():
+            return
+        count, future = entry
+        self.jobs.put(state['job'], None)
+        state['job'] = None
+        try:
+            state['base'] = future.result()
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            state['base'] = fallback_summary(state['base'], state['pending'][:count])
+        state['pending'] = state['pending'][count:]
+        state['summary'] = fallback_summary(state['base'], state['pending'])
+        self.schedule_summary(state)
+
+    def folded_messages(self, history, state, fold):
+        """The oldest `fold` messages of the window; ones the history no longer holds come from their rendered line"""
+        first = getattr(history, 'first_index', 0)
+        messages = []
+        offset = 0
+        for position, (chars, _) in enumerate(state['spans'][:fold]):
+            index = state['summarized'] + position
+            if index >= first:
+                messages.append(history[index])
+            elif chars:
+                messages.append(parse_rendered(state['text'][offset:offset + chars]))
+            offset += chars
+        return messages
+
+    def render(self, session):
+        """(summary, recent messages) for the prompt"""
+        state = self.update(session)
+        return state['summary'], state['text'].rstrip('\n')
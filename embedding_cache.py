@@ -0,0 +1,188 @@
+"""
+Persistent, content-addressed embedding cache.
+Entries are keyed by (model, dimensions, sha256 of the text) so only new or edited text is sent to OpenAI
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', './chroma_db/embedding_cache.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '50000'))
+# last_used is only rewritten once it is this many seconds old, so a cache hit is normally a pure read
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv('EMBEDDING_CACHE_TOUCH_INTERVAL', '3600'))
+
+
+def text_hash(text):
+    """Content address for a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with least-recently-used eviction above max_entries"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 touch_interval=EMBEDDING_CACHE_TOUCH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared by all threads, serialised with the lock; WAL lets other processes read meanwhile
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get(self, text, model, dimensions=None):
+        """Cached embedding for text, or None"""
+        return self.get_many([text], model, dimensions).get(text_hash(text))
+
+    def get_many(self, texts, model, dimensions=None):
+        """Cached embeddings for texts as {text_hash: vector}; misses are simply absent"""
+        hashes = list({text_hash(text) for text in texts})
+        found = {}
+        if not hashes:
+            return found
+        now = time.time()
+        stale = []
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector, last_used FROM embeddings "
+                    f"WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    [model, dimensions or 0] + part
+                ).fetchall()
+                for row_hash, blob, last_used in rows:
+                    found[row_hash] = array('f', blob).tolist()
+                    if now - last_used >= self.touch_interval:
+                        stale.append(row_hash)
+            # LRU eviction only needs last_used to within touch_interval
+            if stale:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                    [(now, model, dimensions or 0, row_hash) for row_hash in stale]
+                )
+                self._conn.commit()
+        return found
+
+    def put(self, text, vector, model, dimensions=None):
+        self.put_many([(text, vector)], model, dimensions)
+
+    def put_many(self, items, model, dimensions=None):
+        """Store (text, vector) pairs, then evict the least recently used entries past max_entries"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, dimensions or 0, text_hash(text), array('f', vector).tobytes(), now)
+            for text, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+
+# Retrieved chunks per (knowledge base version, query); mostly filled by /chat/prefetch while the visitor types
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '512'))
+RETRIEVAL_CACHE_TTL = float(os.getenv('RETRIEVAL_CACHE_TTL', '300'))
+
+
+def normalize_query(query):
+    """Cache key for a user query: case, surrounding punctuation and extra whitespace don't matter"""
+    return ' '.join(query.lower().split()).strip(' ?!.,')
+
+
+class TTLCache:
+    """Bounded in-process LRU cache with a TTL and hit/miss counters (query embeddings, retrieval results)"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def peek(self, key):
+        """Like get, but without touching the counters or LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                return entry[1]
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
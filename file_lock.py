@@ -0,0 +1,49 @@
+"""
+Advisory file locks shared by the processes serving from one machine (gunicorn workers, refresh_database.py).
+Backed by fcntl.flock, so a lock is released by the kernel when its holder exits or crashes.
+Where fcntl is unavailable (Windows) the locks are no-ops, which is fine for a single process.
+"""
+
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def open_lock_file(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(path, 'a+')
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Hold an exclusive (or shared) lock on path for the duration of the block, waiting for it if needed"""
+    if fcntl is None:
+        yield
+        return
+    with open_lock_file(path) as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(path):
+    """Take an exclusive lock without waiting; the open file holding it, or None if another process has it.
+    Keep the returned file open for as long as the lock is needed
+    """
+    file = open_lock_file(path)
+    if fcntl is None:
+        return file
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return file
+    except OSError:
+        file.close()
+        return None
@@ -452,6 +452,45 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
     // Initialize session
     sessionId = generateSessionId();
     
+    // Same message again within the server's replay window (a double submit): same key, so it gets the stored answer
+    const IDEMPOTENCY_WINDOW_MS = 10000;
+    let lastSubmission = null;
+    
+    function idempotencyKeyFor(message) {
+        const now = Date.now();
+        if (lastSubmission && lastSubmission.message === message && now - lastSubmission.at < IDEMPOTENCY_WINDOW_MS) {
+            return lastSubmission.key;
+        }
+        lastSubmission = { message: message, at: now, key: sessionId + '_' + now.toString(36) + Math.random().toString(36).substr(2, 6) };
+        return lastSubmission.key;
+    }
+    
+    // Retrieval prefetch: once the visitor pauses typing, the API looks up context for the draft,
+    // so the /chat/stream call that follows finds it ready
+    const PREFETCH_DEBOUNCE_MS = 400;
+    const PREFETCH_MIN_CHARS = 8;
+    let prefetchTimer = null;
+    let lastPrefetched = '';
+    
+    function palmsPrefetchDraft() {
+        const draft = input.value.trim();
+        if (draft.length < PREFETCH_MIN_CHARS || draft === lastPrefetched) return;
+        lastPrefetched = draft;
+        
+        // Fire and forget: a failed prefetch only means /chat does the lookup itself
+        fetch(`${API_URL}/chat/prefetch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            mode: 'cors',
+            credentials: 'include',
+            keepalive: true,
+            body: JSON.stringify({ 
+                message: draft,
+                session_id: sessionId 
+            })
+        }).catch(() => {});
+    }
+    
     window.palmsMinimize = function() {
         minimized = true;
         
@@ -563,18 +602,7 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
         setTimeout(() => input.focus(), 500);
     };
     
-    function palmsAddMessage(text, isUser = false, messageType = 'normal') {
-        const msg = document.createElement('div');
-        let className = 'palms-message ';
-        
-        if (messageType === 'system') {
-            className += 'system';
-        } else {
-            className += isUser ? 'user' : 'bot';
-        }
-        
-        msg.className = className;
-        
+    function palmsFormatMessage(text) {
         // Format messages with proper HTML conversion
         let formattedMessage = text;
         
@@ -590,7 +618,49 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
         // Convert line breaks
         formattedMessage = formattedMessage.replace(/\n/g, '<br>');
         
-        msg.innerHTML = formattedMessage;
+        return formattedMessage;
+    }
+    
+    // Minimal Server-Sent Events reader for a fetch() response body
+    async function palmsReadEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (data) onEvent(eventName, JSON.parse(data));
+            }
+        }
+    }
+    
+    function palmsAddMessage(text, isUser = false, messageType = 'normal') {
+        const msg = document.createElement('div');
+        let className = 'palms-message ';
+        
+        if (messageType === 'system') {
+            className += 'system';
+        } else {
+            className += isUser ? 'user' : 'bot';
+        }
+        
+        msg.className = className;
+        
+        msg.innerHTML = palmsFormatMessage(text);
         body.appendChild(msg);
         
         // Add clearfix
@@ -761,6 +831,8 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
         
         const message = input.value.trim();
         if (!message) return;
+        clearTimeout(prefetchTimer);
+        lastPrefetched = '';
         
         palmsAddMessage(message, true);
         input.value = '';
@@ -769,17 +841,18 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
         
         try {
             console.log('Attempting to connect to API...', {
-                url: `${API_URL}/chat`,
+                url: `${API_URL}/chat/stream`,
                 sessionId: sessionId,
                 message: message,
                 timestamp: new Date().toISOString()
             });
             
-            const response = await fetch(`${API_URL}/chat`, {
+            const response = await fetch(`${API_URL}/chat/stream`, {
                 method: 'POST',
                 headers: { 
                     'Content-Type': 'application/json',
-                    'Accept': 'application/json'
+                    'Accept': 'text/event-stream',
+                    'Idempotency-Key': idempotencyKeyFor(message)
                 },
                 mode: 'cors',
                 credentials: 'include',
@@ -800,23 +873,38 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
             
-            const data = await response.json();
+            // Render tokens as they arrive; the final 'done' event carries the form flags
+            let botMsg = null;
+            let streamedText = '';
+            let data = null;
+            await palmsReadEventStream(response, (event, payload) => {
+                if (event === 'token') {
+                    if (!botMsg) {
+                        palmsRemoveTyping();
+                        botMsg = palmsAddMessage('', false);
+                    }
+                    streamedText += payload.text;
+                    botMsg.innerHTML = palmsFormatMessage(streamedText);
+                    body.scrollTop = body.scrollHeight;
+                } else if (event === 'done' || event === 'error') {
+                    data = payload;
+                }
+            });
             console.log('Response data:', data);
-            console.log('data.message value:', data.message);
-            console.log('data.message type:', typeof data.message);
-            console.log('data.error value:', data.error);
             palmsRemoveTyping();
             
-            if (data.error) {
+            if (!data || data.error) {
                 console.log('ERROR PATH: Displaying error message');
-                palmsAddMessage(data.error, false);
+                palmsAddMessage(data ? data.error : "Sorry, I couldn't process your request.", false);
                 return;
             }
             
             const botText = data.message || "Sorry, I couldn't process your request.";
-            console.log('botText final value:', botText);
-            console.log('About to call palmsAddMessage with:', botText);
-            palmsAddMessage(botText, false);
+            if (botMsg) {
+                botMsg.innerHTML = palmsFormatMessage(botText);
+            } else {
+                palmsAddMessage(botText, false);
+            }
             
             // Show demo form if requested (matching backend trigger)
             if (data.show_demo_form) {
@@ -964,6 +1052,12 @@ if ( ! function_exists( 'elementor_theme_do_location' ) || ! elementor_theme_do_
         }
     });
     
+    // Prefetch retrieval for the draft once typing pauses
+    input.addEventListener('input', function() {
+        clearTimeout(prefetchTimer);
+        prefetchTimer = setTimeout(palmsPrefetchDraft, PREFETCH_DEBOUNCE_MS);
+    });
+    
     // Auto-resize on window resize
     window.addEventListener('resize', function() {
         if (!minimized) {
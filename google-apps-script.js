@@ -12,60 +12,68 @@
  * 4. Create a Google Sheet with headers: Timestamp, Name, Email, Phone, Source, Lead Score, Stage, Signals, Touches
  * 5. Replace SHEET_ID with your Google Sheet ID
  * 6. Deploy as Web App with execute permissions for "Anyone"
- * 7. Copy the Web App URL and update GOOGLE_SCRIPT_URL in app.py
+ * 7. Copy the Web App URL and set GOOGLE_SCRIPT_URL (see lead_capture.py)
+ *
+ * doPost accepts a JSON array of leads (the backend delivers its outbox in batches) or a single lead object
  */
 
 // Replace this with your Google Sheet ID (found in the sheet URL)
 const SHEET_ID = '1kxAbogmt-khwhUzoJI14uKhgANFLP_EuHYQtNKHmVYc';
 const SHEET_NAME = 'Sheet1'; // Name of the sheet tab (change to your actual tab name)
 
+const HEADERS = ['Timestamp', 'Name', 'Email', 'Phone', 'Source', 'Lead Score', 'Stage', 'Signals', 'Touches'];
+
+function toRow(data) {
+  // Prepare the row data with enhanced TOFU fields
+  return [
+    data.timestamp || new Date().toLocaleString(),
+    data.name || '',
+    data.email || '',
+    data.phone || '',
+    data.source || 'Website',
+    data.lead_score || 0,
+    data.stage || 'unknown',
+    data.qualification_signals || '',
+    data.touch_count || 0
+  ];
+}
+
 function doPost(e) {
+  // Concurrent batches must not both write below the same last row
+  const lock = LockService.getScriptLock();
   try {
-    // Parse the request data
+    lock.waitLock(30000);
+    
+    // The backend's outbox sends an array of leads; a single object is still accepted
     const data = JSON.parse(e.postData.contents);
+    const leads = Array.isArray(data) ? data : [data];
     
-    // Open the Google Sheet
-    const sheet = SpreadsheetApp.openById(SHEET_ID).getSheetByName(SHEET_NAME);
+    // Open the Google Sheet once
+    const spreadsheet = SpreadsheetApp.openById(SHEET_ID);
+    let sheet = spreadsheet.getSheetByName(SHEET_NAME);
     
     // If sheet doesn't exist, create it with headers
     if (!sheet) {
-      const newSheet = SpreadsheetApp.openById(SHEET_ID).insertSheet(SHEET_NAME);
-      newSheet.getRange(1, 1, 1, 9).setValues([
-        ['Timestamp', 'Name', 'Email', 'Phone', 'Source', 'Lead Score', 'Stage', 'Signals', 'Touches']
-      ]);
-      
-      // Format header row - all 9 columns
-      newSheet.getRange(1, 1, 1, 9).setFontWeight('bold');
-      newSheet.getRange(1, 1, 1, 9).setBackground('#f0f0f0');
+      sheet = spreadsheet.insertSheet(SHEET_NAME);
+      const header = sheet.getRange(1, 1, 1, HEADERS.length);
+      header.setValues([HEADERS]);
+      header.setFontWeight('bold');
+      header.setBackground('#f0f0f0');
+      sheet.autoResizeColumns(1, HEADERS.length);
     }
     
-    // Get the sheet (after potential creation)
-    const targetSheet = SpreadsheetApp.openById(SHEET_ID).getSheetByName(SHEET_NAME);
-    
-    // Prepare the row data with enhanced TOFU fields
-    const rowData = [
-      data.timestamp || new Date().toLocaleString(),
-      data.name || '',
-      data.email || '',
-      data.phone || '',
-      data.source || 'Website',
-      data.lead_score || 0,
-      data.stage || 'unknown',
-      data.qualification_signals || '',
-      data.touch_count || 0
-    ];
-    
-    // Append the data to the sheet
-    targetSheet.appendRow(rowData);
-    
-    // Auto-resize columns for better readability
-    targetSheet.autoResizeColumns(1, 9);
+    // Write the whole batch with a single setValues call
+    if (leads.length) {
+      const rows = leads.map(toRow);
+      sheet.getRange(sheet.getLastRow() + 1, 1, rows.length, HEADERS.length).setValues(rows);
+    }
     
     // Return success response
     return ContentService
       .createTextOutput(JSON.stringify({
         success: true,
-        message: 'Data successfully added to Google Sheet'
+        count: leads.length,
+        message: leads.length + ' row(s) successfully added to Google Sheet'
       }))
       .setMimeType(ContentService.MimeType.JSON);
       
@@ -77,6 +85,8 @@ function doPost(e) {
         message: 'Error: ' + error.toString()
       }))
       .setMimeType(ContentService.MimeType.JSON);
+  } finally {
+    lock.releaseLock();
   }
 }
 
@@ -94,13 +104,13 @@ function doGet(e) {
 function testScript() {
   const testData = {
     postData: {
-      contents: JSON.stringify({
+      contents: JSON.stringify([{
         timestamp: new Date().toLocaleString(),
         name: 'Test User',
         email: 'test@example.com',
         phone: '+1234567890',
         source: 'Test'
-      })
+      }])
     }
   };
   
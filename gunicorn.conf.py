@@ -0,0 +1,58 @@
+"""
+Production gunicorn settings for app.py:
+    gunicorn -c gunicorn.conf.py app:app
+
+- preload_app: the master imports app.py once and warms up (prompts, rule tables, embedding and
+  semantic caches, BM25 index, vector snapshot) before forking, so every worker starts ready and
+  shares those pages copy-on-write instead of building its own copy
+- post_fork: each worker then opens its own OpenAI client, SQLite connections, Chroma client and
+  lead dispatcher thread (app.init_worker), since sockets, connections and threads don't survive a fork
+- gthread workers: a chat turn spends almost all of its time waiting on OpenAI, so a few processes
+  with many threads each serve far more visitors than sync workers
+
+With more than one worker SESSION_STORE defaults to sqlite, so every worker sees the same sessions.
+Tune with WEB_CONCURRENCY (workers), GUNICORN_THREADS (threads per worker) and GUNICORN_PRELOAD.
+Benchmarks for these defaults are in DEPLOYMENT_GUIDE.md ("Serving with gunicorn")
+"""
+
+import os
+import multiprocessing
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+if preload_app:
+    # Read by app.py and chat.py at import: defer per-process state to post_fork and warm up inline
+    # in the master, so no warm-up thread is running when it forks
+    os.environ['PRELOAD_APP'] = 'true'
+    os.environ.setdefault('WARMUP_IN_BACKGROUND', 'false')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5002')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+if workers > 1:
+    # In-memory sessions would be split across workers; read by session_store.py when app.py is imported
+    os.environ.setdefault('SESSION_STORE', 'sqlite')
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Streaming replies and demo submissions can legitimately take tens of seconds
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import app
+        app.init_worker()
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges from the shared Prometheus directory
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.pid)
+        except ImportError:
+            pass
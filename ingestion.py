@@ -0,0 +1,258 @@
+"""
+Batched, concurrent and resumable embedding ingestion for the PALMS™ knowledge base.
+Used by both SalesBotRAG.load_knowledge_base (chat.py) and refresh_database.py
+"""
+
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics import timed, record_usage
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Optional shortened output size for text-embedding-3 models (unset = model default)
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '0')) or None
+
+# Inputs per embeddings.create call (the API accepts up to 2048)
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+# Rough character cap per call so a batch stays well under the per-request token limit
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv('EMBEDDING_BATCH_MAX_CHARS', '400000'))
+# Number of batches in flight at once
+EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', '4'))
+# Where finished batches are saved so an interrupted refresh can resume
+INGEST_PROGRESS_PATH = os.getenv('INGEST_PROGRESS_PATH', './chroma_db/ingest_progress.json')
+
+
+def chunk_hash(text):
+    """Stable content hash for a chunk of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def split_sections(content, chunk_size=2000, overlap=200):
+    """Split content on '##' sections into overlapping chunks, returned as (section_path, chunk) pairs"""
+    sections = content.split('\n##')
+    chunks = []
+    
+    for section in sections:
+        if not section.strip():
+            continue
+        
+        section_path = section.strip().split('\n', 1)[0].strip('# ').strip()
+        
+        # For large sections, split into smaller chunks
+        words = section.split()
+        if len(words) > chunk_size:
+            for i in range(0, len(words), chunk_size - overlap):
+                chunk = ' '.join(words[i:i + chunk_size])
+                if chunk.strip():
+                    chunks.append((section_path, '##' + chunk if i == 0 else chunk))
+        else:
+            # Keep small sections intact
+            chunks.append((section_path, '##' + section if not section.startswith('##') else section))
+    
+    return chunks
+
+
+def chunk_id(section_path, chunk):
+    """Id derived from where a chunk lives and what it says, so it survives edits elsewhere in the file"""
+    return 'kb_' + chunk_hash(f"{section_path}\x00{chunk}")[:32]
+
+
+def knowledge_base_version(ids):
+    """Short fingerprint of the indexed chunk ids; it changes whenever a chunk is added, edited or removed"""
+    return chunk_hash('\n'.join(sorted(ids)))[:12]
+
+
+def build_chunk_records(content, chunk_size=2000, overlap=200, min_chars=50):
+    """Chunk records (id, document, metadata) ready to sync into the collection"""
+    records = []
+    seen = set()
+    for section_path, chunk in split_sections(content, chunk_size, overlap):
+        if len(chunk.strip()) <= min_chars:  # Only keep meaningful chunks
+            continue
+        record_id = chunk_id(section_path, chunk)
+        if record_id in seen:
+            continue
+        seen.add(record_id)
+        records.append({
+            'id': record_id,
+            'document': chunk,
+            'metadata': {"type": "product_info", "section": section_path, "content_hash": chunk_hash(chunk)}
+        })
+    return records
+
+
+def sync_collection(collection, records, embed):
+    """Diff records against the stored product_info chunks and only write what changed.
+
+    `embed` maps a list of texts to their embeddings. New chunks are upserted before stale
+    ones are deleted, so readers never see a partially emptied collection.
+    Returns (added, deleted, unchanged) counts.
+    """
+    existing = collection.get(where={"type": "product_info"}, include=[])
+    existing_ids = set(existing['ids']) if existing and existing.get('ids') else set()
+    wanted_ids = {record['id'] for record in records}
+    
+    to_add = [record for record in records if record['id'] not in existing_ids]
+    to_delete = sorted(existing_ids - wanted_ids)
+    
+    if to_add:
+        embeddings = embed([record['document'] for record in to_add])
+        collection.upsert(
+            ids=[record['id'] for record in to_add],
+            embeddings=embeddings,
+            documents=[record['document'] for record in to_add],
+            metadatas=[record['metadata'] for record in to_add]
+        )
+    if to_delete:
+        collection.delete(ids=to_delete)
+    
+    return len(to_add), len(to_delete), len(records) - len(to_add)
+
+
+class EmbeddingIngestor:
+    """Embed many chunks with multi-input batches, a bounded worker pool and on-disk progress"""
+
+    def __init__(self, client, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_workers=EMBEDDING_MAX_WORKERS, progress_path=INGEST_PROGRESS_PATH,
+                 max_batch_chars=EMBEDDING_BATCH_MAX_CHARS, cache=None, dimensions=EMBEDDING_DIMENSIONS):
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        # Optional EmbeddingCache checked before any text is sent to OpenAI
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.progress_path = progress_path
+        self.max_batch_chars = max_batch_chars
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        """Return one embedding per text, in order. Raises if any batch fails (finished batches are kept)"""
+        hashes = [chunk_hash(text) for text in texts]
+        done = self.load_progress()
+
+        cached = {}
+        if self.cache:
+            missing = [text for text, text_hash in zip(texts, hashes) if text_hash not in done]
+            cached = self.cache.get_many(missing, self.model, self.dimensions)
+            if cached:
+                print(f"Embedding cache: {len(cached)} chunks unchanged, skipping them")
+                done.update(cached)
+
+        # Only embed each distinct text once, and skip anything a previous run already finished
+        pending = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in done and text_hash not in pending:
+                pending[text_hash] = text
+
+        if done:
+            resumed = sum(1 for text_hash in set(hashes) if text_hash in done and text_hash not in cached)
+            if resumed:
+                print(f"Resuming ingestion: {resumed} chunks already embedded, {len(pending)} remaining")
+
+        batches = self.make_batches(list(pending.items()))
+        if batches:
+            print(f"Embedding {len(pending)} chunks in {len(batches)} batches ({self.max_workers} concurrent)...")
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.embed_batch, batch): batch for batch in batches}
+            for completed, future in enumerate(as_completed(futures), start=1):
+                batch = futures[future]
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    print(f"Embedding batch of {len(batch)} chunks failed: {e}")
+                    errors.append(e)
+                    continue
+
+                with self._lock:
+                    for (text_hash, _), vector in zip(batch, vectors):
+                        done[text_hash] = vector
+                    self.save_progress({text_hash: done[text_hash] for text_hash in done if text_hash not in cached})
+                if self.cache:
+                    self.cache.put_many([(text, vector) for (_, text), vector in zip(batch, vectors)],
+                                        self.model, self.dimensions)
+                print(f"   Embedded batch {completed}/{len(batches)}")
+
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(batches)} embedding batches failed; "
+                               f"progress saved to {self.progress_path}") from errors[0]
+
+        return [done[text_hash] for text_hash in hashes]
+
+    def make_batches(self, items):
+        """Group (hash, text) pairs by input count and approximate size"""
+        batches = []
+        current = []
+        current_chars = 0
+        for item in items:
+            text_chars = len(item[1])
+            if current and (len(current) >= self.batch_size or current_chars + text_chars > self.max_batch_chars):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append(item)
+            current_chars += text_chars
+        if current:
+            batches.append(current)
+        return batches
+
+    @timed('embedding')
+    def embed_batch(self, batch):
+        """Single embeddings.create call for a whole batch"""
+        params = {'dimensions': self.dimensions} if self.dimensions else {}
+        response = self.client.embeddings.create(
+            input=[text for _, text in batch],
+            model=self.model,
+            **params
+        )
+        record_usage(self.model, getattr(response, 'usage', None))
+        # The API returns one item per input with its position in `index`
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def load_progress(self):
+        """Embeddings finished by an earlier, interrupted run (same model only)"""
+        if not self.progress_path or not os.path.exists(self.progress_path):
+            return {}
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as file:
+                progress = json.load(file)
+            if progress.get('model') != self.model or progress.get('dimensions') != self.dimensions:
+                return {}
+            return progress.get('embeddings', {})
+        except Exception as e:
+            print(f"Ignoring unreadable ingestion progress file: {e}")
+            return {}
+
+    def save_progress(self, done):
+        """Write progress atomically so a crash mid-write never corrupts it.
+        A failed checkpoint is only logged: the embeddings themselves are fine, a restart just redoes more work
+        """
+        if not self.progress_path:
+            return
+        # Per process and thread, so concurrent writers never rename each other's temporary file
+        tmp_path = f"{self.progress_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            directory = os.path.dirname(self.progress_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'model': self.model, 'dimensions': self.dimensions, 'embeddings': done}, file)
+            os.replace(tmp_path, self.progress_path)
+        except Exception as e:
+            print(f"⚠️ Could not save ingestion progress to {self.progress_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear_progress(self):
+        """Call once the embeddings have been stored; the next run starts fresh"""
+        if self.progress_path and os.path.exists(self.progress_path):
+            try:
+                os.remove(self.progress_path)
+            except FileNotFoundError:
+                pass
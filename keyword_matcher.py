@@ -0,0 +1,205 @@
+"""
+Single-pass keyword matching for the rule-based analyzers in chat.py.
+Every phrase table (safety filter, lead scoring, intent, demo detection, demo-mode replies, ...) is
+compiled once into one trie-shaped regex. scan_message() runs it over the message a single time and
+returns every rule hit; the analyzers then only do set lookups.
+
+Matching is case-insensitive and anchored at a word start ("try" no longer fires inside "industry",
+"hi" inside "this"), but open-ended, so "feature" still matches "features" and "price" "prices"
+"""
+
+import re
+import functools
+
+# TOFU qualification criteria used by enhanced_lead_qualification; (category, level) -> phrases
+QUALIFICATION_SIGNALS = {
+    'intent_signals': {
+        'high': ['need solution', 'looking for', 'evaluating', 'budget approved', 'decision maker', 'procurement'],
+        'medium': ['interested in', 'want to know', 'considering', 'exploring options'],
+        'low': ['just curious', 'browsing', 'maybe later', 'just looking']
+    },
+    'authority_signals': {
+        'high': ['ceo', 'cto', 'warehouse manager', 'operations director', 'procurement manager'],
+        'medium': ['supervisor', 'team lead', 'analyst', 'coordinator'],
+        'low': ['intern', 'student', 'researcher']
+    },
+    'timeline_signals': {
+        'urgent': ['asap', 'immediately', 'this quarter', 'next month'],
+        'near_term': ['in 3 months', 'this year', 'soon'],
+        'long_term': ['next year', 'future', 'someday']
+    },
+    'budget_signals': {
+        'confirmed': ['budget approved', 'funds allocated', 'ready to purchase'],
+        'exploring': ['budget planning', 'cost analysis', 'roi calculation'],
+        'unclear': ['just researching', 'preliminary']
+    }
+}
+
+# Phrase order matters only where an analyzer picks the first hit (e.g. which industry to name)
+RULES = {
+    # apply_safety_filter
+    'off_topic': ['politics', 'political', 'election', 'religion', 'religious',
+                  'medical advice', 'legal advice', 'dating', 'relationship'],
+    'competitor_negative': ['why is sap bad', "what's wrong with", 'worst thing about',
+                            'problems with oracle', 'better than sap'],
+    'sensitive_data': ['credit card', 'ssn', 'social security', 'password', 'bank account'],
+    'manipulation': ['ignore previous', 'forget you are', 'new instructions',
+                     'disregard', 'act as if', 'pretend you'],
+    'prompt_injection': ['###', 'system:', 'assistant:'],
+
+    # analyze_message_intent
+    'pricing_interest': ['price', 'cost', 'pricing', 'how much', 'budget', 'expensive', 'affordable'],
+    'demo_positive': ['demo', 'demonstration', 'show me', 'try', 'test', 'trial', 'see it'],
+    'demo_negative': ['no demo', 'not interested', 'do not want', "don't want", 'no thanks', 'not now', 'decline'],
+    'feature_interest': ['warehouse', 'inventory', 'wms', 'problems', 'challenges', 'features', 'capabilities'],
+    'timeline_interest': ['timeline', 'when', 'implementation', 'go live', 'urgent', 'asap', 'soon'],
+    'company_details': ['company', 'business', 'we are', 'our warehouse', 'my company', 'organization'],
+    'comparison_interest': ['compare', 'versus', 'vs', 'alternative', 'better than', 'difference'],
+    'industries': ['manufacturing', 'retail', 'ecommerce', '3pl', 'logistics', 'distribution',
+                   'automotive', 'pharmaceutical'],
+    'size_indicators': ['warehouse', 'warehouses', 'facility', 'facilities', 'sqft', 'square feet',
+                        'employees', 'staff'],
+    'opening_message': ['hello', 'hi', 'hey', 'what is palms', 'about palms'],
+
+    # prepare_turn / get_tofu_override / get_tofu_conversation_flow
+    'human_handoff': ['human', 'person', 'agent', 'representative', 'speak to someone'],
+    'content_question': ['what', 'how', 'why', 'tell me', 'explain', 'about', 'feature', 'price',
+                         'cost', 'company', 'product', 'integration', 'works', 'does', 'can it',
+                         'mobile', 'industry', 'clients', 'case', 'benefit', 'problem', 'challenge'],
+    'next_step_question': ['what now', 'next step', 'what should', 'how do i proceed',
+                           'what do you recommend', 'ready to move', 'lets go', "let's proceed"],
+
+    # finalize_response
+    'demo_form_request': [
+        'demo', 'schedule demo', 'book demo', 'show me demo', 'see demo', 'want demo',
+        'i want a demo', 'i would like a demo', 'can i get a demo', 'request demo',
+        'try demo', 'demo please', 'demonstration', 'book a demo', 'schedule a demo',
+        'sign up for demo', 'get a demo', 'demo session', 'product demo', 'live demo',
+        # Call-related phrases that should also trigger demo form
+        'book a call', 'schedule a call', 'book call', 'schedule call', 'want a call',
+        'request a call', 'call me', 'phone call', 'sales call', 'consultation call',
+        'speak with someone', 'talk to sales', 'contact sales', 'sales consultation',
+        'schedule consultation', 'book consultation', 'arrange a call', 'set up a call'
+    ],
+    'affirmative': ['yes'],
+    'negative_demo': ['no demo', 'not interested', 'do not want', "don't want", 'no thanks',
+                      'not now', 'maybe later', 'not ready', 'just browsing', 'just looking',
+                      'decline', 'pass', 'skip demo', 'no need', 'not necessary'],
+
+    # get_demo_information
+    'list_request': ['all products', 'all features', 'complete list', 'full list', 'every product', 'every feature'],
+
+    # get_enhanced_demo_response, in branch order
+    'demo_complete_list': ['all products', 'complete list', 'full list', 'show everything', 'list all'],
+    'demo_products': ['products', 'solutions', 'all products', 'what do you offer', 'modules', 'editions'],
+    'demo_greeting': ['hello', 'hi', 'hey', 'good morning', 'good afternoon'],
+    'demo_about': ['what is palms', 'about palms', 'palms wms', 'what does palms do'],
+    'demo_pricing': ['price', 'cost', 'pricing', 'how much', 'budget'],
+    'demo_decline': ['no demo', 'not interested', 'do not want', "don't want", 'no thanks', 'not now',
+                     'decline', 'pass'],
+    'demo_request': ['demo', 'demonstration', 'show me', 'see it'],
+    'demo_features': ['features', 'capabilities', 'what does', 'benefits', 'functionality'],
+    'demo_integration': ['integration', 'erp', 'systems', 'connect', 'api'],
+    'demo_mobile': ['mobile', 'handheld', 'scanning', 'app', 'technology'],
+    'demo_industries': ['manufacturing', 'retail', 'ecommerce', '3pl', 'cold storage', 'automotive'],
+    'demo_problems': ['problem', 'challenge', 'issue', 'difficulty', 'inefficient'],
+    'demo_clients': ['clients', 'customers', 'case studies', 'success stories', 'who uses'],
+    'demo_comparison': ['compared to', 'versus', 'vs', 'better than', 'difference'],
+    'demo_opening': ['hello', 'hi', 'what is palms'],
+}
+
+for _category, _levels in QUALIFICATION_SIGNALS.items():
+    for _level, _phrases in _levels.items():
+        RULES[f'{_category}:{_level}'] = _phrases
+
+
+def _trie_pattern(node):
+    """Regex for a character trie; greedy optional groups make it match the longest phrase at a position"""
+    terminal = '' in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    return f'(?:{body})?' if terminal else body
+
+
+def _compile_trie(phrases):
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return _trie_pattern(trie)
+
+
+class MessageHits:
+    """Rule hits for one message"""
+
+    def __init__(self, phrases, matcher):
+        self.phrases = phrases
+        self._matcher = matcher
+
+    def any(self, rule):
+        return not self.phrases.isdisjoint(self._matcher.rule_sets[rule])
+
+    def matched(self, rule):
+        """Phrases of the rule found in the message, in rule order"""
+        if not self.any(rule):
+            return []
+        return [phrase for phrase in self._matcher.rules[rule] if phrase in self.phrases]
+
+    def first(self, rule, default=None):
+        matched = self.matched(rule)
+        return matched[0] if matched else default
+
+    def rules(self):
+        return {rule for phrase in self.phrases for rule in self._matcher.phrase_rules[phrase]}
+
+
+class KeywordMatcher:
+    """All rule tables compiled into one regex, scanned once per message"""
+
+    def __init__(self, rules):
+        self.rules = {name: [phrase.lower() for phrase in phrases] for name, phrases in rules.items()}
+        self.rule_sets = {name: frozenset(phrases) for name, phrases in self.rules.items()}
+        # phrase -> names of the rules it belongs to
+        self.phrase_rules = {}
+        for name, phrases in self.rules.items():
+            for phrase in phrases:
+                self.phrase_rules.setdefault(phrase, []).append(name)
+
+        phrases = list(self.phrase_rules)
+        # The scan reports the longest phrase starting at each position; shorter phrases that are
+        # prefixes of it ("demo" for "demo please") matched at the same spot
+        self.implied = {
+            phrase: [other for other in phrases if other != phrase and phrase.startswith(other)]
+            for phrase in phrases
+        }
+
+        word_start = [phrase for phrase in phrases if re.match(r'\w', phrase)]
+        other = [phrase for phrase in phrases if not re.match(r'\w', phrase)]
+        alternatives = []
+        if word_start:
+            alternatives.append(r'\b' + _compile_trie(word_start))
+        if other:
+            alternatives.append(_compile_trie(other))
+        self.pattern = re.compile('(?=(' + '|'.join(alternatives) + '))')
+
+    def scan(self, text):
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            phrase = match.group(1)
+            if phrase and phrase not in found:
+                found.add(phrase)
+                found.update(self.implied[phrase])
+        return MessageHits(found, self)
+
+
+MATCHER = KeywordMatcher(RULES)
+
+
+@functools.lru_cache(maxsize=512)
+def scan_message(message):
+    """Rule hits for message; the analyzers of one turn share a single scan"""
+    return MATCHER.scan(message)
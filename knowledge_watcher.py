@@ -0,0 +1,220 @@
+"""
+Knowledge base hot reload, kept off the request path.
+
+KnowledgeWatcher polls info.txt from a daemon thread: one os.stat every KNOWLEDGE_WATCH_INTERVAL
+seconds, and a content hash only once a changed file has stopped changing for one interval, so an
+editor's half-written save is never indexed. The callback (SalesBotRAG.reload_knowledge_base) embeds
+and indexes the new chunks off to the side, then publishes them as a new KnowledgeSnapshot.
+
+Publishing is a single reference assignment, read-copy-update style: a request reads
+chatbot.knowledge once and uses that complete (collection, BM25 index, version) triple for the whole
+turn, however many reloads happen meanwhile. The old snapshot is simply dropped once nothing uses it.
+
+Every gunicorn worker runs a watcher, but only the one holding KNOWLEDGE_LOCK_PATH reindexes, so the
+Chroma directory, the vector index snapshot and ingest_progress.json have a single writer. It records
+each published version in KNOWLEDGE_MANIFEST_PATH; the other workers poll that manifest and, when the
+version moves, open the index it wrote and publish it without embedding anything. If the reindexing
+worker exits, the kernel releases its lock and the next watcher to tick takes over.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from file_lock import try_lock
+
+# Watch info.txt and reindex in the background when it changes
+KNOWLEDGE_WATCH = os.getenv('KNOWLEDGE_WATCH', 'true').lower() == 'true'
+KNOWLEDGE_WATCH_INTERVAL = float(os.getenv('KNOWLEDGE_WATCH_INTERVAL', '5'))
+# A failed reindex is retried with exponential backoff, capped at this many seconds
+KNOWLEDGE_RETRY_MAX = float(os.getenv('KNOWLEDGE_RETRY_MAX', '300'))
+# Held by the one process that reindexes; the manifest tells the others which version to serve
+KNOWLEDGE_LOCK_PATH = os.getenv('KNOWLEDGE_LOCK_PATH', './chroma_db/knowledge_reindex.lock')
+KNOWLEDGE_MANIFEST_PATH = os.getenv('KNOWLEDGE_MANIFEST_PATH', './chroma_db/knowledge_manifest.json')
+
+
+class KnowledgeSnapshot:
+    """One published version of the knowledge base; never mutated after it is published"""
+
+    __slots__ = ('version', 'collection', 'lexical_index', 'ids')
+
+    def __init__(self, version=None, collection=None, lexical_index=None, ids=()):
+        self.version = version
+        self.collection = collection
+        self.lexical_index = lexical_index
+        self.ids = frozenset(ids)
+
+    def with_collection(self, collection):
+        """Same snapshot behind a new collection handle (e.g. a Chroma client re-opened after fork)"""
+        snapshot = KnowledgeSnapshot(self.version, collection, self.lexical_index)
+        snapshot.ids = self.ids
+        return snapshot
+
+    def visible(self, results):
+        """A Chroma-shaped query result without chunks outside this snapshot.
+        A shared Chroma collection is synced in place (new chunks first, stale ones last), so a request
+        still on the previous snapshot could otherwise see chunks of the next one mid-reload
+        """
+        if not self.ids or not results or not results.get('ids'):
+            return results
+        keep = [row for row, chunk_id in enumerate(results['ids'][0]) if chunk_id in self.ids]
+        if len(keep) == len(results['ids'][0]):
+            return results
+        filtered = dict(results)
+        for field in ('ids', 'documents', 'metadatas', 'distances'):
+            if results.get(field):
+                filtered[field] = [[results[field][0][row] for row in keep]]
+        return filtered
+
+
+def file_fingerprint(path):
+    """(mtime_ns, size) of a file, None if it is missing"""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def read_manifest(path):
+    """Published knowledge base version from the manifest, None if there is none yet"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file).get('version')
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, version):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'version': version, 'pid': os.getpid(), 'published_at': time.time()}, file)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class KnowledgeWatcher:
+    """Calls on_change() from a background thread whenever the watched file's content changes.
+    on_change returns True once the change is indexed; False (or an exception) means it failed and is retried
+    with backoff. The first check runs shortly after start(), so edits made while the server was down are picked up too.
+
+    With on_published and current_version set, only the process holding lock_path calls on_change; the others
+    call on_published(version) when the manifest names a version other than current_version()
+    """
+
+    def __init__(self, on_change, path='info.txt', interval=KNOWLEDGE_WATCH_INTERVAL, on_published=None,
+                 current_version=None, lock_path=KNOWLEDGE_LOCK_PATH, manifest_path=KNOWLEDGE_MANIFEST_PATH):
+        self.on_change = on_change
+        self.on_published = on_published
+        self.current_version = current_version
+        self.path = path
+        self.interval = interval
+        self.lock_path = lock_path
+        self.manifest_path = manifest_path
+        self.reloads = 0
+        self.syncs = 0
+        self.failures = 0
+        self._digest = None
+        self._lock_file = None
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='knowledge-watcher', daemon=True)
+            self._thread.start()
+            print(f"👀 Watching {self.path} for changes every {self.interval:g}s")
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def is_reindexer(self):
+        """True in the one process that reindexes (always, without a follower callback)"""
+        if self.on_published is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = try_lock(self.lock_path)
+            if self._lock_file is not None:
+                print(f"🔑 Process {os.getpid()} reindexes {self.path} for every worker")
+        return self._lock_file is not None
+
+    def _run(self):
+        fingerprint = None
+        pending = False
+        while not self._stop.wait(self.interval):
+            if not self.is_reindexer():
+                self._follow()
+                continue
+
+            current = file_fingerprint(self.path)
+            if current != fingerprint:
+                # Changed since the last tick; wait until it is stable before reading it
+                fingerprint = current
+                pending = True
+                continue
+            if not pending or current is None or time.monotonic() < self._retry_at:
+                continue
+
+            digest = file_digest(self.path)
+            if digest is None or digest == self._digest:
+                pending = False
+                continue
+            if self._attempt(self.on_change, f"Reindex of {self.path}"):
+                self._digest = digest
+                self.reloads += 1
+                pending = False
+                self._publish()
+
+    def _follow(self):
+        """Serve what the reindexing process published"""
+        if time.monotonic() < self._retry_at:
+            return
+        version = read_manifest(self.manifest_path)
+        if version is None or version == self.current_version():
+            return
+        if self._attempt(lambda: self.on_published(version), f"Loading knowledge base version {version}"):
+            self.syncs += 1
+
+    def _publish(self):
+        if self.on_published is None:
+            return
+        try:
+            write_manifest(self.manifest_path, self.current_version())
+        except Exception as e:
+            print(f"⚠️ Could not write {self.manifest_path}: {e}")
+
+    def _attempt(self, action, description):
+        """Run action; on failure keep serving the current snapshot and retry with backoff"""
+        try:
+            succeeded = bool(action())
+        except Exception as e:
+            print(f"❌ {description} failed: {e}")
+            succeeded = False
+        if succeeded:
+            self.failures = 0
+            self._retry_at = 0.0
+            return True
+        self.failures += 1
+        delay = min(self.interval * 2 ** self.failures, KNOWLEDGE_RETRY_MAX)
+        self._retry_at = time.monotonic() + delay
+        print(f"⚠️ {description} failed, retrying in {delay:g}s")
+        return False
@@ -0,0 +1,237 @@
+"""
+Google Sheets lead capture shared by the Flask (app.py) and ASGI (asgi.py) servers.
+Demo requests are written to an on-disk outbox and acknowledged straight away; a background
+dispatcher delivers them to the Apps Script endpoint in batches, retrying with backoff until it succeeds
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import requests
+from datetime import datetime
+from metrics import timed
+
+# Google Sheets integration - Updated with TOFU enhancement support
+GOOGLE_SCRIPT_URL = os.getenv(
+    'GOOGLE_SCRIPT_URL',
+    'https://script.google.com/macros/s/AKfycbwtkTDW3CjoKgSJrDgj2dWn6oU-ZXYncoGuu6h7zeB5lT14xe_8Q-yjtlwYxHZ61H77/exec'
+)
+
+
+def build_sheets_payload(name, email, phone, session_data=None):
+    """Row for the Apps Script endpoint, with enhanced TOFU data"""
+    # Enhanced TOFU data capture
+    lead_score = session_data.get('lead_score', 0) if session_data else 0
+    stage = session_data.get('stage', 'unknown') if session_data else 'unknown'
+    signals = ', '.join(session_data.get('qualification_signals', [])) if session_data else ''
+    touch_count = session_data.get('touch_count', 0) if session_data else 0
+    
+    return {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'name': name,
+        'email': email,
+        'phone': phone,
+        'source': 'Localhost Demo Form',
+        'lead_score': lead_score,
+        'stage': stage,
+        'qualification_signals': signals,
+        'touch_count': touch_count,
+        'conversation_length': len(session_data.get('conversation_history', [])) if session_data else 0
+    }
+
+
+LEAD_OUTBOX_PATH = os.getenv('LEAD_OUTBOX_PATH', './chroma_db/lead_outbox.sqlite3')
+# Up to this many leads go to Apps Script in one POST
+LEAD_BATCH_SIZE = int(os.getenv('LEAD_BATCH_SIZE', '50'))
+# After a new lead arrives, wait this long for others to share the batch
+LEAD_BATCH_LINGER = float(os.getenv('LEAD_BATCH_LINGER', '2'))
+LEAD_POLL_INTERVAL = float(os.getenv('LEAD_POLL_INTERVAL', '30'))
+LEAD_RETRY_BASE = float(os.getenv('LEAD_RETRY_BASE', '5'))
+LEAD_RETRY_MAX = float(os.getenv('LEAD_RETRY_MAX', '900'))
+# A claimed batch that is neither delivered nor released (worker died) becomes claimable again after this
+LEAD_LEASE_SECONDS = float(os.getenv('LEAD_LEASE_SECONDS', '120'))
+
+
+class LeadOutbox:
+    """Durable SQLite (WAL) queue of Sheets rows, safe to share between worker processes"""
+
+    def __init__(self, path=LEAD_OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # an acknowledged lead must survive a crash
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox (next_attempt_at)")
+
+    def enqueue(self, payload):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (payload, next_attempt_at) VALUES (?, ?)",
+                (json.dumps(payload), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit=LEAD_BATCH_SIZE, lease=LEAD_LEASE_SECONDS):
+        """Lease up to limit due rows as [(id, payload)], so no other worker sends them meanwhile"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload FROM outbox WHERE next_attempt_at <= ? AND leased_until <= ? "
+                    "ORDER BY id LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET leased_until = ? WHERE id = ?",
+                    [(now + lease, row_id) for row_id, _ in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids):
+        """Delivered: remove the rows"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def retry(self, ids, error, base=LEAD_RETRY_BASE, cap=LEAD_RETRY_MAX):
+        """Release the rows with exponential backoff; leads are never dropped"""
+        now = time.time()
+        with self._lock:
+            for row_id in ids:
+                row = self._conn.execute("SELECT attempts FROM outbox WHERE id = ?", (row_id,)).fetchone()
+                if not row:
+                    continue
+                attempts = row[0] + 1
+                delay = min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, leased_until = 0, last_error = ? "
+                    "WHERE id = ?",
+                    (attempts, now + delay, str(error)[:500], row_id)
+                )
+
+    def next_attempt_at(self):
+        """When the earliest queued row becomes due, or None if the outbox is empty"""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(MAX(next_attempt_at, leased_until)) FROM outbox").fetchone()[0]
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+@timed('sheets_submission')
+def post_leads_to_google_sheets(rows, url=GOOGLE_SCRIPT_URL, timeout=10):
+    """POST a batch of rows; raises unless Apps Script confirmed writing every one of them"""
+    response = requests.post(url, json=rows, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    result = response.json()
+    if not result.get('success', False):
+        raise RuntimeError(result.get('message', 'Apps Script reported failure'))
+    # A pre-batching Apps Script deployment reads the array as one empty lead and still reports success;
+    # only the batch-aware doPost returns how many rows it appended
+    if result.get('count') != len(rows):
+        raise RuntimeError(f"Apps Script confirmed {result.get('count')} of {len(rows)} rows; "
+                           "redeploy google-apps-script.js")
+    return result
+
+
+class LeadDispatcher:
+    """Background thread that drains the outbox to Google Sheets in batches"""
+
+    def __init__(self, outbox, send=post_leads_to_google_sheets, batch_size=LEAD_BATCH_SIZE,
+                 linger=LEAD_BATCH_LINGER, poll_interval=LEAD_POLL_INTERVAL):
+        self.outbox = outbox
+        self.send = send
+        self.batch_size = batch_size
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.delivered = 0
+        self.failed_batches = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='lead-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """A lead was just enqueued"""
+        self._wake.set()
+
+    def submit(self, payload):
+        """Durably queue a lead and wake the dispatcher; returns once the row is on disk"""
+        lead_id = self.outbox.enqueue(payload)
+        self.notify()
+        return lead_id
+
+    def dispatch_once(self):
+        """Send every due row, batch by batch; returns how many were delivered"""
+        delivered = 0
+        while not self._stop.is_set():
+            batch = self.outbox.claim(self.batch_size)
+            if not batch:
+                break
+            ids = [row_id for row_id, _ in batch]
+            try:
+                result = self.send([payload for _, payload in batch])
+                self.outbox.ack(ids)
+                delivered += len(ids)
+                print(f"✅ Google Sheets: {result.get('message', 'Success')} ({len(ids)} leads)")
+            except Exception as e:
+                self.outbox.retry(ids, e)
+                self.failed_batches += 1
+                print(f"❌ Google Sheets batch of {len(ids)} failed, will retry: {e}")
+                break
+        self.delivered += delivered
+        return delivered
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.dispatch_once()
+            except Exception as e:
+                print(f"❌ Lead dispatcher error: {e}")
+            # Sleep until the next lead arrives, a retry falls due, or the poll interval passes
+            timeout = self.poll_interval
+            try:
+                next_at = self.outbox.next_attempt_at()
+                if next_at is not None:
+                    timeout = min(timeout, max(0.5, next_at - time.time()))
+            except Exception as e:
+                # e.g. "database is locked"; keep the thread alive and look again after poll_interval
+                print(f"⚠️ Lead outbox unavailable, retrying in {timeout:g}s: {e}")
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                # Give concurrent submissions a moment to join the same batch
+                self._stop.wait(self.linger)
@@ -0,0 +1,101 @@
+"""
+Local BM25 inverted index over the knowledge base chunks, fused with vector results by
+reciprocal rank fusion (RRF). Short queries made of rare, exact terms ("RFID", "3PL", "SAP integration")
+are answered from the lexical index alone, with no embedding call
+"""
+
+import os
+import re
+import math
+from collections import Counter
+
+# Fuse BM25 with the vector ranking, and let confident keyword queries skip the embedding call
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+LEXICAL_ONLY_ROUTING = os.getenv('LEXICAL_ONLY_ROUTING', 'true').lower() == 'true'
+LEXICAL_BM25_K1 = float(os.getenv('LEXICAL_BM25_K1', '1.5'))
+LEXICAL_BM25_B = float(os.getenv('LEXICAL_BM25_B', '0.75'))
+# k in 1 / (k + rank); 60 is the usual choice from the RRF paper
+RRF_K = int(os.getenv('RRF_K', '60'))
+# Lexical-only path: at most this many content terms, one of them found in at most this share of chunks
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv('LEXICAL_ONLY_MAX_TERMS', '3'))
+LEXICAL_ONLY_MAX_DF = float(os.getenv('LEXICAL_ONLY_MAX_DF', '0.2'))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'by', 'at', 'from', 'as', 'is', 'are',
+    'was', 'be', 'it', 'its', 'this', 'that', 'these', 'those', 'do', 'does', 'did', 'can', 'could', 'will',
+    'would', 'should', 'you', 'your', 'we', 'our', 'i', 'me', 'my', 'us', 'what', 'which', 'who', 'how', 'why',
+    'when', 'where', 'about', 'tell', 'any', 'have', 'has', 'there', 'please', 'support', 'supports'
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk documents, built in one pass at ingestion time"""
+
+    def __init__(self, ids, documents, metadatas=None, k1=LEXICAL_BM25_K1, b=LEXICAL_BM25_B):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas) if metadatas else [{} for _ in self.ids]
+        self.k1 = k1
+        self.b = b
+        # term -> [(doc index, term frequency)]
+        self.postings = {}
+        lengths = []
+        for index, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, []).append((index, frequency))
+        self.lengths = lengths
+        self.average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        total = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, n_results=10, where=None):
+        """[(id, document, score)] best first"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.average_length or 1))
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        if where:
+            scores = {index: score for index, score in scores.items()
+                      if all(self.metadatas[index].get(field) == value for field, value in where.items())}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+        return [(self.ids[index], self.documents[index], score) for index, score in ranked]
+
+    def is_confident(self, query, hits, max_terms=LEXICAL_ONLY_MAX_TERMS, max_df=LEXICAL_ONLY_MAX_DF):
+        """True for short queries of known terms, at least one of them rare, that all occur in the top hit"""
+        terms = set(tokenize(query))
+        if not hits or not terms or len(terms) > max_terms or not terms <= self.postings.keys():
+            return False
+        rare = max(1, max_df * len(self.ids))
+        if not any(len(self.postings[term]) <= rare for term in terms):
+            return False
+        return terms <= set(tokenize(hits[0][1]))
+
+
+def reciprocal_rank_fusion(rankings, n_results=10, k=RRF_K):
+    """Fuse ranked [(id, document)] lists; returns documents by descending sum of 1 / (k + rank)"""
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, (chunk_id, document) in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            documents[chunk_id] = document
+    ranked = sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)[:n_results]
+    return [documents[chunk_id] for chunk_id in ranked]
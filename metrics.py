@@ -0,0 +1,213 @@
+"""
+Prometheus metrics for the PALMS™ chatbot, served at GET /metrics by app.py and asgi.py.
+
+- palms_stage_seconds{stage}: latency of safety_filter, retrieval, embedding, information_layer,
+  sales_layer and sheets_submission
+- palms_openai_tokens_total{model, kind}: prompt / completion / cached tokens from response.usage
+- palms_openai_cost_usd_total{model}: estimated spend from MODEL_PRICES
+- palms_cache_*, palms_route_*, palms_context_tokens_*: read from the chatbot at scrape time
+- palms_active_sessions, palms_lead_outbox_pending
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory so histograms and
+counters are summed across workers. prometheus_client is optional; without it recording is a no-op
+"""
+
+import os
+import time
+import inspect
+import functools
+
+try:
+    from prometheus_client import (CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST,
+                                   generate_latest)
+    from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    print("⚠️ prometheus_client not installed, /metrics is disabled")
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'text-embedding-3-small': (0.02, 0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.13, 0.0),
+}
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram('palms_stage_seconds', 'Latency of one pipeline stage', ['stage'],
+                              buckets=STAGE_BUCKETS)
+    OPENAI_TOKENS = Counter('palms_openai_tokens', 'OpenAI tokens from response.usage', ['model', 'kind'])
+    OPENAI_COST = Counter('palms_openai_cost_usd', 'Estimated OpenAI spend in USD', ['model'])
+
+
+def observe_stage(stage, seconds):
+    if PROMETHEUS_AVAILABLE:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def timed(stage):
+    """Decorator recording a function's latency under palms_stage_seconds{stage}.
+    Generators (streaming layers) are timed from the first item to exhaustion
+    """
+    def decorator(function):
+        if inspect.isasyncgenfunction(function):
+            @functools.wraps(function)
+            async def async_generator(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    async for item in function(*args, **kwargs):
+                        yield item
+                finally:
+                    observe_stage(stage, time.perf_counter() - started)
+            return async_generator
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def coroutine(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    observe_stage(stage, time.perf_counter() - started)
+            return coroutine
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from function(*args, **kwargs)
+                finally:
+                    observe_stage(stage, time.perf_counter() - started)
+            return generator
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def record_usage(model, usage):
+    """Count (and log) the tokens of one OpenAI response; usage may be None, e.g. from fakes or old SDKs"""
+    if usage is None:
+        return
+    try:
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+        if completion_tokens:
+            # Chat calls only; cached_tokens shows whether the static prompt prefix hit OpenAI's cache
+            print(f"OpenAI usage ({model}): {prompt_tokens} prompt ({cached_tokens} cached), "
+                  f"{completion_tokens} completion")
+        if not PROMETHEUS_AVAILABLE:
+            return
+
+        OPENAI_TOKENS.labels(model, 'prompt').inc(prompt_tokens)
+        OPENAI_TOKENS.labels(model, 'completion').inc(completion_tokens)
+        OPENAI_TOKENS.labels(model, 'cached').inc(cached_tokens)
+
+        input_price, cached_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+        cost = ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+                + completion_tokens * output_price) / 1_000_000
+        OPENAI_COST.labels(model).inc(cost)
+    except Exception as e:
+        print(f"Could not record OpenAI usage: {e}")
+
+
+class ChatbotCollector:
+    """Gauges read from the chatbot, session store and lead outbox of this process at scrape time"""
+
+    def __init__(self, chatbot, session_store=None, lead_outbox=None):
+        self.chatbot = chatbot
+        self.session_store = session_store
+        self.lead_outbox = lead_outbox
+
+    def collect(self):
+        caches = {
+            'query_embedding': getattr(self.chatbot, 'query_embedding_cache', None),
+            'extraction': getattr(self.chatbot, 'extraction_cache', None),
+            'retrieval': getattr(self.chatbot, 'retrieval_cache', None),
+        }
+        hits = CounterMetricFamily('palms_cache_hits', 'Cache hits', labels=['cache'])
+        misses = CounterMetricFamily('palms_cache_misses', 'Cache misses', labels=['cache'])
+        hit_rate = GaugeMetricFamily('palms_cache_hit_rate', 'Cache hit rate since start', labels=['cache'])
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            stats = cache.stats()
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            hit_rate.add_metric([name], stats['hit_rate'])
+        yield hits
+        yield misses
+        yield hit_rate
+
+        router = getattr(self.chatbot, 'router', None)
+        if router is not None:
+            stats = router.stats()
+            paths = CounterMetricFamily('palms_route_paths', 'Pipeline router decisions by path', labels=['path'])
+            for path, count in stats['paths'].items():
+                paths.add_metric([path], count)
+            reasons = CounterMetricFamily('palms_route_reasons', 'Pipeline router decisions by reason',
+                                          labels=['reason'])
+            for reason, count in stats['reasons'].items():
+                reasons.add_metric([reason], count)
+            yield paths
+            yield reasons
+
+        packer = getattr(self.chatbot, 'context_packer', None)
+        if packer is not None:
+            stats = packer.stats()
+            yield CounterMetricFamily('palms_context_tokens_retrieved', 'Tokens of context retrieved',
+                                      value=stats['tokens_retrieved'])
+            yield CounterMetricFamily('palms_context_tokens_packed', 'Tokens of context sent to the LLM',
+                                      value=stats['tokens_packed'])
+
+        yield GaugeMetricFamily('palms_ready', '1 once warm-up has finished', value=int(self.chatbot.is_ready()))
+
+        if self.session_store is not None:
+            try:
+                yield GaugeMetricFamily('palms_active_sessions', 'Unexpired sessions in the session store',
+                                        value=self.session_store.count())
+            except Exception as e:
+                print(f"Could not count sessions: {e}")
+
+        if self.lead_outbox is not None:
+            try:
+                yield GaugeMetricFamily('palms_lead_outbox_pending', 'Leads waiting for Google Sheets',
+                                        value=self.lead_outbox.pending())
+            except Exception as e:
+                print(f"Could not count pending leads: {e}")
+
+
+class Metrics:
+    """The /metrics payload for one app"""
+
+    def __init__(self, chatbot, session_store=None, lead_outbox=None):
+        self.collector = ChatbotCollector(chatbot, session_store, lead_outbox)
+        self.content_type = CONTENT_TYPE_LATEST
+
+    def render(self):
+        """Prometheus text exposition as bytes"""
+        if not PROMETHEUS_AVAILABLE:
+            return b"# prometheus_client is not installed\n"
+        registry = CollectorRegistry()
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            # Histograms and counters summed over every worker's files
+            from prometheus_client import multiprocess
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            for collector in (STAGE_SECONDS, OPENAI_TOKENS, OPENAI_COST):
+                registry.register(collector)
+        registry.register(self.collector)
+        return generate_latest(registry)
@@ -0,0 +1,135 @@
+"""
+Tiered pipeline router for SalesBotRAG.get_response.
+Each turn is classified cheaply (no LLM call) into one of three paths:
+
+- canned: zero-LLM reply (greetings, acknowledgements, TOFU next-step replies, demo confirmations)
+- single_call: retrieved context (or none) goes straight to the sales layer, skipping the information layer
+- full: retrieval, information layer, then sales layer
+
+The router also picks max_tokens for each LLM call on the chosen path
+"""
+
+import os
+import re
+import threading
+
+ROUTE_CANNED = 'canned'
+ROUTE_SINGLE_CALL = 'single_call'
+ROUTE_FULL = 'full'
+
+# Chroma returns squared L2 distance; for unit-length OpenAI embeddings that is 2 - 2*cosine,
+# so 0.9 means cosine similarity >= 0.55 for the best chunk
+ROUTER_DIRECT_MAX_DISTANCE = float(os.getenv('ROUTER_DIRECT_MAX_DISTANCE', '0.9'))
+# How many top chunks the single-call path hands to the sales layer
+ROUTER_DIRECT_CHUNKS = int(os.getenv('ROUTER_DIRECT_CHUNKS', '2'))
+
+GREETING_PATTERN = re.compile(r"^(hi|hello|hey|hiya|greetings|good (morning|afternoon|evening))( there)?$")
+ACKNOWLEDGEMENTS = {'thanks', 'thank you', 'thank you so much', 'thx', 'ok', 'okay', 'ok thanks', 'okay thanks',
+                    'great', 'cool', 'got it', 'perfect', 'awesome', 'nice', 'great thanks'}
+AFFIRMATIONS = {'yes', 'yeah', 'yep', 'sure', 'yes please', 'sure thing', 'of course', 'absolutely', 'ok sure'}
+SHORT_FOLLOW_UPS = {'no', 'nope', 'no thanks', 'not really', 'maybe', 'tell me more', 'go on', 'more', 'and',
+                    'why', 'how so', 'really'}
+
+# Questions that need the information layer to assemble facts across many chunks
+DETAIL_PHRASES = ['all products', 'all features', 'complete list', 'full list', 'every product', 'every feature',
+                  'comprehensive', 'in detail', 'detailed', 'details', 'list all', 'show everything', 'compare']
+
+
+class RouteDecision:
+    """Which pipeline path a turn takes and the token limits for it"""
+
+    def __init__(self, path, reason, canned_message=None, needs_retrieval=False,
+                 info_max_tokens=0, sales_max_tokens=0, context_max_tokens=0):
+        self.path = path
+        self.reason = reason
+        self.canned_message = canned_message
+        self.needs_retrieval = needs_retrieval
+        self.info_max_tokens = info_max_tokens
+        self.sales_max_tokens = sales_max_tokens
+        # Token budget for retrieved context; 0 = the ContextPacker default
+        self.context_max_tokens = context_max_tokens
+
+    def __repr__(self):
+        return f"RouteDecision({self.path!r}, {self.reason!r})"
+
+
+class PipelineRouter:
+    """Cheap per-turn classifier with per-path decision counters"""
+
+    def __init__(self, direct_max_distance=ROUTER_DIRECT_MAX_DISTANCE, direct_chunks=ROUTER_DIRECT_CHUNKS):
+        self.direct_max_distance = direct_max_distance
+        self.direct_chunks = direct_chunks
+        self._lock = threading.Lock()
+        self._counts = {ROUTE_CANNED: 0, ROUTE_SINGLE_CALL: 0, ROUTE_FULL: 0}
+        self._reasons = {}
+
+    def route(self, message, session, tofu_response=None):
+        """First pass, before retrieval. A decision with needs_retrieval=True is finished by route_with_context"""
+        normalized = ' '.join(re.sub(r"[^\w\s']", ' ', message.lower()).split())
+        history = session.get('conversation_history', [])
+
+        if tofu_response:
+            return RouteDecision(ROUTE_CANNED, 'tofu_next_step', canned_message=tofu_response)
+
+        if GREETING_PATTERN.match(normalized):
+            # The visitor's own message is already in the history on the first turn
+            if len(history) <= 1:
+                reply = "Hello! I'm here to help with PALMS™ warehouse management solutions.\nAre you exploring options or need something specific?"
+            else:
+                reply = "Hello again! How can I help you with PALMS™ today?"
+            return RouteDecision(ROUTE_CANNED, 'greeting', canned_message=reply)
+
+        if normalized in ACKNOWLEDGEMENTS:
+            return RouteDecision(
+                ROUTE_CANNED, 'acknowledgement',
+                canned_message="You're welcome! Is there anything else you'd like to know about PALMS™ - features, integrations, or pricing?"
+            )
+
+        if normalized in AFFIRMATIONS:
+            recent_context = ' '.join(msg['content'] for msg in history[-3:]).lower()
+            if 'demo' in recent_context or 'demonstration' in recent_context:
+                return RouteDecision(
+                    ROUTE_CANNED, 'demo_confirmation',
+                    canned_message="Great! Please fill out the demo form below and our team will reach out within 24 hours to schedule your personalized PALMS™ demo."
+                )
+
+        if normalized in AFFIRMATIONS or normalized in SHORT_FOLLOW_UPS:
+            # Nothing to look up; the sales layer answers from the conversation history
+            return RouteDecision(ROUTE_SINGLE_CALL, 'short_follow_up', sales_max_tokens=400)
+
+        return RouteDecision(ROUTE_FULL, 'pending_retrieval', needs_retrieval=True)
+
+    def route_with_context(self, message, decision, distances, lexical_only=False):
+        """Second pass, once retrieval distances are known (None for chunks only BM25 found)"""
+        if not decision.needs_retrieval:
+            return decision
+
+        message_lower = message.lower()
+        wants_detail = any(phrase in message_lower for phrase in DETAIL_PHRASES)
+
+        known = [distance for distance in distances if distance is not None]
+        if not wants_detail and known and min(known) <= self.direct_max_distance:
+            # The answer sits in the top chunk(s); hand them straight to the sales layer
+            return RouteDecision(ROUTE_SINGLE_CALL, 'confident_retrieval', needs_retrieval=True,
+                                 sales_max_tokens=600)
+
+        if not wants_detail and lexical_only:
+            # Exact match on rare terms; the top BM25 chunks are the answer
+            return RouteDecision(ROUTE_SINGLE_CALL, 'lexical_match', needs_retrieval=True,
+                                 sales_max_tokens=600)
+
+        if wants_detail:
+            return RouteDecision(ROUTE_FULL, 'detail_request', needs_retrieval=True,
+                                 info_max_tokens=2000, sales_max_tokens=1500, context_max_tokens=6000)
+        return RouteDecision(ROUTE_FULL, 'general_question', needs_retrieval=True,
+                             info_max_tokens=800, sales_max_tokens=700)
+
+    def record(self, decision):
+        with self._lock:
+            self._counts[decision.path] = self._counts.get(decision.path, 0) + 1
+            self._reasons[decision.reason] = self._reasons.get(decision.reason, 0) + 1
+        print(f"Pipeline route: {decision.path} ({decision.reason})")
+
+    def stats(self):
+        with self._lock:
+            return {'paths': dict(self._counts), 'reasons': dict(self._reasons)}
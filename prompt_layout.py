@@ -0,0 +1,34 @@
+"""
+Prompt assembly ordered for OpenAI prompt caching.
+OpenAI caches the longest previously seen prompt prefix (from 1024 tokens, in 128-token steps), so
+every LLM call is laid out from most to least stable:
+
+1. static system message - the layer's instructions and guardrails, identical on every call
+2. slow system message   - knowledge base version, changes only when info.txt does
+3. per-turn user message - conversation summary and history (append-only within a chat, so they
+                           extend the cached prefix turn over turn), then retrieved facts, lead state
+                           and the visitor's message
+
+Nothing per-turn may be interpolated into the static text, or the cache misses on every call
+"""
+
+import os
+
+# Sent as prompt_cache_key so calls sharing a static prefix are routed to the same cache shard
+PROMPT_CACHE_KEYS = os.getenv('PROMPT_CACHE_KEYS', 'true').lower() == 'true'
+
+
+def layered_messages(static, slow=None, turn=''):
+    """Chat messages with the static prefix first and per-turn data last"""
+    messages = [{"role": "system", "content": static}]
+    if slow:
+        messages.append({"role": "system", "content": slow})
+    messages.append({"role": "user", "content": turn})
+    return messages
+
+
+def cache_options(layer):
+    """Extra create() arguments for one prompt layer; extra_body keeps older openai SDKs working"""
+    if not PROMPT_CACHE_KEYS:
+        return {}
+    return {'extra_body': {'prompt_cache_key': f"palms-{layer}"}}
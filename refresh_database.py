@@ -1,64 +1,43 @@
 #!/usr/bin/env python3
 """
 Script to force refresh the ChromaDB knowledge base with info.txt content
-Run this after making changes to info.txt to immediately update the database
+Run this after making changes to info.txt to immediately update the database.
+Only changed chunks are re-embedded; pass --full to rebuild the collection from scratch
+(e.g. after switching embedding models).
+Also writes the memory-mapped NumPy snapshot used when RETRIEVAL_BACKEND=numpy
 """
 
 import chromadb
 import os
 from dotenv import load_dotenv
+import sys
+from ingestion import EmbeddingIngestor, build_chunk_records, sync_collection
+from embedding_cache import EmbeddingCache
+from vector_index import VectorIndex, VECTOR_INDEX_PATH
 
 load_dotenv()
 
-def refresh_database():
+def refresh_database(full=False):
     print("🔄 Starting database refresh...")
     
     # Initialize ChromaDB
     chroma_client = chromadb.PersistentClient(path="./chroma_db")
     
     try:
-        # Delete existing collection
-        print("🗑️  Deleting existing collection...")
-        try:
-            chroma_client.delete_collection("palms_knowledge")
-            print("✅ Existing collection deleted")
-        except Exception as e:
-            print(f"ℹ️  No existing collection to delete: {e}")
-        
-        # Create new collection
-        print("📦 Creating new collection...")
-        collection = chroma_client.create_collection("palms_knowledge")
-        print("✅ New collection created")
-        
         # Load info.txt
         print("📄 Loading info.txt...")
         with open('info.txt', 'r', encoding='utf-8') as file:
             content = file.read()
         print(f"✅ Loaded {len(content)} characters from info.txt")
         
-        # Split into chunks
+        # Split into chunks with stable, content-derived ids
         print("✂️  Splitting content into chunks...")
-        sections = content.split('\n##')
-        chunks = []
-        
-        for section in sections:
-            if not section.strip():
-                continue
-            
-            # Keep sections intact for better context
-            words = section.split()
-            chunk_size = 2000
-            overlap = 200
-            
-            if len(words) > chunk_size:
-                for i in range(0, len(words), chunk_size - overlap):
-                    chunk = ' '.join(words[i:i + chunk_size])
-                    if chunk.strip():
-                        chunks.append('##' + chunk if i == 0 else chunk)
-            else:
-                chunks.append('##' + section if not section.startswith('##') else section)
-        
-        print(f"✅ Created {len(chunks)} chunks")
+        records = build_chunk_records(content)
+        print(f"✅ Created {len(records)} chunks")
+        
+        if not records:
+            print("❌ No valid chunks to store")
+            return False
         
         # Import OpenAI for embeddings
         print("🔌 Connecting to OpenAI...")
@@ -73,42 +52,32 @@ def refresh_database():
         client = OpenAI(api_key=api_key)
         print("✅ Connected to OpenAI")
         
-        # Generate embeddings and store
-        print("🧮 Generating embeddings and storing in database...")
-        embeddings = []
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, chunk in enumerate(chunks):
-            if len(chunk.strip()) > 50:
-                # Generate embedding
-                response = client.embeddings.create(
-                    input=chunk,
-                    model="text-embedding-3-small"
-                )
-                embedding = response.data[0].embedding
-                
-                embeddings.append(embedding)
-                documents.append(chunk)
-                metadatas.append({"chunk_id": i, "type": "product_info"})
-                ids.append(f"chunk_{i}")
-                
-                if (i + 1) % 10 == 0:
-                    print(f"   Processed {i + 1}/{len(chunks)} chunks...")
-        
-        # Add to collection
-        if embeddings:
-            collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print(f"✅ Successfully stored {len(embeddings)} chunks in database")
-        else:
-            print("❌ No valid chunks to store")
-            return False
+        if full:
+            # Full rebuild: drop the collection so every chunk is written again
+            print("🗑️  Deleting existing collection...")
+            try:
+                chroma_client.delete_collection("palms_knowledge")
+                print("✅ Existing collection deleted")
+            except Exception as e:
+                print(f"ℹ️  No existing collection to delete: {e}")
+        
+        collection = chroma_client.get_or_create_collection("palms_knowledge")
+        
+        # Diff against the stored chunks; only new or edited ones are embedded (batched,
+        # resumable, and reusing the on-disk embedding cache)
+        print("🧮 Syncing changed chunks...")
+        ingestor = EmbeddingIngestor(client, cache=EmbeddingCache())
+        added, deleted, unchanged = sync_collection(collection, records, ingestor.embed)
+        ingestor.clear_progress()
+        print(f"✅ {added} chunks added, {deleted} removed, {unchanged} unchanged")
+        
+        # Same chunks into the NumPy snapshot; embeddings all come from the cache by now
+        print("💾 Writing vector index snapshot...")
+        vector_index = VectorIndex(VECTOR_INDEX_PATH)
+        if full:
+            vector_index.reset()
+        added, deleted, unchanged = sync_collection(vector_index, records, ingestor.embed)
+        print(f"✅ Snapshot {vector_index.version}: {added} chunks added, {deleted} removed, {unchanged} unchanged")
         
         print("\n🎉 Database refresh complete!")
         print(f"📊 Total chunks in database: {collection.count()}")
@@ -116,10 +85,7 @@ def refresh_database():
         # Test query to verify
         print("\n🔍 Testing database with sample query...")
         test_query = "tell me about all PALMS products"
-        test_embedding = client.embeddings.create(
-            input=test_query,
-            model="text-embedding-3-small"
-        ).data[0].embedding
+        test_embedding = ingestor.embed([test_query])[0]
         
         results = collection.query(
             query_embeddings=[test_embedding],
@@ -129,6 +95,9 @@ def refresh_database():
         print(f"✅ Test query returned {len(results['documents'][0])} results")
         print(f"   Preview: {results['documents'][0][0][:200]}...")
         
+        snapshot_results = vector_index.query(query_embeddings=[test_embedding], n_results=5)
+        print(f"✅ Snapshot query returned {len(snapshot_results['documents'][0])} results")
+        
         return True
         
     except Exception as e:
@@ -141,7 +110,7 @@ if __name__ == "__main__":
     print("=" * 60)
     print("PALMS™ Database Refresh Utility")
     print("=" * 60)
-    success = refresh_database()
+    success = refresh_database(full='--full' in sys.argv[1:])
     print("=" * 60)
     if success:
         print("✅ SUCCESS: Database has been refreshed!")
@@ -0,0 +1,105 @@
+"""
+Semantic cache for information-layer extractions.
+A question whose embedding is close enough to an earlier one (from any session) reuses the extracted facts,
+as long as the knowledge base version and the variant (e.g. the extraction's token budget) are the same
+"""
+
+import os
+import time
+import threading
+import numpy as np
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2000'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+
+
+class SemanticCache:
+    """Cosine-similarity lookup over cached (query embedding, knowledge base version, variant) -> value"""
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._vectors = []
+        self._values = []
+        self._variants = []
+        self._created = []
+        self._matrix = None  # stacked self._vectors, rebuilt lazily after writes
+
+    def get(self, embedding, kb_version, variant=None):
+        """Cached value for the most similar earlier query with the same variant, or None"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if (query is None or kb_version != self._version or not self._vectors
+                    or self._vectors[0].shape != query.shape):
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+
+            scores = np.where(np.asarray([v == variant for v in self._variants]), self._matrix @ query, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold and time.monotonic() - self._created[best] <= self.ttl:
+                self.hits += 1
+                return self._values[best]
+            self.misses += 1
+            return None
+
+    def put(self, embedding, kb_version, value, variant=None):
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if self._version is None:
+                self._version = kb_version
+            elif kb_version != self._version:
+                # Extracted from another knowledge base version than the one invalidate() last set (e.g. a reload
+                # finished while the call ran); it must not be served as current
+                return
+            if self._vectors and self._vectors[0].shape != vector.shape:
+                return
+            self._vectors.append(vector)
+            self._values.append(value)
+            self._variants.append(variant)
+            self._created.append(time.monotonic())
+            if len(self._vectors) > self.max_entries:
+                # Oldest entries go first
+                del self._vectors[0], self._values[0], self._variants[0], self._created[0]
+            self._matrix = None
+
+    def invalidate(self, kb_version=None):
+        """Drop every entry, e.g. after info.txt has been reindexed"""
+        with self._lock:
+            self._reset(kb_version)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._vectors),
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _reset(self, kb_version):
+        self._version = kb_version
+        self._vectors = []
+        self._values = []
+        self._variants = []
+        self._created = []
+        self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
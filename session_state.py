@@ -0,0 +1,293 @@
+"""
+Compact per-visitor session state.
+
+Sessions used to be free-form dicts: the whole history as role/content dicts, interests and
+qualification signals as growing string lists (signals re-appended on every matching turn) and
+ad-hoc boolean keys. Session keeps the same dict-style access (session['lead_score'] += 10,
+session.get('interests', []), session['conversation_history'].append(...)), so chat.py, the routers
+and lead capture read it unchanged, but stores it compactly:
+
+- interests and qualification signals are FlagSets: bits over a fixed vocabulary, so a repeated
+  signal costs nothing; names outside the vocabulary are kept as interned strings
+- boolean keys (demo_declined, needs_intent_clarification) share one int
+- conversation_history is a HistoryBuffer: roles as one byte each, content in a ring buffer of the
+  last SESSION_HISTORY_MAX_MESSAGES messages. len() and indices count every message ever appended,
+  so ConversationWindow's bookkeeping (and its rolling summary of older turns) still lines up
+- to_compact() is a positional JSON list for the session stores; load_session() also reads the
+  old dict format, so sessions saved before an upgrade keep working
+
+Vocabularies are append-only: stored bitsets refer to positions in them.
+"""
+
+import os
+import sys
+from collections import deque
+
+# Messages kept verbatim per session; older ones live on only in the history_window summary
+SESSION_HISTORY_MAX_MESSAGES = int(os.getenv('SESSION_HISTORY_MAX_MESSAGES', '40'))
+
+COMPACT_VERSION = 1
+
+ROLES = ('user', 'assistant', 'system')
+INTERESTS = ('pricing', 'demo', 'features', 'timeline', 'comparison')
+# The qualification levels enhanced_lead_qualification records (see keyword_matcher.QUALIFICATION_SIGNALS)
+SIGNALS = ('intent_signals_high', 'authority_signals_high', 'timeline_signals_urgent', 'budget_signals_confirmed')
+STAGES = ('greeting', 'cold_lead', 'interested', 'warm_lead', 'hot_lead', 'demo_scheduled')
+BOOLEAN_KEYS = ('demo_declined', 'needs_intent_clarification')
+
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+BOOLEAN_BITS = {key: 1 << position for position, key in enumerate(BOOLEAN_KEYS)}
+STAGE_CODES = {stage: code for code, stage in enumerate(STAGES)}
+
+
+class FlagSet:
+    """Names from a fixed vocabulary as an int bitmask; behaves like the list it replaces (in, append, iterate)"""
+
+    __slots__ = ('vocabulary', 'bits', 'extra')
+
+    def __init__(self, vocabulary, names=(), bits=0):
+        self.vocabulary = vocabulary
+        self.bits = bits
+        self.extra = ()
+        self.extend(names)
+
+    def append(self, name):
+        try:
+            self.bits |= 1 << self.vocabulary.index(name)
+        except ValueError:
+            if name not in self.extra:
+                self.extra += (sys.intern(str(name)),)
+
+    def extend(self, names):
+        for name in names:
+            self.append(name)
+
+    def __contains__(self, name):
+        try:
+            return bool(self.bits & (1 << self.vocabulary.index(name)))
+        except ValueError:
+            return name in self.extra
+
+    def __iter__(self):
+        for position, name in enumerate(self.vocabulary):
+            if self.bits & (1 << position):
+                yield name
+        yield from self.extra
+
+    def __len__(self):
+        return bin(self.bits).count('1') + len(self.extra)
+
+    def __eq__(self, other):
+        return set(self) == set(other)
+
+    def __repr__(self):
+        return f"FlagSet({list(self)!r})"
+
+
+class HistoryBuffer:
+    """Bounded conversation history; indices and len() are absolute (every message ever appended)"""
+
+    __slots__ = ('roles', 'contents', 'dropped')
+
+    def __init__(self, messages=(), capacity=SESSION_HISTORY_MAX_MESSAGES, dropped=0):
+        self.roles = bytearray()
+        self.contents = deque(maxlen=capacity)
+        self.dropped = dropped
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        if len(self.contents) == self.contents.maxlen:
+            del self.roles[0]
+            self.dropped += 1
+        self.roles.append(ROLE_CODES.get(message.get('role'), ROLE_CODES['assistant']))
+        self.contents.append(str(message.get('content', '')))
+
+    @property
+    def first_index(self):
+        """Absolute index of the oldest message still kept; everything before it has been evicted"""
+        return self.dropped
+
+    def message(self, position):
+        return {'role': ROLES[self.roles[position]], 'content': self.contents[position]}
+
+    def __len__(self):
+        return self.dropped + len(self.contents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.message(i - self.dropped) for i in range(*index.indices(len(self))) if i >= self.dropped]
+        if index < 0:
+            index += len(self)
+        if not self.dropped <= index < len(self):
+            raise IndexError('message no longer kept in the history buffer')
+        return self.message(index - self.dropped)
+
+    def __iter__(self):
+        for position in range(len(self.contents)):
+            yield self.message(position)
+
+    def __repr__(self):
+        return f"HistoryBuffer({len(self.contents)} of {len(self)} messages)"
+
+
+class Session:
+    """One visitor's state with dict-style access; see the module docstring"""
+
+    __slots__ = ('lead_score', 'stage', 'flags', 'interests', 'signals', 'qualification_level', 'message_count',
+                 'touch_count', 'industry', 'user_info', 'history', 'history_window', 'last_chat', 'extra')
+
+    # Keys stored as plain attributes; None means "not set" for the optional ones
+    FIELDS = ('lead_score', 'stage', 'qualification_level', 'message_count', 'touch_count', 'industry',
+              'history_window', 'last_chat')
+
+    def __init__(self):
+        self.lead_score = 0
+        self.stage = 'greeting'
+        self.flags = 0
+        self.interests = FlagSet(INTERESTS)
+        self.signals = FlagSet(SIGNALS)
+        self.qualification_level = 0
+        self.message_count = 0
+        self.touch_count = 0
+        self.industry = None
+        self.user_info = None
+        self.history = HistoryBuffer()
+        self.history_window = None
+        self.last_chat = None
+        self.extra = None
+
+    # Dict-style access
+
+    def __getitem__(self, key):
+        if key == 'conversation_history':
+            return self.history
+        if key == 'interests':
+            return self.interests
+        if key == 'qualification_signals':
+            return self.signals
+        if key == 'user_info':
+            if self.user_info is None:
+                self.user_info = {}
+            return self.user_info
+        if key in BOOLEAN_BITS:
+            if self.flags & BOOLEAN_BITS[key]:
+                return True
+            raise KeyError(key)
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'conversation_history':
+            if value is not self.history:
+                self.history = HistoryBuffer(value)
+        elif key == 'interests':
+            if value is not self.interests:
+                self.interests = FlagSet(INTERESTS, value)
+        elif key == 'qualification_signals':
+            if value is not self.signals:
+                self.signals = FlagSet(SIGNALS, value)
+        elif key == 'user_info':
+            self.user_info = dict(value)
+        elif key in BOOLEAN_BITS:
+            if value:
+                self.flags |= BOOLEAN_BITS[key]
+            else:
+                self.flags &= ~BOOLEAN_BITS[key]
+        elif key in self.FIELDS:
+            setattr(self, key, sys.intern(value) if key in ('stage', 'industry') and value else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def to_dict(self):
+        """The old free-form dict shape (debugging, exports)"""
+        data = {
+            'conversation_history': list(self.history),
+            'user_info': dict(self.user_info or {}),
+            'interests': list(self.interests),
+            'qualification_signals': list(self.signals),
+        }
+        for key in self.FIELDS + BOOLEAN_KEYS:
+            value = self.get(key)
+            if value is not None:
+                data[key] = value
+        data.update(self.extra or {})
+        return data
+
+    # Compact serialization
+
+    def to_compact(self):
+        """Positional, JSON-ready list; read back with Session.from_compact"""
+        return [
+            COMPACT_VERSION,
+            self.lead_score,
+            STAGE_CODES.get(self.stage, self.stage),
+            self.flags,
+            self.interests.bits, list(self.interests.extra),
+            self.signals.bits, list(self.signals.extra),
+            self.qualification_level, self.message_count, self.touch_count, self.industry,
+            self.user_info,
+            # Roles as one digit per message, e.g. "0101"
+            self.history.dropped, ''.join(str(code) for code in self.history.roles),
+            list(self.history.contents),
+            self.history_window,
+            self.last_chat,
+            self.extra,
+        ]
+
+    @classmethod
+    def from_compact(cls, data):
+        (_, lead_score, stage, flags, interest_bits, interest_extra, signal_bits, signal_extra,
+         qualification_level, message_count, touch_count, industry, user_info,
+         dropped, roles, contents, history_window, last_chat, extra) = data
+        session = cls()
+        session.lead_score = lead_score
+        session.stage = STAGES[stage] if isinstance(stage, int) else stage
+        session.flags = flags
+        session.interests = FlagSet(INTERESTS, interest_extra, interest_bits)
+        session.signals = FlagSet(SIGNALS, signal_extra, signal_bits)
+        session.qualification_level = qualification_level
+        session.message_count = message_count
+        session.touch_count = touch_count
+        session.industry = sys.intern(industry) if industry else None
+        session.user_info = user_info
+        session.history = HistoryBuffer(dropped=dropped)
+        session.history.roles.extend(int(code) for code in roles[-session.history.contents.maxlen:])
+        session.history.contents.extend(contents)
+        session.history.dropped += len(contents) - len(session.history.contents)
+        session.history_window = history_window
+        session.last_chat = last_chat
+        session.extra = extra
+        return session
+
+    @classmethod
+    def from_dict(cls, data):
+        """A session saved in the old free-form dict format"""
+        session = cls()
+        for key, value in data.items():
+            session[key] = value
+        return session
+
+
+def load_session(data):
+    """Session from its decoded stored form, compact or legacy dict"""
+    if isinstance(data, dict):
+        return Session.from_dict(data)
+    return Session.from_compact(data)
@@ -0,0 +1,240 @@
+"""
+Session storage for the chat servers (app.py and asgi.py).
+A request loads its session (a session_state.Session), mutates it, then saves it back, so every
+backend only ever sees its compact JSON form. Backends, selected with SESSION_STORE:
+
+- memory: in-process LRU with TTL and a byte cap (single worker)
+- sqlite: WAL-mode SQLite file shared by every worker on the machine
+- redis:  any Redis-compatible server, shared across machines (needs the redis package)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from session_state import Session, load_session
+
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory').lower()
+# Idle sessions expire after this many seconds
+SESSION_TTL = float(os.getenv('SESSION_TTL', '86400'))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', str(64 * 1024 * 1024)))
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', './chroma_db/sessions.sqlite3')
+# How often the SQLite backend sweeps out expired rows
+SESSION_GC_INTERVAL = float(os.getenv('SESSION_GC_INTERVAL', '300'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+
+def new_session():
+    """Initial state for a visitor we haven't seen (or whose session expired)"""
+    return Session()
+
+
+def dump_session(session):
+    if isinstance(session, dict):
+        session = Session.from_dict(session)
+    return json.dumps(session.to_compact(), separators=(',', ':'), ensure_ascii=False)
+
+
+def parse_session(data):
+    return load_session(json.loads(data))
+
+
+class SessionStore:
+    """load/save by session id; get() falls back to a fresh session"""
+
+    def load(self, session_id):
+        """Stored session, or None if unknown or expired"""
+        raise NotImplementedError
+
+    def save(self, session_id, session):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def gc(self):
+        """Drop expired sessions; returns how many were removed"""
+        return 0
+
+    def count(self):
+        raise NotImplementedError
+
+    def get(self, session_id):
+        session = self.load(session_id)
+        return session if session is not None else new_session()
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU: evicts expired sessions, then least recently used ones past the entry or byte cap"""
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # session_id -> (expires_at, serialized session)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._remove(session_id)
+                return None
+            self._entries.move_to_end(session_id)
+            return parse_session(entry[1])
+
+    def save(self, session_id, session):
+        data = dump_session(session)
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            self._entries[session_id] = (time.time() + self.ttl, data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+
+    def gc(self):
+        now = time.time()
+        with self._lock:
+            expired = [session_id for session_id, entry in self._entries.items() if entry[0] < now]
+            for session_id in expired:
+                self._remove(session_id)
+            return len(expired)
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, session_id):
+        self.total_bytes -= len(self._entries.pop(session_id)[1])
+
+    def _evict(self):
+        # Entries are in least-recently-used order, and every entry shares the same TTL,
+        # so expired sessions are always at the front
+        now = time.time()
+        while self._entries:
+            session_id, (expires_at, data) = next(iter(self._entries.items()))
+            over_cap = len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+            if expires_at >= now and not over_cap:
+                break
+            if len(self._entries) == 1 and expires_at >= now:
+                # Never evict the session that was just saved
+                break
+            self._remove(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite (WAL) table shared by every worker process on the machine"""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, gc_interval=SESSION_GC_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        self._conn.commit()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND expires_at >= ?",
+                (session_id, time.time())
+            ).fetchone()
+        return parse_session(row[0]) if row else None
+
+    def save(self, session_id, session):
+        data = dump_session(session)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, data, now + self.ttl)
+            )
+            self._conn.commit()
+        if now - self._last_gc >= self.gc_interval:
+            self.gc()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def gc(self):
+        with self._lock:
+            self._last_gc = time.time()
+            removed = self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (self._last_gc,)).rowcount
+            self._conn.commit()
+        if removed:
+            print(f"🧹 Removed {removed} expired sessions")
+        return removed
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+
+
+class RedisSessionStore(SessionStore):
+    """Redis-compatible backend; Redis expires idle keys itself"""
+
+    def __init__(self, url=REDIS_URL, ttl=SESSION_TTL, prefix='palms:session:'):
+        import redis
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def load(self, session_id):
+        data = self._redis.get(self.prefix + session_id)
+        return parse_session(data) if data else None
+
+    def save(self, session_id, session):
+        self._redis.set(self.prefix + session_id, dump_session(session), ex=self.ttl)
+
+    def delete(self, session_id):
+        self._redis.delete(self.prefix + session_id)
+
+    def count(self):
+        return sum(1 for _ in self._redis.scan_iter(match=self.prefix + '*', count=1000))
+
+
+def create_session_store(backend=SESSION_STORE):
+    """Session store for SESSION_STORE, falling back to memory if the backend can't be opened"""
+    try:
+        if backend == 'sqlite':
+            store = SQLiteSessionStore()
+            print(f"✅ Session store: SQLite ({store.path})")
+            return store
+        if backend == 'redis':
+            store = RedisSessionStore()
+            store._redis.ping()
+            print("✅ Session store: Redis")
+            return store
+    except Exception as e:
+        print(f"❌ Session store '{backend}' unavailable, using memory: {e}")
+    return MemorySessionStore()
@@ -0,0 +1,151 @@
+"""
+Single-flight call coalescing and /chat idempotency.
+
+When many visitors click the same quick reply within seconds, or one visitor double-submits,
+identical embedding, retrieval and information-layer calls run concurrently. SingleFlight (threads) and
+AsyncSingleFlight (asyncio) let the first caller for a key do the work while every concurrent
+caller with the same key waits for, and shares, its result or exception. Nothing is cached once
+the call finishes; the caches in embedding_cache.py and semantic_cache.py do that.
+
+Duplicate /chat posts are recognised by an idempotency key: the client's Idempotency-Key header
+if sent, else the session id plus the normalised message. The last answer is kept in the session
+for CHAT_IDEMPOTENCY_TTL seconds and replayed to a duplicate instead of running the turn again
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from embedding_cache import normalize_query
+
+# Seconds a /chat answer is replayed to a duplicate post of the same message
+CHAT_IDEMPOTENCY_TTL = float(os.getenv('CHAT_IDEMPOTENCY_TTL', '10'))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key across threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.coalesced = 0
+
+    def do(self, key, function):
+        leader, result = self.join(key)
+        if not leader:
+            return result
+        try:
+            result = function()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
+
+    def join(self, key):
+        """For a call the caller runs itself (e.g. while streaming it): (True, None) for the first caller,
+        which must then call finish(key, ...); a concurrent caller with the same key waits and gets (False, result)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = _Flight()
+                return True, None
+            flight.waiters += 1
+            self.coalesced += 1
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return False, flight.result
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is None:
+            return
+        flight.result = result
+        flight.error = error
+        if flight.waiters:
+            print(f"Single-flight: {flight.waiters} duplicate call(s) shared one result")
+        flight.done.set()
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent awaits with the same key on one event loop"""
+
+    def __init__(self):
+        self._flights = {}
+        self.coalesced = 0
+
+    async def do(self, key, function):
+        """function is a zero-argument coroutine function.
+        The call runs as its own task, so cancelling any caller (the first one included) leaves it running
+        for the others; each caller only stops waiting
+        """
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(function())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    async def join(self, key):
+        """Async SingleFlight.join"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return False, await asyncio.shield(flight)
+        self._flights[key] = asyncio.get_running_loop().create_future()
+        return True, None
+
+    def finish(self, key, result=None, error=None):
+        """Async SingleFlight.finish"""
+        future = self._flights.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def _finished(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception retrieved, so a call whose callers were all cancelled doesn't log
+        # "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+
+def idempotency_key(session_id, message, header=None):
+    """Client-supplied Idempotency-Key, else session id + normalised message"""
+    if header:
+        return f"key:{header}"
+    digest = hashlib.sha256(f"{session_id}\x00{normalize_query(message)}".encode('utf-8')).hexdigest()
+    return f"msg:{digest[:32]}"
+
+
+def replay_response(session, key, ttl=CHAT_IDEMPOTENCY_TTL):
+    """The stored answer if this request duplicates the session's last one"""
+    last = session.get('last_chat')
+    if last and last.get('key') == key and time.time() - last.get('at', 0) <= ttl:
+        print("Duplicate /chat request, replaying the previous answer")
+        return last['response']
+    return None
+
+
+def remember_response(session, key, response):
+    session['last_chat'] = {'key': key, 'at': time.time(), 'response': response}
@@ -0,0 +1,235 @@
+"""
+In-process NumPy vector index, an alternative to Chroma for our small knowledge base.
+Chunk embeddings live in one L2-normalised float32 matrix saved as an .npy snapshot and opened with
+mmap, so every worker on the machine shares the same page-cache pages instead of holding its own copy.
+Lookup is a single matrix-vector product plus a partial sort.
+
+VectorIndex mimics the parts of a Chroma collection that chat.py and ingestion.sync_collection use
+(count / get / query / upsert / delete), so either backend can sit behind self.collection.
+Snapshot layout (VECTOR_INDEX_PATH):
+    manifest.json           {"version", "matrix", "chunks", "count", "dimensions"}, replaced atomically
+    snapshot.lock           held exclusively while a snapshot is written and old files removed, shared while one is opened
+    index-<version>.npy     float32 matrix, one normalised row per chunk
+    index-<version>.json    ids, documents and metadatas in row order
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from file_lock import file_lock
+
+# 'chroma' (default) or 'numpy'
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'chroma').lower()
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', './chroma_db/vector_index')
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class VectorIndex:
+    """Cosine top-k over a memory-mapped snapshot, with a Chroma-collection-like interface"""
+
+    def __init__(self, path=VECTOR_INDEX_PATH):
+        self.path = path
+        self.version = None
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._masks = {}
+        os.makedirs(path, exist_ok=True)
+        self.load()
+
+    # Snapshot I/O
+
+    def manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def lock_path(self):
+        return os.path.join(self.path, 'snapshot.lock')
+
+    def load(self):
+        """Open the current snapshot (if any); returns True if one was loaded"""
+        try:
+            # Shared: a concurrent save can't remove the files between reading the manifest and opening them
+            with file_lock(self.lock_path(), shared=True):
+                with open(self.manifest_path(), 'r', encoding='utf-8') as file:
+                    manifest = json.load(file)
+                matrix = np.load(os.path.join(self.path, manifest['matrix']), mmap_mode='r')
+                with open(os.path.join(self.path, manifest['chunks']), 'r', encoding='utf-8') as file:
+                    chunks = json.load(file)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"⚠️ Could not load vector index snapshot from {self.path}: {e}")
+            return False
+
+        with self._lock:
+            self._set(matrix, chunks['ids'], chunks['documents'], chunks['metadatas'])
+            self.version = manifest['version']
+        print(f"✅ Vector index snapshot {self.version} loaded ({len(self._ids)} chunks, mmap)")
+        return True
+
+    def save(self):
+        """Write a new snapshot and switch the manifest to it; readers of the old files keep their mmap"""
+        with self._lock:
+            matrix = np.ascontiguousarray(self._matrix, dtype=np.float32)
+            chunks = {'ids': list(self._ids), 'documents': list(self._documents), 'metadatas': list(self._metadatas)}
+
+        version = f"{time.time_ns()}-{os.getpid()}"
+        matrix_name = f"index-{version}.npy"
+        chunks_name = f"index-{version}.json"
+        # One saver at a time: otherwise a concurrent saver's cleanup could delete the files this
+        # manifest is about to point at
+        with file_lock(self.lock_path()):
+            _write_atomic(os.path.join(self.path, matrix_name), lambda tmp: self._save_matrix(tmp, matrix))
+            _write_atomic(os.path.join(self.path, chunks_name), lambda tmp: self._save_json(tmp, chunks))
+            manifest = {
+                'version': version,
+                'matrix': matrix_name,
+                'chunks': chunks_name,
+                'count': len(chunks['ids']),
+                'dimensions': int(matrix.shape[1]) if matrix.size else 0
+            }
+            _write_atomic(self.manifest_path(), lambda tmp: self._save_json(tmp, manifest))
+            self.version = version
+            self._remove_stale_files(keep={matrix_name, chunks_name})
+
+        # Re-open from disk so this process shares pages with the others too
+        self.load()
+
+    @staticmethod
+    def _save_matrix(path, matrix):
+        with open(path, 'wb') as file:
+            np.save(file, matrix)
+
+    @staticmethod
+    def _save_json(path, data):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+
+    def _remove_stale_files(self, keep):
+        # Unlinking is safe on POSIX even if another worker still has the old matrix mapped
+        for name in os.listdir(self.path):
+            if name.startswith('index-') and name not in keep and '.tmp.' not in name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _set(self, matrix, ids, documents, metadatas):
+        self._matrix = matrix
+        self._ids = list(ids)
+        self._documents = list(documents)
+        self._metadatas = list(metadatas)
+        self._masks = {}
+
+    # Chroma-collection-like interface
+
+    def count(self):
+        return len(self._ids)
+
+    def get(self, where=None, include=None):
+        with self._lock:
+            rows = np.flatnonzero(self._mask(where)) if where else range(len(self._ids))
+            return {
+                'ids': [self._ids[row] for row in rows],
+                'documents': [self._documents[row] for row in rows],
+                'metadatas': [self._metadatas[row] for row in rows]
+            }
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        """Chroma-shaped result; distances are squared L2 between unit vectors (2 - 2 * cosine), as in Chroma"""
+        with self._lock:
+            matrix, ids, documents, metadatas = self._matrix, self._ids, self._documents, self._metadatas
+            mask = self._mask(where) if where else None
+
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for embedding in query_embeddings:
+            query = self._normalize(np.asarray(embedding, dtype=np.float32))
+            if not len(ids):
+                rows, distances = [], []
+            else:
+                if query.shape[0] != matrix.shape[1]:
+                    raise ValueError(f"Query has dimension {query.shape[0]}, index has {matrix.shape[1]}")
+                scores = matrix @ query
+                if mask is not None:
+                    scores = np.where(mask, scores, -np.inf)
+                k = min(n_results, int(np.count_nonzero(np.isfinite(scores))))
+                if k <= 0:
+                    rows = np.array([], dtype=int)
+                else:
+                    rows = np.argpartition(-scores, k - 1)[:k]
+                    rows = rows[np.argsort(-scores[rows])]
+                distances = (2.0 - 2.0 * scores[rows]).tolist()
+            result['ids'].append([ids[row] for row in rows])
+            result['documents'].append([documents[row] for row in rows])
+            result['metadatas'].append([metadatas[row] for row in rows])
+            result['distances'].append(distances)
+        return result
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = np.vstack([self._normalize(np.asarray(e, dtype=np.float32)) for e in embeddings])
+        with self._lock:
+            matrix = np.array(self._matrix, dtype=np.float32)
+            if matrix.size and matrix.shape[1] != vectors.shape[1]:
+                # Embedding model changed: start over
+                print(f"⚠️ Vector index dimension {matrix.shape[1]} -> {vectors.shape[1]}, rebuilding")
+                matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                self._set(matrix, [], [], [])
+            positions = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+            new_ids, new_documents, new_metadatas = list(self._ids), list(self._documents), list(self._metadatas)
+            appended = []
+            for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+                if chunk_id in positions:
+                    row = positions[chunk_id]
+                    matrix[row] = vector
+                    new_documents[row] = document
+                    new_metadatas[row] = metadata
+                else:
+                    appended.append(vector)
+                    new_ids.append(chunk_id)
+                    new_documents.append(document)
+                    new_metadatas.append(metadata)
+            if appended:
+                matrix = np.vstack([matrix.reshape(-1, vectors.shape[1]), np.vstack(appended)])
+            self._set(matrix, new_ids, new_documents, new_metadatas)
+        self.save()
+
+    def delete(self, ids):
+        drop = set(ids)
+        with self._lock:
+            keep = [row for row, chunk_id in enumerate(self._ids) if chunk_id not in drop]
+            self._set(
+                np.array(self._matrix[keep], dtype=np.float32) if len(self._ids) else self._matrix,
+                [self._ids[row] for row in keep],
+                [self._documents[row] for row in keep],
+                [self._metadatas[row] for row in keep]
+            )
+        self.save()
+
+    def reset(self):
+        """Drop every chunk (refresh_database.py --full)"""
+        with self._lock:
+            self._set(np.zeros((0, 0), dtype=np.float32), [], [], [])
+        self.save()
+
+    def _mask(self, where):
+        key = tuple(sorted(where.items()))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.array([all(metadata.get(field) == value for field, value in where.items())
+                             for metadata in self._metadatas], dtype=bool)
+            self._masks[key] = mask
+        return mask
+
+    @staticmethod
+    def _normalize(vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector